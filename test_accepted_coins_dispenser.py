@@ -1,5 +1,6 @@
+import itertools
 import unittest
-from vending_machine_simulator import AcceptedCoinsDispenser
+from vending_machine_simulator import AcceptedCoinsDispenser, fewest_coins_change
 
 # Global variables for coins and their values
 coin1 = 'quarter'
@@ -31,6 +32,87 @@ class TestAcceptedCoinsDispenser(unittest.TestCase):
         self.assertTrue(self.coins_dispenser.add_accepted_coins(coin1, coin1_value))
         self.assertAlmostEqual(self.coins_dispenser.get_coin_value(coin1), coin1_value)
 
+    def test_fewest_coins_change_matches_brute_force(self):
+        # non canonical coin system: greedy gives 30 = 25 + 5 (2 coins) but fails on 40 with no 5
+        coins = [('quarter', 25, 2), ('twenty', 20, 3), ('dime', 10, 1), ('nickel', 5, 2)]
+        for change_cents in range(0, 160, 5):
+            best = None
+            for counts in itertools.product(*(range(count + 1) for _, _, count in coins)):
+                if sum(n * cents for n, (_, cents, _) in zip(counts, coins)) == change_cents:
+                    if best is None or sum(counts) < best:
+                        best = sum(counts)
+            payout = fewest_coins_change(change_cents, coins)
+            if best is None:
+                self.assertIsNone(payout, change_cents)
+                continue
+            self.assertEqual(sum(payout.values()), best, change_cents)
+            self.assertEqual(sum(n * dict((c, v) for c, v, _ in coins)[c] for c, n in payout.items()), change_cents)
+            for coin, number_coins in payout.items():
+                self.assertLessEqual(number_coins, dict((c, n) for c, _, n in coins)[coin])
+
+    def test_change_uses_inventory_and_inserted_coins(self):
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin1, coin1_value))
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin2, coin2_value))
+        self.assertEqual(self.coins_dispenser.get_coin_count(coin1), 0)
+        self.assertEqual(self.coins_dispenser.get_coins_cents({coin1: 3, coin2: 2, 'euro': 5}), 95)
+        # nothing held: no change can be made, unless the inserted coins cover it
+        self.assertIsNone(self.coins_dispenser.compute_change(10))
+        self.assertEqual(self.coins_dispenser.compute_change(0), {})
+        self.assertEqual(self.coins_dispenser.compute_change(25, {coin1: 4}), {coin1: 1})
+        self.assertTrue(self.coins_dispenser.load_coins(coin2, 3))
+        self.assertFalse(self.coins_dispenser.load_coins(coin2, -4))
+        self.assertFalse(self.coins_dispenser.load_coins('euro', 1))
+        change_coins = self.coins_dispenser.compute_change(20, {coin1: 2})
+        self.assertEqual(change_coins, {coin2: 2})
+        self.assertTrue(self.coins_dispenser.collect_payment({coin1: 2}, change_coins))
+        self.assertEqual(self.coins_dispenser.get_coin_count(coin1), 2)
+        self.assertEqual(self.coins_dispenser.get_coin_count(coin2), 1)
+        # not enough dimes held: nothing is collected
+        self.assertFalse(self.coins_dispenser.collect_payment({coin1: 1}, {coin2: 2}))
+        self.assertEqual(self.coins_dispenser.get_coin_count(coin1), 2)
+
+    def test_change_plans_are_memoized(self):
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin1, coin1_value))
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin2, coin2_value))
+        self.assertTrue(self.coins_dispenser.load_coins(coin2, 5))
+        self.assertEqual(self.coins_dispenser.compute_change(20), {coin2: 2})
+        self.assertEqual(len(self.coins_dispenser.change_memo), 1)
+        # more dimes than a change of 20 can use: the plan is reused
+        self.assertTrue(self.coins_dispenser.load_coins(coin2, 5))
+        self.assertEqual(self.coins_dispenser.compute_change(20), {coin2: 2})
+        self.assertEqual(len(self.coins_dispenser.change_memo), 1)
+        # down to one dime: the old plan no longer applies
+        self.assertTrue(self.coins_dispenser.load_coins(coin2, -9))
+        self.assertIsNone(self.coins_dispenser.compute_change(20))
+        self.assertEqual(len(self.coins_dispenser.change_memo), 2)
+    def test_shared_catalog_keeps_private_inventories(self):
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin1, coin1_value))
+        first = self.coins_dispenser.share_catalog()
+        second = self.coins_dispenser.share_catalog()
+        self.assertFalse(self.coins_dispenser.add_accepted_coins(coin2, coin2_value))
+        self.assertIs(first.coins_cents, second.coins_cents)
+        self.assertTrue(first.load_coins(coin1, 4))
+        self.assertEqual(second.get_coin_count(coin1), 0)
+        self.assertEqual(first.compute_change(50), {coin1: 2})
+        self.assertIsNone(second.compute_change(50))
+        derived = self.coins_dispenser.derive()
+        self.assertTrue(derived.add_accepted_coins(coin2, coin2_value))
+        self.assertFalse(first.exist_accepted_coins(coin2))
+
+    def test_shared_memo_cleared_by_another_machine(self):
+        class ClearedMemo(dict):
+            # another machine of the catalog clears the memo right after each plan is stored
+            def __setitem__(self, key, value):
+                super().__setitem__(key, value)
+                self.clear()
+
+        self.assertTrue(self.coins_dispenser.add_accepted_coins(coin1, coin1_value))
+        self.coins_dispenser.freeze()
+        machine = self.coins_dispenser.share_catalog()
+        machine.change_memo = ClearedMemo()
+        self.assertTrue(machine.load_coins(coin1, 4))
+        self.assertEqual(machine.compute_change(50), {coin1: 2})
+
 if __name__ == '__main__':
     unittest.main()
 
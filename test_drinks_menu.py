@@ -6,6 +6,11 @@ price1 = 3.0
 bom1 = {"water": 250, "milk": 100, "coffee": 24}
 command1 = '/c'
 drink2 = 'macchiatto'
+price2 = 3.5
+bom2 = {"water": 50, "milk": 20, "coffee": 24}
+command2 = '/cm'
+drink3 = 'espresso'
+command3 = '/e'
 
 
 class TestDrinksMenu(unittest.TestCase):
@@ -68,6 +73,99 @@ class TestDrinksMenu(unittest.TestCase):
         # Test getting the command of a non-existing ordered_drink
         self.assertEqual(self.drinks_menu.get_drink_command(drink2), '#')
 
+    # Test case for the command -> drink index
+    def test_get_drink_by_command(self):
+        self.assertEqual(self.drinks_menu.get_drink_by_command(command1), '#')
+        self.assertTrue(self.drinks_menu.add_drink(drink1, price1, bom1, command1))
+        self.assertEqual(self.drinks_menu.get_drink_by_command(command1), drink1)
+        self.assertTrue(self.drinks_menu.exist_drink_command(command1))
+
+        # Test adding a drink with an already used command
+        self.assertFalse(self.drinks_menu.add_drink(drink3, price1, bom1, command1))
+        self.assertFalse(self.drinks_menu.exist_drink(drink3))
+        self.assertEqual(self.drinks_menu.get_drink_by_command(command1), drink1)
+
+
+    def test_frozen_menu_and_copy_on_write(self):
+        self.assertTrue(self.drinks_menu.add_drink(drink1, price1, bom1, command1))
+        self.drinks_menu.freeze()
+        self.assertTrue(self.drinks_menu.is_frozen())
+        self.assertFalse(self.drinks_menu.add_drink(drink2, price2, bom2, command2))
+        self.assertFalse(self.drinks_menu.add_menu_listener(print))
+        self.assertEqual(self.drinks_menu.menu_listeners, [])
+        derived = self.drinks_menu.derive()
+        self.assertFalse(derived.is_frozen())
+        self.assertTrue(derived.add_menu_listener(print))
+        self.assertTrue(derived.remove_menu_listener(print))
+        self.assertTrue(derived.add_drink(drink2, price2, bom2, command2))
+        self.assertGreater(derived.menu_version, self.drinks_menu.menu_version)
+        self.assertEqual(derived.get_drink_by_command(command1), drink1)
+        self.assertEqual(derived.get_material_drinks('milk'), [drink1, drink2])
+        # the frozen menu is unchanged
+        self.assertEqual(self.drinks_menu.get_all_drinks(), [drink1])
+        self.assertEqual(self.drinks_menu.get_material_drinks('milk'), [drink1])
+
+    def test_set_drink_price_and_command(self):
+        self.assertTrue(self.drinks_menu.add_drink(drink1, price1, bom1, command1))
+        self.assertTrue(self.drinks_menu.add_drink(drink2, price2, bom2, command2))
+        derived = self.drinks_menu.derive()
+        version = derived.menu_version
+        self.assertTrue(derived.set_drink_price(drink1, 3.25))
+        self.assertFalse(derived.set_drink_price(drink3, 3.25))
+        self.assertFalse(derived.set_drink_command(drink1, command2))
+        self.assertTrue(derived.set_drink_command(drink1, command3))
+        self.assertGreater(derived.menu_version, version)
+        self.assertEqual(derived.get_drink_price(drink1), 3.25)
+        self.assertEqual(derived.get_drink_by_command(command3), drink1)
+        self.assertEqual(derived.get_drink_by_command(command1), '#')
+        # the entries shared with the original menu were replaced, not modified
+        self.assertEqual(self.drinks_menu.get_drink_price(drink1), price1)
+        self.assertEqual(self.drinks_menu.get_drink_command(drink1), command1)
+        self.drinks_menu.freeze()
+        self.assertFalse(self.drinks_menu.set_drink_price(drink1, 3.25))
+
+
+class TestDrinksMenuCommandTrie(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.drinks_menu = DrinksMenu(command_trie=True)
+        self.drinks_menu.add_drink(drink1, price1, bom1, command1)
+        self.drinks_menu.add_drink(drink2, price2, bom2, command2)
+        self.drinks_menu.add_drink(drink3, price1, bom1, command3)
+
+    def test_match_command_prefix(self):
+        self.assertEqual(self.drinks_menu.match_command_prefix('/'), [drink1, drink2, drink3])
+        self.assertEqual(self.drinks_menu.match_command_prefix('/c'), [drink1, drink2])
+        self.assertEqual(self.drinks_menu.match_command_prefix('/cm'), [drink2])
+        self.assertEqual(self.drinks_menu.match_command_prefix('/x'), [])
+
+    def test_resolve_command_prefix(self):
+        # '/c' is still ambiguous while typing, '/cm' and '/e' are not
+        self.assertEqual(self.drinks_menu.resolve_command_prefix('/c'), '#')
+        self.assertEqual(self.drinks_menu.resolve_command_prefix('/cm'), drink2)
+        self.assertEqual(self.drinks_menu.resolve_command_prefix('/e'), drink3)
+        # a complete command is still resolved exactly
+        self.assertEqual(self.drinks_menu.get_drink_by_command('/c'), drink1)
+
+    def test_set_drink_command_updates_trie(self):
+        self.assertTrue(self.drinks_menu.set_drink_command(drink2, '/m'))
+        self.assertEqual(self.drinks_menu.match_command_prefix('/c'), [drink1])
+        self.assertEqual(self.drinks_menu.resolve_command_prefix('/m'), drink2)
+
+    def test_trie_matches_linear_scan(self):
+        linear_menu = DrinksMenu()
+        for drink in self.drinks_menu.get_all_drinks():
+            linear_menu.add_drink(
+                drink,
+                self.drinks_menu.get_drink_price(drink),
+                self.drinks_menu.get_drink_bom(drink),
+                self.drinks_menu.get_drink_command(drink)
+            )
+        for prefix in ('', '/', '/c', '/cm', '/e', '/z'):
+            self.assertEqual(
+                self.drinks_menu.match_command_prefix(prefix), linear_menu.match_command_prefix(prefix)
+            )
+
 
 if __name__ == '__main__':
     unittest.main()
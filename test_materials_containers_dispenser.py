@@ -1,5 +1,8 @@
 import unittest
-from vending_machine_simulator import MaterialsContainersDispenser
+from vending_machine_simulator import (
+    THRESHOLD_EMPTY, THRESHOLD_LOW_WATER, ArrayMaterialsContainersDispenser, DrinksBusinessMaintenance,
+    MaterialsContainersDispenser, TimingWheel, set_clock
+)
 
 mat1 = 'coffee'
 mat2 = 'macchiatto'
@@ -9,6 +12,10 @@ initial_volume = 0
 
 mat2_capacity = -1
 
+mat3 = 'water'
+mat3_capacity = 500
+mat3_drink_volume = 250
+
 
 class TestMaterialsContainersDispenser(unittest.TestCase):
 
@@ -40,5 +47,199 @@ class TestMaterialsContainersDispenser(unittest.TestCase):
         self.assertTrue(self.dispenser.takeout_material_container(mat1, mat1_drink_volume))
         self.assertFalse(self.dispenser.takeout_material_container(mat1, mat1_drink_volume))
 
+    def test_takeout_materials_all_or_nothing(self):
+        self.assertTrue(self.dispenser.allocate_material_container(mat1, mat1_capacity))
+        self.assertTrue(self.dispenser.allocate_material_container(mat3, mat3_capacity))
+        self.assertTrue(self.dispenser.refill_material_container(mat1))
+        self.assertTrue(self.dispenser.refill_material_container(mat3))
+        self.assertTrue(
+            self.dispenser.takeout_materials({mat1: mat1_drink_volume, mat3: mat3_drink_volume})
+        )
+        # not enough coffee left: the water must not be deducted either
+        self.assertFalse(
+            self.dispenser.takeout_materials({mat3: mat3_drink_volume, mat1: mat1_drink_volume})
+        )
+        self.assertEqual(self.dispenser.get_volume_material_container(mat3), mat3_capacity - mat3_drink_volume)
+        # a material without container fails the whole takeout
+        self.assertFalse(self.dispenser.takeout_materials({mat3: mat3_drink_volume, mat2: 1}))
+        self.assertEqual(self.dispenser.get_volume_material_container(mat3), mat3_capacity - mat3_drink_volume)
+
+
+class TestArrayMaterialsContainersDispenser(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dispenser = ArrayMaterialsContainersDispenser()
+        self.reference = MaterialsContainersDispenser()
+        self.events = []
+        self.dispenser.add_containers_listener(lambda *event: self.events.append(event))
+
+    def apply(self, method, *arguments):
+        result = getattr(self.dispenser, method)(*arguments)
+        self.assertEqual(result, getattr(self.reference, method)(*arguments), (method, arguments))
+        return result
+
+    def test_same_results_as_dictionary_backend(self):
+        self.assertTrue(self.apply('allocate_material_container', mat1, mat1_capacity))
+        self.assertFalse(self.apply('allocate_material_container', mat1, mat1_capacity))
+        self.assertTrue(self.apply('allocate_material_container', mat3, mat3_capacity))
+        for material in (mat1, mat2, mat3):
+            self.apply('exist_material_container', material)
+            self.apply('get_capacity_material_container', material)
+            self.apply('get_volume_material_container', material)
+        self.assertTrue(self.apply('refill_material_container', mat1))
+        self.assertFalse(self.apply('refill_material_container', mat2))
+        self.assertTrue(self.apply('takeout_material_container', mat1, mat1_drink_volume))
+        self.assertFalse(self.apply('takeout_material_container', mat1, mat1_drink_volume))
+        self.assertTrue(self.apply('refill_material_container', mat3))
+        self.assertFalse(self.apply('takeout_materials', {mat3: mat3_drink_volume, mat1: mat1_drink_volume}))
+        self.assertTrue(self.apply('takeout_materials', {mat3: mat3_drink_volume, mat1: 5}))
+        self.assertEqual(self.dispenser.materials_containers, self.reference.materials_containers)
+        self.assertEqual(self.events[0], ('allocate', mat1, mat1_capacity))
+        self.assertEqual(self.events[-1], ('takeout', mat1, 5))
+
+    def test_bulk_load_and_locks(self):
+        dispenser = ArrayMaterialsContainersDispenser(thread_safe=True)
+        dispenser.materials_containers = {mat1: {'capacity': mat1_capacity, 'volume': 20}}
+        dispenser.rebuild_indexes()
+        self.assertEqual(dict(dispenser.materials_containers), {mat1: {'capacity': mat1_capacity, 'volume': 20}})
+        self.assertIn(mat1, dispenser.containers_locks)
+        self.assertTrue(dispenser.takeout_materials({mat1: 20}))
+        self.assertEqual(dispenser.get_volume_material_container(mat1), 0)
+
+
+class TestThresholdObservers(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.notifications = []
+
+    def observer(self, material, level, volume):
+        self.notifications.append((material, level, volume))
+
+    def check_backend(self, dispenser):
+        self.assertFalse(dispenser.add_threshold_observer(mat1, self.observer, 20))
+        dispenser.allocate_material_container(mat1, mat1_capacity)
+        dispenser.refill_material_container(mat1)
+        self.assertTrue(dispenser.add_threshold_observer(mat1, self.observer, 20))
+        dispenser.takeout_material_container(mat1, 20)  # 30 left, above the low-water level
+        self.assertEqual(self.notifications, [])
+        dispenser.takeout_materials({mat1: 15})  # 15 left: crosses the low-water level
+        dispenser.takeout_material_container(mat1, 5)  # still low: coalesced
+        self.assertEqual(self.notifications, [(mat1, THRESHOLD_LOW_WATER, 15)])
+        dispenser.takeout_material_container(mat1, 10)
+        self.assertEqual(self.notifications[-1], (mat1, THRESHOLD_EMPTY, 0))
+        # a refill re-arms both levels, a takeout crossing both is only notified as empty
+        dispenser.refill_material_container(mat1)
+        dispenser.takeout_material_container(mat1, mat1_capacity)
+        self.assertEqual(self.notifications[2:], [(mat1, THRESHOLD_EMPTY, 0)])
+        self.assertTrue(dispenser.remove_threshold_observer(mat1, self.observer))
+        self.assertFalse(dispenser.remove_threshold_observer(mat1, self.observer))
+        dispenser.refill_material_container(mat1)
+        dispenser.takeout_material_container(mat1, mat1_capacity)
+        self.assertEqual(len(self.notifications), 3)
+
+    def test_dictionary_backend(self):
+        self.check_backend(MaterialsContainersDispenser(thread_safe=True))
+
+    def test_array_backend(self):
+        self.check_backend(ArrayMaterialsContainersDispenser())
+
+    def test_watch_containers_levels(self):
+        dispenser = MaterialsContainersDispenser()
+        for material, capacity in ((mat1, mat1_capacity), (mat3, mat3_capacity)):
+            dispenser.allocate_material_container(material, capacity)
+            dispenser.refill_material_container(material)
+        maintenance = DrinksBusinessMaintenance(dispenser)
+        self.assertEqual(maintenance.watch_containers_levels(self.observer, low_water_ratio=0.5), 2)
+        dispenser.takeout_materials({mat1: mat1_drink_volume, mat3: mat3_drink_volume})
+        self.assertEqual(
+            self.notifications,
+            [
+                (mat1, THRESHOLD_LOW_WATER, mat1_capacity - mat1_drink_volume),
+                (mat3, THRESHOLD_LOW_WATER, mat3_capacity - mat3_drink_volume),
+            ]
+        )
+        maintenance.report_containers_levels()
+
+
+class TestTimingWheel(unittest.TestCase):
+
+    def test_keys_expire_at_their_deadline_on_every_level(self):
+        wheel = TimingWheel(tick=1, slot_bits=2, levels=3)  # 4 slots per level, 64 ticks in range
+        deadlines = {key: deadline for key, deadline in enumerate([1, 3, 4, 5, 17, 63, 64, 200, 2.5])}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+        self.assertEqual(len(wheel), len(deadlines))
+        expired_at = {}
+        for now in range(0, 260, 3):
+            for key in wheel.advance(now):
+                expired_at[key] = now
+        # each key expires on the first advance at or after its deadline (rounded up to the tick)
+        for key, deadline in deadlines.items():
+            self.assertLessEqual(deadline, expired_at[key])
+            self.assertLess(expired_at[key] - 3, -(-deadline // 1))
+        self.assertEqual(len(wheel), 0)
+        # a deadline already reached is returned by the next advance
+        wheel.schedule('late', 100)
+        self.assertEqual(wheel.advance(258), ['late'])
+
+
+class TestIngredientsHolds(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.now = 1000.0
+        previous_clock = set_clock(lambda: self.now)
+        self.addCleanup(set_clock, previous_clock)
+
+    def check_backend(self, dispenser):
+        events = []
+        dispenser.add_containers_listener(lambda *event: events.append(event))
+        dispenser.allocate_material_container(mat1, mat1_capacity)
+        dispenser.allocate_material_container(mat3, mat3_capacity)
+        dispenser.refill_material_container(mat1)
+        dispenser.refill_material_container(mat3)
+        hold = dispenser.reserve_materials({mat1: mat1_drink_volume, mat3: mat3_drink_volume}, duration=10)
+        self.assertGreater(hold, 0)
+        self.assertEqual(events[-1], ('hold', mat3, mat3_drink_volume))
+        self.assertEqual(dispenser.get_volume_material_container(mat1), mat1_capacity)
+        self.assertEqual(dispenser.get_available_volume_material_container(mat1), mat1_capacity - mat1_drink_volume)
+        self.assertEqual(dispenser.get_available_volume_material_container(mat2), -1)
+        # the held volume can be neither taken out nor held again, all or nothing
+        self.assertFalse(dispenser.takeout_material_container(mat1, mat1_drink_volume))
+        self.assertFalse(dispenser.takeout_materials({mat3: 1, mat1: mat1_drink_volume}))
+        self.assertEqual(dispenser.reserve_materials({mat3: 1, mat1: mat1_drink_volume}), -1)
+        self.assertEqual(dispenser.reserve_materials({mat2: 1}), -1)
+        self.assertEqual(dispenser.get_available_volume_material_container(mat3), mat3_capacity - mat3_drink_volume)
+        self.assertTrue(dispenser.takeout_material_container(mat1, mat1_capacity - mat1_drink_volume))
+        # the commit takes out the held volume, a hold ends once
+        self.assertTrue(dispenser.commit_hold(hold))
+        self.assertFalse(dispenser.commit_hold(hold))
+        self.assertFalse(dispenser.release_hold(hold))
+        self.assertEqual(dispenser.get_volume_material_container(mat1), 0)
+        self.assertEqual(dispenser.get_volume_material_container(mat3), mat3_capacity - mat3_drink_volume)
+        self.assertEqual(dispenser.held_volumes, {})
+        # released or expired holds give the volume back
+        hold = dispenser.reserve_materials({mat3: mat3_drink_volume}, duration=10)
+        self.assertTrue(dispenser.release_hold(hold))
+        self.assertEqual(events[-1], ('release', mat3, mat3_drink_volume))
+        hold = dispenser.reserve_materials({mat3: mat3_drink_volume}, duration=10)
+        self.now += 5
+        self.assertEqual(dispenser.expire_holds(), 0)
+        self.now += 5
+        self.assertFalse(dispenser.commit_hold(hold))  # expired, not swept yet
+        self.assertEqual(dispenser.get_available_volume_material_container(mat3), mat3_capacity - mat3_drink_volume)
+        for _ in range(3):
+            dispenser.reserve_materials({mat3: 1}, duration=60)
+        self.now += 120
+        self.assertEqual(dispenser.expire_holds(), 3)
+        self.assertEqual(dispenser.holds, {})
+        self.assertEqual(dispenser.held_volumes, {})
+
+    def test_dictionary_backend(self):
+        self.check_backend(MaterialsContainersDispenser(thread_safe=True))
+
+    def test_array_backend(self):
+        self.check_backend(ArrayMaterialsContainersDispenser())
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import vending_machine_catalog
+from vending_machine_catalog import CatalogValidationError, catalog_digest, load_catalog
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestCatalogLoader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.catalog = {
+            'containers': {
+                data.mat1: data.mat1_capacity,
+                data.mat2: {'capacity': data.mat2_capacity, 'volume': 150},
+                data.mat3: {'capacity': data.mat3_capacity, 'volume': data.mat3_capacity},
+            },
+            'drinks': {
+                data.drink1: {'price': data.drink1_price, 'command': data.drink1_command_valid, 'bom': data.drink1_bom},
+                'hot water': {'price': 0.5, 'command': '/h', 'bom': {data.mat3: 100}},
+            },
+            'coins': {'dollar': 1.0, 'quarter': {'value': 0.25, 'count': 8}},
+        }
+
+    def write_json(self, catalog, name='catalog.json'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            json.dump(catalog, stream)
+        return path
+
+    def write_csv(self, files):
+        directory = os.path.join(self.directory.name, 'csv')
+        os.makedirs(directory, exist_ok=True)
+        for name, lines in files.items():
+            with open(os.path.join(directory, name), 'w', encoding='utf-8') as stream:
+                stream.write('\n'.join(lines) + '\n')
+        return directory
+
+    def assert_catalog_machine(self, vmo):
+        self.assertEqual(vmo.materials_dispenser.get_capacity_material_container(data.mat1), data.mat1_capacity)
+        self.assertEqual(vmo.materials_dispenser.get_volume_material_container(data.mat1), 0)
+        self.assertEqual(vmo.materials_dispenser.get_volume_material_container(data.mat2), 150)
+        self.assertEqual(vmo.drinks_menu.get_drink_by_command('/h'), 'hot water')
+        self.assertEqual(vmo.drinks_menu.get_drink_bom(data.drink1), data.drink1_bom)
+        self.assertEqual(vmo.drinks_menu.get_material_drinks(data.mat3), [data.drink1, 'hot water'])
+        self.assertEqual(vmo.accepted_coins.get_coin_cents('quarter'), 25)
+        self.assertEqual(vmo.accepted_coins.get_coin_count('quarter'), 8)
+        self.assertEqual(vmo.get_drink_servings('hot water'), 5)
+        self.assertFalse(vmo.check_drink_availability(data.drink1))
+
+    def test_json_catalog(self):
+        self.assert_catalog_machine(load_catalog(self.write_json(self.catalog)))
+
+    def test_csv_catalog(self):
+        directory = self.write_csv({
+            'containers.csv': [
+                'material,capacity,volume', f'{data.mat1},{data.mat1_capacity},',
+                f'{data.mat2},{data.mat2_capacity},150', f'{data.mat3},{data.mat3_capacity},{data.mat3_capacity}'
+            ],
+            'drinks.csv': ['drink,price,command,material,volume'] + [
+                f'{data.drink1},{data.drink1_price},{data.drink1_command_valid},{material},{volume}'
+                for material, volume in data.drink1_bom.items()
+            ] + [f'hot water,0.5,/h,{data.mat3},100'],
+            'coins.csv': ['coin,value,count', 'dollar,1.0,', 'quarter,0.25,8'],
+        })
+        self.assert_catalog_machine(load_catalog(directory, compact_containers=True))
+
+    def test_validation_reports_every_error(self):
+        self.catalog['drinks']['latte'] = {'price': -1, 'command': '/h', 'bom': {'cocoa': 10, data.mat2: 'a lot'}}
+        self.catalog['coins']['penny'] = 0
+        self.catalog['coins']['mill'] = 0.001
+        with self.assertRaises(CatalogValidationError) as raised:
+            load_catalog(self.write_json(self.catalog), self.directory.name)
+        errors = raised.exception.errors
+        self.assertEqual(len(errors), 6, errors)
+        self.assertIn("coin 'mill': value 0.001 is worth less than a cent", errors)
+        self.assertTrue(any("'cocoa' has no container" in error for error in errors))
+        self.assertTrue(any("command '/h' already orders 'hot water'" in error for error in errors))
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith('.vms')])
+
+    def test_duplicates(self):
+        path = os.path.join(self.directory.name, 'duplicates.json')
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write('{"containers": {"water": 500, "water": 600}, "drinks": {}, "coins": {}}')
+        with self.assertRaises(CatalogValidationError):
+            load_catalog(path)
+
+    def test_compiled_cache(self):
+        path = self.write_json(self.catalog)
+        cache = os.path.join(self.directory.name, 'cache')
+        load_catalog(path, cache)
+        self.assertEqual(os.listdir(cache), [f'catalog-{catalog_digest(path)}.vms'])
+        with mock.patch.object(vending_machine_catalog, 'parse_catalog') as parse_catalog:
+            vmo = load_catalog(path, cache, thread_safe=True)
+        parse_catalog.assert_not_called()
+        self.assert_catalog_machine(vmo)
+        self.assertTrue(vmo.materials_dispenser.is_thread_safe())
+        # a changed catalog or other menu options have another key
+        self.assertNotEqual(catalog_digest(path, command_trie=True), catalog_digest(path))
+        self.catalog['coins']['dime'] = 0.1
+        self.write_json(self.catalog)
+        self.assertEqual(load_catalog(path, cache).accepted_coins.get_coin_cents('dime'), 10)
+        self.assertEqual(len(os.listdir(cache)), 2)
+
+    def test_damaged_cache_is_compiled_again(self):
+        path = self.write_json(self.catalog)
+        cache = os.path.join(self.directory.name, 'cache')
+        load_catalog(path, cache)
+        cache_path = os.path.join(cache, f'catalog-{catalog_digest(path)}.vms')
+        with open(cache_path, 'rb') as stream:
+            snapshot = stream.read()
+        # the sections lengths start after the 16 bytes header, the string table after them
+        strings_start = 16 + 8 * int.from_bytes(snapshot[12:16], 'little')
+        strings_length = int.from_bytes(snapshot[16:24], 'little')
+        damaged_snapshots = [snapshot[:length] for length in (0, 10, 20, strings_start, len(snapshot) - 1)]
+        damaged_snapshots.append(
+            snapshot[:strings_start] + b'x' * strings_length + snapshot[strings_start + strings_length:]
+        )
+        for damaged in damaged_snapshots:
+            with open(cache_path, 'wb') as stream:
+                stream.write(damaged)
+            self.assert_catalog_machine(load_catalog(path, cache))
+            with open(cache_path, 'rb') as stream:
+                self.assertEqual(stream.read(), snapshot)
@@ -0,0 +1,65 @@
+import time
+import unittest
+from vending_machine_simulator import VendingMachineOperations, clock_now
+from vending_machine_event_simulation import EventCalendar, EventSimulation, constant_arrivals
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestEventSimulation(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        # the containers hold 2 servings of drink1
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid)
+        )
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+
+    def test_calendar_runs_events_in_time_order(self):
+        calendar = EventCalendar(100.0)
+        runs = []
+        calendar.schedule(130.0, runs.append, 'late')
+        calendar.schedule(110.0, runs.append, 'first')
+        calendar.schedule(110.0, runs.append, 'second')
+        calendar.schedule(50.0, runs.append, 'now')
+        self.assertEqual(calendar.run(120.0), 3)
+        self.assertEqual(runs, ['now', 'first', 'second'])
+        self.assertEqual(calendar.now, 120.0)
+        self.assertEqual(calendar.run(200.0), 1)
+        self.assertEqual(runs[-1], 'late')
+
+    def test_arrivals_refills_and_stockouts(self):
+        simulation = EventSimulation(start=0.0)
+        machine = simulation.add_machine(self.vmo, constant_arrivals(600))
+        simulation.schedule_maintenance(machine, 3600)
+        simulation.run(3 * 3600)
+        # 2 servings per refill: 600, 1200 | 3600, 4200 | 7200, 7800 | 10800 served
+        statistics = simulation.statistics[machine]
+        self.assertEqual(statistics['arrivals'], 18)
+        self.assertEqual(statistics['served'], 7)
+        self.assertEqual(statistics['lost_sales'], 11)
+        self.assertAlmostEqual(statistics['lost_revenue'], 11 * data.drink1_price)
+        self.assertEqual(statistics['stockouts'], 3)
+        self.assertEqual(statistics['maintenance_visits'], 3)
+        self.assertEqual(
+            simulation.get_revenue_timeline(machine),
+            {0.0: 6.0, 3600.0: 6.0, 7200.0: 6.0, 10800.0: 3.0}
+        )
+        self.assertEqual(simulation.get_totals()['served'], 7)
+        # the wall clock is back once the simulation stopped
+        self.assertAlmostEqual(clock_now(), time.time(), delta=60)
+
+    def test_revenue_resets(self):
+        simulation = EventSimulation(start=0.0)
+        machine = simulation.add_machine(self.vmo, constant_arrivals(600))
+        simulation.schedule_revenue_reset(machine, 1000)
+        simulation.run(1500)
+        self.assertEqual(simulation.statistics[machine]['revenue_resets'], 1)
+        self.assertEqual(self.vmo.financials.get_current_revenue(), data.drink1_price)
+        self.assertEqual(self.vmo.financials.get_total_revenue(), 2 * data.drink1_price)
@@ -0,0 +1,53 @@
+import unittest
+from vending_machine_simulator import VendingMachineFinancials
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestVendingMachineFinancials(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.financials = VendingMachineFinancials(clock=lambda: self.now)
+
+    def sell(self, at, drink, amount, paid_cents=-1, change_cents=0):
+        self.now = at
+        self.financials.add_revenue(amount, drink, paid_cents, change_cents)
+
+    def test_current_revenue_follows_the_cycles(self):
+        self.financials.add_revenue(data.drink1_price)
+        self.assertAlmostEqual(self.financials.get_current_revenue(), data.drink1_price)
+        self.financials.reset_revenue()
+        self.assertEqual(self.financials.get_current_revenue(), 0)
+        # 0.1 + 0.2 is booked in cents: no float drift
+        self.financials.add_revenue(0.1)
+        self.financials.add_revenue(0.2)
+        self.assertEqual(self.financials.get_current_revenue(), 0.3)
+        self.assertEqual(self.financials.get_total_revenue(), data.drink1_price + 0.3)
+        self.assertEqual(self.financials.get_sales_count(), 3)
+
+    def test_ledger_range_queries(self):
+        self.sell(100, data.drink1, 3.0, 400, 100)
+        self.sell(200, 'latte', 2.5)
+        self.sell(3700, data.drink1, 3.0)
+        self.sell(3800, 'tea', 1.0)
+        self.sell(7300, 'latte', 2.5)
+        self.assertEqual(list(self.financials.ledger_paid_cents[:2]), [400, 250])
+        self.assertEqual(list(self.financials.ledger_change_cents[:2]), [100, 0])
+        self.assertEqual(self.financials.get_drink_revenue(data.drink1), 6.0)
+        self.assertEqual(self.financials.get_drink_revenue(data.drink2), 0.0)
+        self.assertEqual(self.financials.get_revenue_between(200, 3800), 5.5)
+        self.assertEqual(self.financials.get_revenue_between(3800), 3.5)
+        self.assertEqual(self.financials.get_revenue_between(8000), 0.0)
+        self.assertEqual(self.financials.get_revenue_by_period(3600), {0: 5.5, 3600: 4.0, 7200: 2.5})
+        self.assertEqual(self.financials.top_drinks(2), [(data.drink1, 6.0), ('latte', 5.0)])
+        self.assertEqual(self.financials.top_drinks(5, 3600, 7200), [(data.drink1, 3.0), ('tea', 1.0)])
+
+    def test_clock_stepping_back_keeps_the_ledger_sorted(self):
+        self.sell(500, data.drink1, 3.0)
+        self.sell(400, data.drink1, 3.0)
+        self.assertEqual(list(self.financials.ledger_times), [500, 500])
+        self.assertEqual(self.financials.get_revenue_between(450, 501), 6.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from vending_machine_simulator import ORDER_SERVED, ORDER_UNAVAILABLE, VendingMachineOperations
+from vending_machine_fleet import FLEET_COUNTERS, FleetSharedState, FleetSimulator, run_fleet_shard
+from vending_machine_snapshot import dumps_snapshot
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestFleetSimulator(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.template = VendingMachineOperations()
+        dispenser = self.template.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        self.assertTrue(
+            self.template.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        self.assertTrue(self.template.accepted_coins.add_accepted_coins('dollar', 1.0))
+
+    def test_shard_writes_shared_state(self):
+        # the containers hold 2 servings of drink1: 2 orders served per machine without restock
+        materials = list(self.template.materials_dispenser.materials_containers)
+        state = FleetSharedState(3, len(materials))
+        self.addCleanup(state.unlink)
+        self.addCleanup(state.close)
+        for machine in range(3):
+            for column, material in enumerate(materials):
+                state.capacities[machine * len(materials) + column] = \
+                    self.template.materials_dispenser.get_capacity_material_container(material)
+                state.volumes[machine * len(materials) + column] = \
+                    self.template.materials_dispenser.get_volume_material_container(material)
+        outcomes = run_fleet_shard(
+            state.names(), dumps_snapshot(self.template), materials, 3, 1, 3, 20, 7, restock=False
+        )
+        self.assertEqual(outcomes, {ORDER_SERVED: 4, ORDER_UNAVAILABLE: 16})
+        self.assertEqual(list(state.counters[:FLEET_COUNTERS]), [0, 0, 0])
+        for machine in (1, 2):
+            self.assertEqual(list(state.counters[machine * FLEET_COUNTERS:][:2]), [600, 2])
+            row = machine * len(materials)
+            self.assertEqual(state.volumes[row + materials.index(data.mat3)], 0)
+            self.assertEqual(state.volumes[row + materials.index(data.mat1)], data.mat1_capacity - 48)
+        self.assertEqual(state.volumes[materials.index(data.mat3)], data.mat3_capacity)
+
+    def test_fleet_totals_over_workers(self):
+        with FleetSimulator(self.template, 5, workers=2) as fleet:
+            self.assertEqual(fleet.shards, [(0, 3), (3, 5)])
+            outcomes = fleet.run(30, seed=1)
+            self.assertEqual(sum(outcomes.values()), 30)
+            served = outcomes[ORDER_SERVED]
+            self.assertEqual(fleet.get_fleet_sales(), served)
+            self.assertAlmostEqual(fleet.get_fleet_revenue(), served * data.drink1_price)
+            self.assertAlmostEqual(
+                sum(fleet.get_machine_revenue(machine) for machine in range(5)), fleet.get_fleet_revenue()
+            )
+            self.assertEqual(served, 30 - outcomes.get(ORDER_UNAVAILABLE, 0))
+            self.assertEqual(fleet.get_fleet_restocks(), outcomes.get(ORDER_UNAVAILABLE, 0))
+            machines_volumes = [fleet.get_machine_volumes(machine) for machine in range(5)]
+            for volumes in machines_volumes:
+                self.assertTrue(0 <= volumes[data.mat3] <= data.mat3_capacity)
+            self.assertEqual(
+                fleet.get_fleet_volumes()[data.mat3], sum(volumes[data.mat3] for volumes in machines_volumes)
+            )
+            self.assertLess(fleet.get_fleet_volumes()[data.mat3], 5 * data.mat3_capacity)
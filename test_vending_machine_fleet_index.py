@@ -0,0 +1,93 @@
+import unittest
+from vending_machine_simulator import DrinksMenu, VendingMachineOperations
+from vending_machine_fleet_index import FleetAvailabilityIndex
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestFleetAvailabilityIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.index = FleetAvailabilityIndex(cell_size=1.0)
+        self.machines = {}
+        # the containers of each machine hold 2 servings of drink1
+        for name, location in (('lobby', (0.2, 0.3)), ('station', (2.5, 0.1)), ('airport', (40.0, 40.0))):
+            vmo = VendingMachineOperations()
+            for material, capacity in (
+                (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+            ):
+                self.assertTrue(vmo.materials_dispenser.allocate_material_container(material, capacity))
+                self.assertTrue(vmo.materials_dispenser.refill_material_container(material))
+            self.assertTrue(
+                vmo.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid)
+            )
+            self.assertTrue(self.index.add_machine(name, vmo, location))
+            self.machines[name] = vmo
+        self.assertFalse(self.index.add_machine('lobby', VendingMachineOperations()))
+
+    def test_index_follows_orders_refills_and_holds(self):
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'lobby', 'station', 'airport'})
+        lobby = self.machines['lobby']
+        self.assertTrue(lobby.make_drink(data.drink1))
+        self.assertEqual(self.index.count_drink_machines(data.drink1), 3)  # one serving left
+        hold = lobby.reserve_drink(data.drink1)
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'station', 'airport'})
+        self.assertTrue(lobby.materials_dispenser.release_hold(hold))
+        self.assertIn('lobby', self.index.get_drink_machines(data.drink1))
+        self.assertTrue(lobby.make_drink(data.drink1))
+        self.assertNotIn('lobby', self.index.get_drink_machines(data.drink1))
+        self.assertTrue(lobby.materials_dispenser.refill_material_container(data.mat1))
+        self.assertNotIn('lobby', self.index.get_drink_machines(data.drink1))  # still no milk nor water
+        for material in (data.mat2, data.mat3):
+            self.assertTrue(lobby.materials_dispenser.refill_material_container(material))
+        self.assertIn('lobby', self.index.get_drink_machines(data.drink1))
+        # a drink added to the menu of a machine is indexed at once
+        self.assertTrue(lobby.drinks_menu.add_drink(data.drink2, data.drink1_price, data.drink2_bom, '/m'))
+        self.assertEqual(self.index.get_drink_machines(data.drink2), {'lobby'})
+        self.assertEqual(self.index.get_drink_machines('tea'), set())
+
+    def test_nearest_machines(self):
+        self.assertEqual(
+            [name for _, name in self.index.nearest_machines(data.drink1, (0.0, 0.0), count=2)], ['lobby', 'station']
+        )
+        distance, name = self.index.nearest_machines(data.drink1, (1.9, 0.1))[0]
+        self.assertEqual(name, 'station')
+        self.assertAlmostEqual(distance, 0.6)
+        for _ in range(2):
+            self.machines['lobby'].make_drink(data.drink1)
+            self.machines['station'].make_drink(data.drink1)
+        # only served far away: found by the occupied cells instead of the rings
+        self.assertEqual(
+            [name for _, name in self.index.nearest_machines(data.drink1, (0.0, 0.0), count=5)], ['airport']
+        )
+        self.assertTrue(self.index.add_machine('unlocated', VendingMachineOperations()))
+        self.assertEqual(self.index.nearest_machines(data.drink2, (0.0, 0.0)), [])
+
+    def test_remove_and_refresh_machine(self):
+        station = self.machines['station']
+        self.assertTrue(self.index.remove_machine('station'))
+        self.assertFalse(self.index.remove_machine('station'))
+        self.assertEqual(station.materials_dispenser.containers_listeners, [station.on_container_change])
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'lobby', 'airport'})
+        self.assertEqual(station.menu_listeners, [])
+        # the switch to a frozen menu is indexed at once, and so are the changes of the next menu
+        lobby = self.machines['lobby']
+        menu = DrinksMenu()
+        menu.add_drink(data.drink2, data.drink1_price, data.drink2_bom, '/m')
+        menu.freeze()
+        lobby.set_drinks_menu(menu)
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'airport'})
+        self.assertEqual(self.index.get_drink_machines(data.drink2), {'lobby'})
+        next_menu = menu.derive()
+        lobby.set_drinks_menu(next_menu)
+        self.assertTrue(next_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, '/c'))
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'lobby', 'airport'})
+        # a bulk restore is not seen by the listeners
+        lobby.materials_dispenser.materials_containers[data.mat1]['volume'] = 0
+        lobby.rebuild_indexes()
+        self.assertTrue(self.index.refresh_machine('lobby'))
+        self.assertFalse(self.index.refresh_machine('station'))
+        self.assertEqual(self.index.get_drink_machines(data.drink1), {'airport'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from vending_machine_simulator import ORDER_SERVED, DrinksMenu
+from vending_machine_journal import DURABILITY_FSYNC, DURABILITY_GROUP, open_journaled_machine, recover_machine
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestOrderJournal(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def open_machine(self, durability):
+        vmo, journal = open_journaled_machine(self.directory.name, durability, group_interval=0.001)
+        self.addCleanup(journal.close)
+        return vmo, journal
+
+    def build(self, vmo):
+        dispenser = vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        self.assertTrue(
+            vmo.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid)
+        )
+        self.assertTrue(vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+
+    def assert_recovered(self, vmo):
+        recovered, _ = recover_machine(self.directory.name)
+        self.assertEqual(
+            recovered.materials_dispenser.materials_containers, vmo.materials_dispenser.materials_containers
+        )
+        self.assertEqual(recovered.drinks_menu.drinks_menu, vmo.drinks_menu.drinks_menu)
+        self.assertEqual(recovered.drinks_servings, vmo.drinks_servings)
+        self.assertEqual(recovered.financials.get_current_revenue(), vmo.financials.get_current_revenue())
+        self.assertEqual(list(recovered.financials.ledger_times), list(vmo.financials.ledger_times))
+        self.assertEqual(recovered.accepted_coins.accepted_coins, vmo.accepted_coins.accepted_coins)
+        self.assertEqual(recovered.accepted_coins.coins_inventory, vmo.accepted_coins.coins_inventory)
+        return recovered
+
+    def test_fsync_journal_replays_every_order(self):
+        vmo, journal = self.open_machine(DURABILITY_FSYNC)
+        self.build(vmo)
+        self.assertEqual(vmo.process_order(data.drink1, {'dollar': 3})[0], ORDER_SERVED)
+        self.assertTrue(vmo.drinks_menu.set_drink_price(data.drink1, 2.5))
+        self.assertTrue(vmo.drinks_menu.set_drink_command(data.drink1, '/cc'))
+        self.assertEqual(journal.durable_records, journal.appended_records)
+        self.assert_recovered(vmo)
+
+    def test_recovered_machine_gives_change(self):
+        vmo, journal = self.open_machine(DURABILITY_FSYNC)
+        self.build(vmo)
+        self.assertTrue(vmo.accepted_coins.add_accepted_coins('quarter', 0.25))
+        self.assertTrue(vmo.accepted_coins.load_coins('quarter', 4))
+        self.assertEqual(vmo.process_order(data.drink1, {'dollar': 4})[0], ORDER_SERVED)
+        journal.close()
+        recovered = self.assert_recovered(vmo)
+        self.assertEqual(recovered.accepted_coins.coins_inventory, {'dollar': 3, 'quarter': 4})
+        # the coins are accepted and the change is given from the recovered inventory
+        status, change = recovered.process_order(data.drink1, {'dollar': 3, 'quarter': 1})
+        self.assertEqual(status, ORDER_SERVED)
+        self.assertEqual(change, {'quarter': 1})
+
+    def test_group_commit_checkpoint_and_torn_record(self):
+        vmo, journal = self.open_machine(DURABILITY_GROUP)
+        self.build(vmo)
+        self.assertEqual(vmo.process_order(data.drink1, {'dollar': 3})[0], ORDER_SERVED)
+        self.assertEqual(journal.checkpoint(), 1)
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)), ['journal-00000001.jsonl', 'snapshot-00000001.vms']
+        )
+        vmo.financials.reset_revenue()
+        self.assertEqual(vmo.process_order(data.drink1, {'dollar': 3})[0], ORDER_SERVED)
+        journal.sync()
+        self.assertLess(journal.fsync_count, journal.appended_records)
+        recovered = self.assert_recovered(vmo)
+        self.assertEqual(recovered.financials.get_total_revenue(), 2 * data.drink1_price)
+        # a crash in the middle of a write leaves a torn last line: it is ignored
+        with open(os.path.join(self.directory.name, 'journal-00000001.jsonl'), 'a') as stream:
+            stream.write('["takeout","coff')
+        self.assert_recovered(vmo)
+        journal.close()
+        vmo, journal = self.open_machine(DURABILITY_GROUP)
+        self.assertFalse(vmo.make_drink(data.drink1))
+        self.assertTrue(vmo.materials_dispenser.refill_material_container(data.mat1))
+        journal.sync()
+        self.assert_recovered(vmo)
+
+    def test_menu_switch_is_journaled(self):
+        vmo, journal = self.open_machine(DURABILITY_FSYNC)
+        self.build(vmo)
+        menu = DrinksMenu(command_trie=True)
+        self.assertTrue(menu.add_drink('tea', 1.0, {data.mat3: 200}, '/t'))
+        menu.freeze()
+        vmo.set_drinks_menu(menu)
+        next_menu = menu.derive()
+        vmo.set_drinks_menu(next_menu)
+        self.assertTrue(next_menu.set_drink_price('tea', 2.0))
+        self.assertEqual(vmo.process_order('tea', {'dollar': 2})[0], ORDER_SERVED)
+        recovered = self.assert_recovered(vmo)
+        self.assertEqual(recovered.drinks_menu.get_all_drinks(), ['tea'])
+        self.assertEqual(recovered.drinks_menu.match_command_prefix('/'), ['tea'])
+
+    def test_thread_safe_records_follow_the_changes_order(self):
+        vmo, journal = open_journaled_machine(
+            self.directory.name, DURABILITY_GROUP, group_interval=0.001, thread_safe=True
+        )
+        self.addCleanup(journal.close)
+        self.build(vmo)
+        dispenser = vmo.materials_dispenser
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+
+        def worker(draw_volume):
+            for _ in range(200):
+                dispenser.refill_material_container(data.mat3)
+                dispenser.takeout_material_container(data.mat3, draw_volume)
+                vmo.financials.add_revenue(draw_volume / 10, data.drink1)
+                vmo.financials.reset_revenue()
+
+        threads = [threading.Thread(target=worker, args=(draw_volume,)) for draw_volume in (10, 20, 30, 40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        journal.sync()
+        self.assert_recovered(vmo)
+
+    def test_corrupt_record_is_not_dropped(self):
+        vmo, journal = self.open_machine(DURABILITY_FSYNC)
+        self.build(vmo)
+        journal.close()
+        path = os.path.join(self.directory.name, 'journal-00000000.jsonl')
+        with open(path, 'rb') as stream:
+            lines = stream.readlines()
+        # a damaged record in the middle of the journal is not mistaken for a torn write
+        with open(path, 'wb') as stream:
+            stream.writelines([lines[0], b'["takeout","coff\n', *lines[1:]])
+        with self.assertRaises(ValueError):
+            recover_machine(self.directory.name)
+        with open(path, 'rb') as stream:
+            self.assertEqual(len(stream.readlines()), len(lines) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
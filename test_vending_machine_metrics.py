@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+from vending_machine_simulator import MaterialsContainersDispenser, VendingMachineOperations
+from vending_machine_metrics import LATENCY_BUCKETS, disable_metrics, enable_metrics, is_metrics_enabled
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.original_takeout = MaterialsContainersDispenser.__dict__['takeout_material_container']
+        self.registry = enable_metrics()
+        self.addCleanup(disable_metrics)
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        # the containers hold 2 servings of drink1
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid)
+        )
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.registry.reset()
+
+    def test_calls_failures_and_histogram(self):
+        for _ in range(3):
+            self.vmo.process_order(data.drink1, {'dollar': 3})
+        self.assertFalse(self.vmo.materials_dispenser.takeout_material_container(data.mat0, 1))
+        metrics = self.registry.to_json()
+        self.assertEqual(metrics['VendingMachineOperations.process_order']['calls'], 3)
+        self.assertEqual(metrics['VendingMachineOperations.process_order']['failures'], 1)  # third is unavailable
+        self.assertEqual(metrics['VendingMachineOperations.make_drink']['calls'], 2)
+        self.assertEqual(metrics['MaterialsContainersDispenser.takeout_material_container']['failures'], 1)
+        buckets = metrics['VendingMachineOperations.process_order']['buckets']
+        self.assertEqual(sum(count for _, count in buckets), 3)
+        self.assertNotIn('VendingMachineFinancials.top_drinks', metrics)
+
+    def test_exports(self):
+        self.vmo.process_order(data.drink1, {'dollar': 3})
+        self.vmo.drinks_menu.add_drink(data.drink2, data.drink1_price, data.drink2_bom, '/m')
+        text = self.registry.to_prometheus()
+        self.assertIn('vms_method_calls_total{method="VendingMachineOperations.process_order"} 1', text)
+        self.assertIn(
+            'vms_method_latency_seconds_bucket{method="VendingMachineOperations.process_order",le="+Inf"} 1', text
+        )
+        self.assertEqual(
+            text.count('vms_method_latency_seconds_bucket{method="DrinksMenu.add_drink"'), LATENCY_BUCKETS + 1
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.write_prometheus(os.path.join(directory, 'vms.prom'))
+            self.registry.write_json(os.path.join(directory, 'vms.json'))
+            self.assertEqual(sorted(os.listdir(directory)), ['vms.json', 'vms.prom'])
+            with open(os.path.join(directory, 'vms.json')) as stream:
+                self.assertEqual(json.load(stream), json.loads(json.dumps(self.registry.to_json())))
+
+    def test_disable_restores_the_original_methods(self):
+        self.assertTrue(is_metrics_enabled())
+        self.assertIs(enable_metrics(), self.registry)
+        self.assertIsNot(MaterialsContainersDispenser.__dict__['takeout_material_container'], self.original_takeout)
+        self.assertIs(disable_metrics(), self.registry)
+        self.assertFalse(is_metrics_enabled())
+        self.assertIs(MaterialsContainersDispenser.__dict__['takeout_material_container'], self.original_takeout)
+        self.vmo.process_order(data.drink1, {'dollar': 3})
+        self.assertEqual(self.registry.to_json(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from vending_machine_simulator import VendingMachineOperations
+import test_vending_machine_simulator_tests_datasets as data
+
+try:
+    import numpy as np
+    from vending_machine_monte_carlo import MonteCarloAnalysis, alias_table
+except ImportError:  # NumPy not installed
+    MonteCarloAnalysis = None
+
+
+@unittest.skipIf(MonteCarloAnalysis is None, 'NumPy is required by the Monte Carlo analysis')
+class TestMonteCarloAnalysis(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        drinks_menu = self.vmo.drinks_menu
+        self.assertTrue(dispenser.allocate_material_container(data.mat1, data.mat1_capacity))
+        self.assertTrue(dispenser.allocate_material_container(data.mat2, data.mat2_capacity))
+        self.assertTrue(dispenser.allocate_material_container(data.mat3, data.mat3_capacity))
+        # the containers hold 2 servings of drink1 and 5 of sweet water
+        self.assertTrue(drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, '/c'))
+        self.assertTrue(drinks_menu.add_drink('sweet water', 1.0, {data.mat3: 100, data.mat0: 0}, '/s'))
+        self.assertTrue(drinks_menu.add_drink('hot water', 0.5, {data.mat3: 100}, '/h'))
+        self.analysis = MonteCarloAnalysis(drinks_menu, dispenser, seed=1)
+
+    def test_alias_table(self):
+        probabilities = np.array([0.5, 0.1, 0.25, 0.15])
+        thresholds, aliases = alias_table(probabilities)
+        rebuilt = thresholds.copy()
+        for index, alias in enumerate(aliases):
+            rebuilt[alias] += 1 - thresholds[index]
+        np.testing.assert_allclose(rebuilt / len(probabilities), probabilities)
+
+    def test_stockout_of_one_drink(self):
+        # about 360 orders of drink1 in the hour: 2 are served, the third one is the stock-out
+        results = self.analysis.run(
+            [{'drinks_weights': {data.drink1: 1}}, {'drinks_weights': {data.drink1: 1}, 'capacities': {
+                data.mat1: 2 * data.mat1_capacity, data.mat2: 2 * data.mat2_capacity, data.mat3: 2 * data.mat3_capacity
+            }}],
+            replications=500, horizon=3600, customers_per_hour=360
+        )
+        self.assertEqual(results[0]['stockout_probability'], 1.0)
+        self.assertEqual(results[0]['expected_servings'], 2)
+        self.assertAlmostEqual(results[0]['expected_revenue'], 2 * data.drink1_price)
+        self.assertAlmostEqual(results[0]['revenue_at_risk'], (360 - 2) * data.drink1_price, delta=15)
+        self.assertLess(results[0]['mean_time_to_stockout'], results[1]['mean_time_to_stockout'])
+        self.assertEqual(results[1]['expected_servings'], 4)
+
+    def test_missing_container_and_popularity(self):
+        # sweet water needs mat0 which has no container
+        result = self.analysis.run(
+            [{'drinks_weights': {'sweet water': 1, 'hot water': 3}, 'capacities': {data.mat3: 10 ** 6}}],
+            replications=2000, horizon=3600, customers_per_hour=40
+        )[0]
+        self.assertAlmostEqual(result['expected_servings'], 30, delta=1)
+        self.assertAlmostEqual(result['expected_revenue'], 15, delta=0.5)
+        self.assertAlmostEqual(result['revenue_at_risk'], 10, delta=0.5)
+        self.assertGreater(result['stockout_probability'], 0.99)
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            self.analysis.run([{'drinks_weights': {'lemonade': 1}}])
+        with self.assertRaises(ValueError):
+            self.analysis.run([{'drinks_weights': {data.drink1: 0}}])
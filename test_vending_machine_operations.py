@@ -1,8 +1,13 @@
+import sys
+import threading
 import unittest
 from unittest.mock import patch
-from vending_machine_simulator import MaterialsContainersDispenser
+from vending_machine_simulator import AcceptedCoinsDispenser, MaterialsContainersDispenser
 from vending_machine_simulator import DrinksMenu
 from vending_machine_simulator import VendingMachineOperations
+from vending_machine_simulator import ORDER_INSUFFICIENT_PAYMENT, ORDER_NO_CHANGE, ORDER_SERVED, ORDER_UNAVAILABLE
+from vending_machine_simulator import ORDER_INVALID_COINS
+from vending_machine_simulator import set_clock
 import test_vending_machine_simulator_tests_datasets as data
 
 
@@ -79,5 +84,321 @@ class TestVendingMachineOperations(unittest.TestCase):
         self.assertNotEqual(self.vmo.ask_user_drink(), data.drink1)
 
 
+class TestServingsIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # the index follows the dispenser and menu owned by the VendingMachineOperations object
+        self.vmo = VendingMachineOperations()
+        self.dispenser = self.vmo.materials_dispenser
+        self.drinks_menu = self.vmo.drinks_menu
+        self.assertTrue(self.dispenser.allocate_material_container(data.mat1, data.mat1_capacity))
+        self.assertTrue(self.dispenser.allocate_material_container(data.mat2, data.mat2_capacity))
+        self.assertTrue(self.dispenser.allocate_material_container(data.mat3, data.mat3_capacity))
+
+    def test_servings_follow_add_drink_and_refill(self):
+        self.assertTrue(
+            self.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 0)
+        self.assertFalse(self.vmo.check_drink_availability(data.drink1))
+        self.assertTrue(self.dispenser.refill_material_container(data.mat1))
+        self.assertTrue(self.dispenser.refill_material_container(data.mat2))
+        self.assertTrue(self.dispenser.refill_material_container(data.mat3))
+        # coffee 50 // 24, milk 200 // 100, water 500 // 250
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 2)
+        self.assertTrue(self.vmo.check_drink_availability(data.drink1))
+        self.assertEqual(self.vmo.get_available_drinks(), [data.drink1])
+        self.assertFalse(self.vmo.check_drink_availability(data.drink2))
+
+    def test_servings_follow_takeout(self):
+        self.assertTrue(
+            self.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(self.dispenser.refill_material_container(material))
+        self.assertTrue(
+            self.dispenser.takeout_material_container(data.mat1, data.drink1_bom[data.mat1])
+        )
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 1)
+        self.assertTrue(
+            self.dispenser.takeout_material_container(data.mat1, data.drink1_bom[data.mat1])
+        )
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 0)
+        self.assertFalse(self.vmo.check_drink_availability(data.drink1))
+        self.assertEqual(self.vmo.get_available_drinks(), [])
+
+    def test_index_matches_full_scan(self):
+        self.assertTrue(self.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, '/c'))
+        self.assertTrue(self.drinks_menu.add_drink(data.drink2, data.drink1_price, data.drink2_bom, '/m'))
+        self.assertTrue(self.drinks_menu.add_drink('sugar water', 1.0, {data.mat0: 5}, '/s'))
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(self.dispenser.refill_material_container(material))
+        for drink in self.drinks_menu.get_all_drinks():
+            self.assertEqual(
+                self.vmo.get_drink_servings(drink), self.vmo.compute_drink_servings(drink)
+            )
+        # empty bom is always available, missing container never is
+        self.assertTrue(self.vmo.check_drink_availability(data.drink2))
+        self.assertFalse(self.vmo.check_drink_availability('sugar water'))
+
+    def test_rendered_menu_follows_availability_and_menu_changes(self):
+        self.assertTrue(self.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, '/c'))
+        self.assertEqual(self.vmo.render_menu(), '')
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(self.dispenser.refill_material_container(material))
+        menu = self.vmo.render_menu()
+        self.assertEqual(menu, f"Want {data.drink1} for {data.drink1_price} US$?then type: /c\n")
+        # a takeout leaving the drink available does not render the menu again
+        with patch.object(self.vmo, 'get_menu_offers') as offers:
+            self.assertTrue(self.dispenser.takeout_material_container(data.mat1, data.drink1_bom[data.mat1]))
+            self.assertIs(self.vmo.render_menu(), menu)
+            offers.assert_not_called()
+        self.assertTrue(self.drinks_menu.set_drink_price(data.drink1, 2.5))
+        self.assertIn('for 2.5 US$', self.vmo.render_menu())
+        self.assertTrue(self.dispenser.takeout_material_container(data.mat1, data.drink1_bom[data.mat1]))
+        self.assertEqual(self.vmo.render_menu(), '')
+
+
+class TestMakeDrink(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        self.dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(self.dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(self.dispenser.refill_material_container(material))
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+
+    def volumes(self):
+        return [
+            self.dispenser.get_volume_material_container(material)
+            for material in (data.mat1, data.mat2, data.mat3)
+        ]
+
+    def test_make_drink_is_all_or_nothing(self):
+        self.assertTrue(self.vmo.make_drink(data.drink1))
+        self.assertTrue(self.dispenser.takeout_material_container(data.mat1, 10))
+        volumes_before = self.volumes()
+        # 16 units of coffee left: the drink fails and milk/water stay untouched
+        self.assertFalse(self.vmo.make_drink(data.drink1))
+        self.assertEqual(self.volumes(), volumes_before)
+        self.assertFalse(self.vmo.make_drink(data.drink2))
+
+    def test_make_drinks_matches_sequential_make_drink(self):
+        orders = [data.drink1, data.drink2, data.drink1, data.drink1]
+        sequential = VendingMachineOperations()
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            sequential.materials_dispenser.allocate_material_container(material, capacity)
+            sequential.materials_dispenser.refill_material_container(material)
+        sequential.drinks_menu.add_drink(
+            data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+        )
+        expected = [sequential.make_drink(drink) for drink in orders]
+        self.assertEqual(self.vmo.make_drinks(orders), expected)
+        self.assertEqual(expected, [True, False, True, False])
+        self.assertEqual(self.volumes(), [
+            sequential.materials_dispenser.get_volume_material_container(material)
+            for material in (data.mat1, data.mat2, data.mat3)
+        ])
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 0)
+
+    def test_make_drinks_deducts_non_integer_volumes(self):
+        for compact_containers in (False, True):
+            vmo = VendingMachineOperations(compact_containers=compact_containers)
+            dispenser = vmo.materials_dispenser
+            self.assertTrue(dispenser.allocate_material_container(data.mat2, 1.7))
+            self.assertTrue(dispenser.refill_material_container(data.mat2))
+            self.assertTrue(vmo.drinks_menu.add_drink('a', 1.0, {data.mat2: 0.6}, '/a'))
+            self.assertTrue(vmo.drinks_menu.add_drink('b', 1.0, {data.mat2: 1.1}, '/b'))
+            takeouts = []
+            dispenser.add_containers_listener(lambda operation, material, amount: takeouts.append(amount))
+            # 0.6 + 1.1 > 1.7 in floats: the orders are deducted as they were checked
+            self.assertEqual(vmo.make_drinks(['a', 'b', 'a']), [True, True, False])
+            self.assertEqual(dispenser.get_volume_material_container(data.mat2), 1.7 - 0.6 - 1.1)
+            self.assertEqual(takeouts, [0.6, 1.1])
+            self.assertEqual(vmo.get_drink_servings('a'), 0)
+
+    def test_process_order_gives_change_from_the_coins_held(self):
+        coins = self.vmo.accepted_coins
+        self.assertTrue(coins.add_accepted_coins('dollar', 1.0))
+        self.assertTrue(coins.add_accepted_coins('quarter', 0.25))
+        self.assertTrue(coins.add_accepted_coins('toonie', 2.0))
+        # 4.0 paid for 3.0 without any dollar held: the payment is handed back
+        self.assertEqual(
+            self.vmo.process_order(data.drink1, {'toonie': 2}), (ORDER_NO_CHANGE, {'toonie': 2})
+        )
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 2)
+        self.assertTrue(coins.load_coins('dollar', 1))
+        self.assertEqual(self.vmo.process_order(data.drink1, {'toonie': 2}), (ORDER_SERVED, {'dollar': 1}))
+        # the change can also be taken from the coins just inserted
+        self.assertEqual(
+            self.vmo.process_order(data.drink1, {'dollar': 3, 'quarter': 2}), (ORDER_SERVED, {'quarter': 2})
+        )
+        self.assertEqual(
+            [coins.get_coin_count(coin) for coin in ('dollar', 'quarter', 'toonie')], [3, 0, 2]
+        )
+        self.assertAlmostEqual(self.vmo.financials.get_current_revenue(), 2 * data.drink1_price)
+
+    def test_process_order_refuses_invalid_coins_counts(self):
+        coins = self.vmo.accepted_coins
+        self.assertTrue(coins.add_accepted_coins('dollar', 1.0))
+        self.assertTrue(coins.add_accepted_coins('quarter', 0.25))
+        for inserted in (
+            {'dollar': 4, 'quarter': -4}, {'dollar': 3.0}, {'dollar': True, 'quarter': 8}, {'dollar': '3'}
+        ):
+            self.assertEqual(self.vmo.process_order(data.drink1, inserted), (ORDER_INVALID_COINS, inserted))
+        self.assertEqual([coins.get_coin_count(coin) for coin in ('dollar', 'quarter')], [0, 0])
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 2)
+        self.assertFalse(coins.collect_payment({'dollar': 3}, {'quarter': -4}))
+        self.assertEqual(coins.get_coin_count('dollar'), 0)
+
+    def test_reserved_servings_are_held_until_committed_or_expired(self):
+        now = [1000.0]
+        previous_clock = set_clock(lambda: now[0])
+        self.addCleanup(set_clock, previous_clock)
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        first_hold = self.vmo.reserve_drink(data.drink1, duration=30)
+        second_hold = self.vmo.reserve_drink(data.drink1, duration=30)
+        self.assertGreater(second_hold, first_hold)
+        # both servings are promised: no other order can take them
+        self.assertEqual(self.vmo.reserve_drink(data.drink1), -1)
+        self.assertFalse(self.vmo.check_drink_availability(data.drink1))
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 3})[0], ORDER_UNAVAILABLE)
+        self.assertFalse(self.vmo.make_drink(data.drink1))
+        self.assertEqual(self.vmo.make_drinks([data.drink1]), [False])
+        self.assertEqual(self.vmo.reserve_drink(data.drink2), -1)
+        # a refused payment keeps the hold, the payment can be completed
+        self.assertEqual(
+            self.vmo.process_order(data.drink1, {'dollar': 2}, first_hold)[0], ORDER_INSUFFICIENT_PAYMENT
+        )
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 3}, first_hold), (ORDER_SERVED, {}))
+        self.assertEqual(self.volumes()[0], data.mat1_capacity - data.drink1_bom[data.mat1])
+        # the second customer never pays: the serving is back once the hold expires
+        now[0] += 31
+        self.assertTrue(self.vmo.check_drink_availability(data.drink1))
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 3}, second_hold)[0], ORDER_UNAVAILABLE)
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 3}), (ORDER_SERVED, {}))
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 0)
+
+    def test_expired_holds_are_back_on_the_menu(self):
+        now = [1000.0]
+        previous_clock = set_clock(lambda: now[0])
+        self.addCleanup(set_clock, previous_clock)
+        for _ in range(2):
+            self.assertGreater(self.vmo.reserve_drink(data.drink1, duration=5), 0)
+        self.assertEqual(self.vmo.render_menu(), '')
+        self.assertEqual(self.vmo.get_available_drinks(), [])
+        now[0] += 100
+        # no availability check needed: the menu itself releases the expired holds
+        self.assertIn(data.drink1, self.vmo.render_menu())
+        self.assertEqual(self.vmo.get_available_drinks(), [data.drink1])
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 2)
+
+    def test_hold_of_another_drink_is_refused_before_payment(self):
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.assertTrue(self.vmo.drinks_menu.add_drink('water cup', 1.0, {data.mat3: 100}, '/w'))
+        hold = self.vmo.reserve_drink('water cup')
+        volumes_before = self.volumes()
+        # the cheap hold cannot pay for the cappuccino: no coin is kept, nothing is taken out
+        self.assertEqual(
+            self.vmo.process_order(data.drink1, {'dollar': 3}, hold), (ORDER_UNAVAILABLE, {'dollar': 3})
+        )
+        self.assertEqual(self.vmo.accepted_coins.get_coin_count('dollar'), 0)
+        self.assertEqual(self.vmo.financials.get_current_revenue(), 0)
+        self.assertEqual(self.volumes(), volumes_before)
+        # the hold is kept for the drink it was placed for
+        self.assertEqual(self.vmo.process_order('water cup', {'dollar': 1}, hold), (ORDER_SERVED, {}))
+        self.assertEqual(self.volumes()[2], volumes_before[2] - 100)
+
+
+class TestThreadSafeOrders(unittest.TestCase):
+
+    def test_concurrent_orders_never_oversell(self):
+        vmo = VendingMachineOperations(thread_safe=True)
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity * 20), (data.mat2, data.mat2_capacity * 20),
+            (data.mat3, data.mat3_capacity * 20)
+        ):
+            self.assertTrue(vmo.materials_dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(vmo.materials_dispenser.refill_material_container(material))
+        self.assertTrue(
+            vmo.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        expected_servings = vmo.get_drink_servings(data.drink1)
+        served = []
+
+        def order():
+            for _ in range(50):
+                if vmo.check_drink_availability(data.drink1) and vmo.make_drink(data.drink1):
+                    served.append(data.drink1)
+                if vmo.make_drinks([data.drink1, data.drink1]) == [True, True]:
+                    served.extend([data.drink1, data.drink1])
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=order) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertLessEqual(len(served), expected_servings)
+        for material in (data.mat1, data.mat2, data.mat3):
+            volume = vmo.materials_dispenser.get_volume_material_container(material)
+            capacity = vmo.materials_dispenser.get_capacity_material_container(material)
+            self.assertGreaterEqual(volume, 0)
+            self.assertEqual(capacity - volume, len(served) * data.drink1_bom[material])
+        self.assertEqual(vmo.get_drink_servings(data.drink1), vmo.compute_drink_servings(data.drink1))
+
+
+class TestSharedCatalogs(unittest.TestCase):
+
+    def test_fleet_shares_frozen_catalogs(self):
+        menu = DrinksMenu()
+        self.assertTrue(menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid))
+        menu.freeze()
+        coins = AcceptedCoinsDispenser()
+        self.assertTrue(coins.add_accepted_coins('dollar', 1.0))
+        coins.freeze()
+        fleet = [VendingMachineOperations(drinks_menu=menu, accepted_coins=coins) for _ in range(3)]
+        self.assertEqual(menu.menu_listeners, [])
+        first = fleet[0]
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(first.materials_dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(first.materials_dispenser.refill_material_container(material))
+        self.assertEqual(first.process_order(data.drink1, {'dollar': 4}), (ORDER_SERVED, {'dollar': 1}))
+        self.assertEqual(first.accepted_coins.get_coin_count('dollar'), 3)
+        self.assertEqual(fleet[1].accepted_coins.get_coin_count('dollar'), 0)
+        self.assertEqual(fleet[1].get_drink_servings(data.drink1), 0)
+        # next menu version: prepared once, then handed to every machine
+        next_menu = menu.derive()
+        self.assertTrue(next_menu.add_drink('hot water', 0.5, {data.mat3: 100}, '/h'))
+        next_menu.freeze()
+        for vmo in fleet:
+            vmo.set_drinks_menu(next_menu)
+        self.assertEqual(first.get_available_drinks(), [data.drink1, 'hot water'])
+        self.assertEqual(fleet[2].get_available_drinks(), [])
+        self.assertEqual(menu.get_all_drinks(), [data.drink1])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
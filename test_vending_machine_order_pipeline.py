@@ -0,0 +1,116 @@
+import io
+import json
+import unittest
+from vending_machine_simulator import ORDER_SERVED, ORDER_UNAVAILABLE, ORDER_UNKNOWN_DRINK
+from vending_machine_simulator import ORDER_INSUFFICIENT_PAYMENT, VendingMachineOperations
+from vending_machine_order_pipeline import OrderPipeline, read_jsonl_events, write_jsonl_results
+from vending_machine_order_pipeline import PIPELINE_ABANDONED, PIPELINE_INVALID_EVENT, PIPELINE_UNKNOWN_ORDER
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestOrderPipeline(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.pipeline = OrderPipeline(self.vmo, max_pending=2)
+
+    def test_replay_jsonl_stream(self):
+        events = [
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1},
+            {'event': 'payment', 'order_id': 1, 'coins': {'dollar': 4}},
+            {'event': 'order', 'order_id': 2, 'command': data.drink1_command_valid, 'coins': {'dollar': 2}},
+            {'event': 'order', 'order_id': 3, 'drink': data.drink1, 'coins': {'dollar': 3}},
+            {'event': 'order', 'order_id': 4, 'drink': data.drink1, 'coins': {'dollar': 3}},
+            {'event': 'order', 'order_id': 5, 'drink': data.drink2},
+            {'event': 'payment', 'order_id': 6, 'coins': {'dollar': 1}},
+            {'event': 'refund'},
+        ]
+        source = io.StringIO('\n'.join(json.dumps(event) for event in events) + '\nnot json\n')
+        destination = io.StringIO()
+        count = write_jsonl_results(self.pipeline.process(read_jsonl_events(source)), destination)
+        results = [json.loads(line) for line in destination.getvalue().splitlines()]
+        self.assertEqual(count, len(results))
+        self.assertEqual(
+            [(result['order_id'], result['outcome'], result['change']) for result in results],
+            [
+                (1, ORDER_SERVED, 1.0),
+                (2, ORDER_INSUFFICIENT_PAYMENT, 2.0),
+                (3, ORDER_SERVED, 0.0),
+                (4, ORDER_UNAVAILABLE, 3.0),
+                (5, ORDER_UNKNOWN_DRINK, 0),
+                (6, PIPELINE_UNKNOWN_ORDER, 1.0),
+                (None, PIPELINE_INVALID_EVENT, 0),
+                (None, PIPELINE_INVALID_EVENT, 0),
+            ]
+        )
+        self.assertEqual(results[0]['change_coins'], {'dollar': 1})
+        self.assertEqual(results[2]['change_coins'], {})
+        self.assertAlmostEqual(self.vmo.financials.get_current_revenue(), 2 * data.drink1_price)
+        # the paid coins stay in the machine, the change is taken from them
+        self.assertEqual(self.vmo.accepted_coins.get_coin_count('dollar'), 6)
+        self.assertEqual(self.pipeline.events_count, len(events) + 1)
+        self.assertGreater(self.pipeline.events_per_second(), 0)
+
+    def test_generator_source_is_consumed_lazily(self):
+        consumed = []
+
+        def events():
+            for order_id in range(1000):
+                consumed.append(order_id)
+                yield {'event': 'order', 'order_id': order_id, 'drink': data.drink1}
+
+        results = self.pipeline.process(events())
+        # pending orders stay bounded: the oldest unpaid order is abandoned
+        self.assertEqual(next(results), {
+            'order_id': 0, 'drink': data.drink1, 'outcome': PIPELINE_ABANDONED, 'change': 0,
+            'change_coins': {}
+        })
+        self.assertEqual(len(consumed), 3)
+        self.assertEqual(len(self.pipeline.pending_orders), 2)
+
+    def outcomes(self, events):
+        return [result['outcome'] for event in events for result in self.pipeline.process_event(event)]
+
+    def test_malformed_events_are_reported(self):
+        self.assertEqual(self.outcomes([
+            {'event': 'order', 'order_id': [1], 'drink': data.drink1},
+            {'event': 'payment', 'order_id': [1], 'coins': {'dollar': 3}},
+            {'event': 'order', 'drink': data.drink1, 'coins': {'dollar': 3}},
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1, 'coins': {'dollar': 'two'}},
+            {'event': 'order', 'order_id': 2, 'drink': data.drink1, 'coins': {'dollar': -3}},
+            {'event': 'order', 'order_id': 3, 'drink': data.drink1, 'coins': 3},
+            {'event': 'order', 'order_id': 4, 'drink': ['x']},
+            {'event': 'order', 'order_id': 5, 'command': {'keys': '/c'}, 'coins': {'dollar': 3}},
+        ]), [PIPELINE_INVALID_EVENT] * 8)
+        self.assertEqual(self.pipeline.pending_orders, {})
+        self.assertEqual(self.vmo.accepted_coins.get_coin_count('dollar'), 0)
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 2)
+
+    def test_duplicate_pending_order_is_reported(self):
+        self.assertEqual(self.outcomes([
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1},
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1},
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1, 'coins': {'dollar': 3}},
+            {'event': 'payment', 'order_id': 1, 'coins': {'dollar': 3}},
+        ]), [PIPELINE_INVALID_EVENT, PIPELINE_INVALID_EVENT, ORDER_SERVED])
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 1)
+        # a settled order_id can be ordered again
+        self.assertEqual(self.outcomes([
+            {'event': 'order', 'order_id': 1, 'drink': data.drink1, 'coins': {'dollar': 3}}
+        ]), [ORDER_SERVED])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from vending_machine_simulator import ORDER_INSUFFICIENT_PAYMENT, ORDER_SERVED, ORDER_UNAVAILABLE
+from vending_machine_simulator import ORDER_UNKNOWN_DRINK
+from vending_machine_simulator import VendingMachineOperations
+from vending_machine_order_server import VendingMachineOrderServer, run_simulated_customers
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestVendingMachineOrderServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity * 10), (data.mat2, data.mat2_capacity * 10),
+            (data.mat3, data.mat3_capacity * 10)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('quarter', 0.25))
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.server = VendingMachineOrderServer(self.vmo, session_timeout=5)
+
+    def test_concurrent_sessions_share_one_machine(self):
+        servings = self.vmo.get_drink_servings(data.drink1)
+
+        async def scenario():
+            host, port = await self.server.start()
+            try:
+                return await run_simulated_customers(
+                    200, host, port, commands=[data.drink1_command_valid]
+                )
+            finally:
+                await self.server.close()
+
+        outcomes = asyncio.run(scenario())
+        self.assertEqual(outcomes, {ORDER_SERVED: servings, ORDER_UNAVAILABLE: 200 - servings})
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), 0)
+        self.assertAlmostEqual(self.vmo.financials.get_current_revenue(), servings * data.drink1_price)
+        self.assertEqual(self.server.sessions_count, 200)
+        self.assertEqual(self.server.active_sessions, 0)
+
+    @unittest.skipUnless(hasattr(asyncio, 'start_unix_server'), 'Unix sockets not supported')
+    def test_unix_socket_session(self):
+        async def scenario(path):
+            await self.server.start_unix(path)
+            try:
+                return await run_simulated_customers(
+                    2, path=path, commands=[data.drink1_command_valid, data.drink1_command_invalid]
+                )
+            finally:
+                await self.server.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            outcomes = asyncio.run(scenario(os.path.join(directory, 'vms.sock')))
+        self.assertEqual(outcomes, {ORDER_SERVED: 1, ORDER_UNKNOWN_DRINK: 1})
+
+    def test_serving_held_while_paying_is_released_when_the_customer_leaves(self):
+        servings = self.vmo.get_drink_servings(data.drink1)
+
+        async def scenario():
+            host, port = await self.server.start()
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                while (await reader.readline()) != b'CHOOSE\n':
+                    pass
+                writer.write(f'{data.drink1_command_valid}\n'.encode())
+                self.assertTrue((await reader.readline()).startswith(b'PRICE'))
+                await reader.readline()  # first coin asked
+                held_servings = self.vmo.get_drink_servings(data.drink1)
+                writer.close()
+                await writer.wait_closed()
+                while self.server.active_sessions:
+                    await asyncio.sleep(0.01)
+                return held_servings
+            finally:
+                await self.server.close()
+
+        self.assertEqual(asyncio.run(scenario()), servings - 1)
+        self.assertEqual(self.vmo.get_drink_servings(data.drink1), servings)
+        self.assertEqual(self.vmo.materials_dispenser.holds, {})
+
+    def test_garbled_answers_are_wrong_answers(self):
+        async def session(host, port, choice, coins_answer):
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(choice)
+                while True:
+                    line = await reader.readline()
+                    if line.startswith(b'COIN'):
+                        writer.write(coins_answer)
+                    elif line.startswith(b'RESULT') or not line:
+                        return line
+            finally:
+                writer.close()
+
+        async def scenario():
+            host, port = await self.server.start()
+            try:
+                return (
+                    await session(host, port, b'\xff\xfe\n', b'1\n'),
+                    await session(host, port, f'{data.drink1_command_valid}\n'.encode(), '\u00b2\n'.encode())
+                )
+            finally:
+                await self.server.close()
+
+        unknown, unpaid = asyncio.run(scenario())
+        self.assertEqual(unknown, f'RESULT\t{ORDER_UNKNOWN_DRINK}\t0\n'.encode())
+        self.assertEqual(unpaid, f'RESULT\t{ORDER_INSUFFICIENT_PAYMENT}\t0.0\n'.encode())
+        self.assertEqual(self.server.orders_outcomes, {ORDER_UNKNOWN_DRINK: 1, ORDER_INSUFFICIENT_PAYMENT: 1})
+        self.assertEqual(self.vmo.materials_dispenser.holds, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
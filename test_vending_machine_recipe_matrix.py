@@ -0,0 +1,64 @@
+import unittest
+from vending_machine_simulator import VendingMachineOperations
+import test_vending_machine_simulator_tests_datasets as data
+
+try:
+    from vending_machine_recipe_matrix import compile_recipe_matrix
+except ImportError:  # NumPy not installed
+    compile_recipe_matrix = None
+
+
+@unittest.skipIf(compile_recipe_matrix is None, 'NumPy is required by the compiled recipe matrix')
+class TestCompiledRecipeMatrix(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        drinks_menu = self.vmo.drinks_menu
+        self.assertTrue(dispenser.allocate_material_container(data.mat1, data.mat1_capacity))
+        self.assertTrue(dispenser.allocate_material_container(data.mat2, data.mat2_capacity))
+        self.assertTrue(dispenser.allocate_material_container(data.mat3, data.mat3_capacity))
+        self.assertTrue(drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, '/c'))
+        self.assertTrue(drinks_menu.add_drink(data.drink2, data.drink1_price, data.drink2_bom, '/m'))
+        self.assertTrue(drinks_menu.add_drink('sweet water', 1.0, {data.mat3: 100, data.mat0: 0}, '/s'))
+        self.assertTrue(drinks_menu.add_drink('hot water', 0.5, {data.mat3: 100, data.mat1: 0}, '/h'))
+        self.matrix = compile_recipe_matrix(self.vmo)
+
+    def assert_same_as_dict_path(self):
+        self.assertEqual(self.matrix.servings_by_drink(), self.vmo.drinks_servings)
+        self.assertEqual(self.matrix.available_drinks(), self.vmo.get_available_drinks())
+
+    def test_matches_dict_path_on_refill_and_takeout(self):
+        self.assert_same_as_dict_path()
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(self.vmo.materials_dispenser.refill_material_container(material))
+        self.assert_same_as_dict_path()
+        self.assertEqual(self.matrix.servings_by_drink()[data.drink1], 2)
+        self.assertTrue(self.vmo.materials_dispenser.takeout_material_container(data.mat1, 30))
+        self.assert_same_as_dict_path()
+        self.assertEqual(list(self.matrix.availability()), [False, True, False, True])
+
+    def test_matches_dict_path_with_holds(self):
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(self.vmo.materials_dispenser.refill_material_container(material))
+        self.assertTrue(self.vmo.materials_dispenser.takeout_material_container(data.mat1, 26))
+        hold = self.vmo.reserve_drink(data.drink1)
+        self.assertGreater(hold, 0)
+        # the only serving is held: neither path offers it
+        self.assert_same_as_dict_path()
+        self.assertEqual(self.matrix.servings_by_drink()[data.drink1], 0)
+        self.assertTrue(self.vmo.materials_dispenser.release_hold(hold))
+        self.assert_same_as_dict_path()
+        self.assertEqual(self.matrix.servings_by_drink()[data.drink1], 1)
+
+    def test_recompiles_on_menu_change(self):
+        compiled_recipes = self.matrix.recipes
+        self.assertTrue(self.vmo.drinks_menu.add_drink('latte', 2.5, {data.mat2: 150}, '/l'))
+        self.assertTrue(self.vmo.materials_dispenser.refill_material_container(data.mat2))
+        self.assert_same_as_dict_path()
+        self.assertIsNot(self.matrix.recipes, compiled_recipes)
+        self.assertIn('latte', self.matrix.available_drinks())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import threading
+import unittest
+from vending_machine_simulator import ArrayMaterialsContainersDispenser, MaterialsContainersDispenser, set_clock
+from vending_machine_reports import REPORT_COLUMNS, REPORT_JSON_LINES, InventoryReporter
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestInventoryReporter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        previous_clock = set_clock(lambda: 1000.0)
+        self.addCleanup(set_clock, previous_clock)
+        self.reporter = InventoryReporter(chunk_size=64)
+        self.dispensers = [MaterialsContainersDispenser(), ArrayMaterialsContainersDispenser()]
+        for number, dispenser in enumerate(self.dispensers):
+            for material, capacity in (
+                (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+            ):
+                self.assertTrue(dispenser.allocate_material_container(material, capacity))
+                self.assertTrue(dispenser.refill_material_container(material))
+            self.assertTrue(self.reporter.add_machine(f'machine-{number}', dispenser))
+        self.assertFalse(self.reporter.add_machine('machine-0', MaterialsContainersDispenser()))
+
+    def report(self, **options):
+        stream = io.StringIO()
+        rows = self.reporter.write_report(stream, **options)
+        return rows, stream.getvalue()
+
+    def test_full_csv_report(self):
+        rows, text = self.report()
+        self.assertEqual(rows, 6)
+        lines = list(csv.reader(io.StringIO(text)))
+        self.assertEqual(tuple(lines[0]), REPORT_COLUMNS)
+        self.assertEqual(lines[1], ['1000.0', 'machine-0', data.mat1, str(data.mat1_capacity), str(data.mat1_capacity)])
+        self.assertEqual(len(lines), 7)
+        # names holding separators or quotes are quoted
+        dispenser = MaterialsContainersDispenser()
+        dispenser.allocate_material_container('sugar, brown', 10)
+        self.reporter.add_machine('machine "2"', dispenser)
+        rows, text = self.report(header=False)
+        self.assertEqual(rows, 7)
+        self.assertEqual(list(csv.reader(io.StringIO(text)))[-1], ['1000.0', 'machine "2"', 'sugar, brown', '10', '0'])
+
+    def test_delta_report_emits_changed_volumes_only(self):
+        self.assertEqual(self.report(delta=True)[0], 6)  # every container is new
+        self.assertEqual(self.report(delta=True), (0, 'timestamp,machine,material,capacity,volume\n'))
+        self.dispensers[1].takeout_material_container(data.mat3, 250)
+        self.dispensers[0].refill_material_container(data.mat1)  # volume unchanged
+        rows, text = self.report(report_format=REPORT_JSON_LINES, delta=True)
+        self.assertEqual(rows, 1)
+        self.assertEqual(
+            json.loads(text),
+            {'timestamp': 1000.0, 'machine': 'machine-1', 'material': data.mat3, 'capacity': 500.0, 'volume': 250.0}
+        )
+        self.assertEqual(self.report(delta=True)[0], 0)
+
+    def test_remove_machine_and_unknown_format(self):
+        self.assertTrue(self.reporter.remove_machine('machine-0'))
+        self.assertFalse(self.reporter.remove_machine('machine-0'))
+        self.assertEqual(self.dispensers[0].containers_listeners, [])
+        self.assertEqual(self.report(header=False)[0], 3)
+        with self.assertRaises(ValueError):
+            self.report(report_format='xml')
+
+    def test_delta_reports_follow_concurrent_takeouts(self):
+        dispenser = MaterialsContainersDispenser(thread_safe=True)
+        self.assertTrue(dispenser.allocate_material_container(data.mat3, 100_000))
+        self.assertTrue(dispenser.refill_material_container(data.mat3))
+        self.assertTrue(self.reporter.add_machine('shared', dispenser))
+
+        def order():
+            for _ in range(2000):
+                dispenser.takeout_material_container(data.mat3, 1)
+
+        threads = [threading.Thread(target=order) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            self.report(delta=True)
+        for thread in threads:
+            thread.join()
+        self.report(delta=True)
+        # the last takeout is never lost between two reports
+        self.assertEqual(self.reporter.reported['shared'][data.mat3], 100_000 - 8000)
+        self.assertEqual(self.report(delta=True)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from vending_machine_simulator import DrinksMenu, VendingMachineOperations
+from vending_machine_snapshot import dumps_snapshot, load_snapshot, loads_snapshot, save_snapshot
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestVendingMachineSnapshot(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.vmo = VendingMachineOperations()
+        self.vmo.drinks_menu = DrinksMenu(command_trie=True)
+        self.vmo.drinks_menu.add_menu_listener(self.vmo.on_menu_change)
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        self.assertTrue(dispenser.allocate_material_container(data.mat0, 12.5))
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(
+                data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid
+            )
+        )
+        self.assertTrue(self.vmo.drinks_menu.add_drink('sweet water', 1.0, {data.mat3: 100, data.mat0: 0.5}, '/s'))
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('quarter', 0.25))
+        self.assertTrue(self.vmo.accepted_coins.load_coins('quarter', 8))
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 4})[0], 'served')
+        self.vmo.financials.reset_revenue()
+        self.assertEqual(self.vmo.process_order(data.drink1, {'dollar': 3, 'quarter': 1})[0], 'served')
+
+    def assert_same_machine(self, restored):
+        self.assertEqual(
+            restored.materials_dispenser.materials_containers, self.vmo.materials_dispenser.materials_containers
+        )
+        self.assertEqual(restored.drinks_menu.drinks_menu, self.vmo.drinks_menu.drinks_menu)
+        self.assertEqual(restored.drinks_servings, self.vmo.drinks_servings)
+        self.assertEqual(restored.accepted_coins.coins_inventory, self.vmo.accepted_coins.coins_inventory)
+        self.assertEqual(restored.accepted_coins.coins_cents, self.vmo.accepted_coins.coins_cents)
+        self.assertEqual(restored.financials.get_current_revenue(), self.vmo.financials.get_current_revenue())
+        self.assertEqual(restored.financials.get_total_revenue(), self.vmo.financials.get_total_revenue())
+        self.assertEqual(restored.financials.top_drinks(), self.vmo.financials.top_drinks())
+        self.assertEqual(list(restored.financials.ledger_times), list(self.vmo.financials.ledger_times))
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'machine.vms')
+            self.assertGreater(save_snapshot(self.vmo, path), 0)
+            restored = load_snapshot(path)
+            # a failed save leaves neither its temporary file nor a damaged snapshot behind
+            os.mkdir(os.path.join(directory, 'taken.vms'))
+            with self.assertRaises(OSError):
+                save_snapshot(self.vmo, os.path.join(directory, 'taken.vms'))
+            self.assertEqual(sorted(os.listdir(directory)), ['machine.vms', 'taken.vms'])
+        self.assert_same_machine(restored)
+        # indexes are rebuilt: command lookups, prefix trie and container listeners work
+        self.assertIsInstance(
+            restored.materials_dispenser.get_capacity_material_container(data.mat1), int
+        )
+        self.assertEqual(restored.drinks_menu.get_drink_by_command('/s'), 'sweet water')
+        self.assertEqual(restored.drinks_menu.match_command_prefix('/'), [data.drink1, 'sweet water'])
+        self.assertFalse(restored.make_drink(data.drink1))
+        for material in (data.mat1, data.mat2, data.mat3):
+            self.assertTrue(restored.materials_dispenser.refill_material_container(material))
+        self.assertEqual(restored.get_drink_servings(data.drink1), 2)
+
+    def test_thread_safe_mode(self):
+        restored = loads_snapshot(dumps_snapshot(self.vmo), thread_safe=True)
+        self.assert_same_machine(restored)
+        self.assertTrue(restored.materials_dispenser.is_thread_safe())
+        self.assertEqual(
+            set(restored.materials_dispenser.containers_locks), set(self.vmo.materials_dispenser.materials_containers)
+        )
+        self.assertTrue(loads_snapshot(dumps_snapshot(restored)).materials_dispenser.is_thread_safe())
+
+    def test_compact_containers_round_trip(self):
+        compact = loads_snapshot(dumps_snapshot(self.vmo), compact_containers=True)
+        self.assert_same_machine(compact)
+        self.assertEqual(compact.get_drink_servings(data.drink1), 0)
+        restored = loads_snapshot(dumps_snapshot(compact))
+        self.assertIs(type(restored.materials_dispenser), type(compact.materials_dispenser))
+        self.assert_same_machine(restored)
+
+    def test_holds_are_not_saved(self):
+        dispenser = self.vmo.materials_dispenser
+        self.assertTrue(dispenser.refill_material_container(data.mat3))
+        self.assertTrue(dispenser.takeout_material_container(data.mat3, data.mat3_capacity - 150))
+        self.assertTrue(dispenser.refill_material_container(data.mat0))
+        self.assertEqual(self.vmo.get_drink_servings('sweet water'), 1)
+        self.assertGreater(self.vmo.reserve_drink('sweet water'), 0)
+        self.assertEqual(self.vmo.get_drink_servings('sweet water'), 0)
+        # the serving held by the saved machine can be ordered from the restored one
+        restored = loads_snapshot(dumps_snapshot(self.vmo))
+        self.assertEqual(restored.materials_dispenser.holds, {})
+        self.assertTrue(restored.check_drink_availability('sweet water'))
+        self.assertEqual(restored.get_drink_servings('sweet water'), 1)
+
+    def test_rejects_foreign_data(self):
+        snapshot = dumps_snapshot(self.vmo)
+        with self.assertRaises(ValueError):
+            loads_snapshot(b'not a snapshot')
+        with self.assertRaises(ValueError):
+            loads_snapshot(snapshot[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from vending_machine_simulator import VendingMachineOperations
+from vending_machine_tracing import disable_tracing, enable_tracing, is_tracing_enabled
+import test_vending_machine_simulator_tests_datasets as data
+
+
+class TestOrderTracing(unittest.TestCase):
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'orders.trace.json')
+        self.vmo = VendingMachineOperations()
+        dispenser = self.vmo.materials_dispenser
+        for material, capacity in (
+            (data.mat1, data.mat1_capacity), (data.mat2, data.mat2_capacity), (data.mat3, data.mat3_capacity)
+        ):
+            self.assertTrue(dispenser.allocate_material_container(material, capacity))
+            self.assertTrue(dispenser.refill_material_container(material))
+        # the containers hold 2 servings of drink1
+        self.assertTrue(
+            self.vmo.drinks_menu.add_drink(data.drink1, data.drink1_price, data.drink1_bom, data.drink1_command_valid)
+        )
+        self.assertTrue(self.vmo.accepted_coins.add_accepted_coins('dollar', 1.0))
+        self.addCleanup(disable_tracing)
+
+    def read_spans(self):
+        disable_tracing()
+        with open(self.path) as stream:
+            events = json.load(stream)
+        return [event for event in events if event['ph'] == 'X']
+
+    def test_order_spans_are_nested(self):
+        enable_tracing(self.path, sample_rate=1, flush_size=4)
+        self.assertTrue(is_tracing_enabled())
+        self.vmo.process_order(data.drink1, {'dollar': 3})
+        spans = self.read_spans()
+        self.assertFalse(is_tracing_enabled())
+        names = {span['name'] for span in spans}
+        self.assertTrue(
+            {'order', 'check_drink_availability', 'checkout', 'make_drink', 'takeout_materials',
+             f'takeout {data.mat1}', 'revenue_booking'} <= names
+        )
+        order = next(span for span in spans if span['name'] == 'order')
+        self.assertEqual(order['args'], {'drink': data.drink1, 'outcome': 'served'})
+        make_drink = next(span for span in spans if span['name'] == 'make_drink')
+        for name in (f'takeout {material}' for material in data.drink1_bom):
+            takeout = next(span for span in spans if span['name'] == name)
+            self.assertGreaterEqual(takeout['ts'], make_drink['ts'])
+            self.assertLessEqual(takeout['ts'] + takeout['dur'], make_drink['ts'] + make_drink['dur'])
+        self.assertLessEqual(order['ts'], make_drink['ts'])
+
+    @patch('builtins.input', return_value=data.drink1_command_valid)
+    def test_application_span_and_threads(self, mocked_input):
+        tracer = enable_tracing(self.path, sample_rate=1)
+        with patch('builtins.print'):
+            with tracer.span('kiosk_order', machine='lobby'):
+                self.assertEqual(self.vmo.ask_user_drink(), data.drink1)
+        worker = threading.Thread(target=self.vmo.process_order, args=(data.drink1, {'dollar': 3}))
+        worker.start()
+        worker.join()
+        spans = self.read_spans()
+        kiosk = next(span for span in spans if span['name'] == 'kiosk_order')
+        self.assertEqual(kiosk['args'], {'machine': 'lobby'})
+        self.assertEqual(
+            {span['name'] for span in spans if span['tid'] == kiosk['tid']},
+            {'kiosk_order', 'menu_selection', 'menu_display', 'selection'}
+        )
+        self.assertIn('order', {span['name'] for span in spans if span['tid'] == worker.ident})
+
+    def test_orders_not_sampled_leave_no_span(self):
+        enable_tracing(self.path, sample_rate=0)
+        self.vmo.process_order(data.drink1, {'dollar': 3})
+        self.assertEqual(self.read_spans(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
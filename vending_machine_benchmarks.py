@@ -0,0 +1,1105 @@
+"""
+Vending Machine Benchmarks
+=> Measures the VMS order path, run it as a script: python vending_machine_benchmarks.py --help
+
+It consists of the following elements:
+
+### def build_concurrent_machine(materials_groups, drinks_per_group, capacity, thread_safe):
+	=> Builds a VendingMachineOperations whose drinks are spread over disjoint groups of materials
+
+### def bench_concurrent_orders(threads, orders, materials_groups, drinks_per_group, capacity, thread_safe):
+	=> Stress test: a thread pool orders drinks from one machine, reports the throughput and
+	checks that no container volume ever went negative and that no ingredient was oversold
+
+### def bench_snapshot_restore(machines, materials_groups, drinks_per_group, capacity):
+	=> Cold start of a fleet: builds machines item by item vs restores them from a snapshot file
+
+### def bench_journal(orders, durability, threads):
+	=> Orders per second of process_order with the journal off, fsync per record or group commit
+
+### def bench_containers_memory(machines, containers, compact):
+	=> Memory per machine of the dictionary and array backends of the materials containers
+
+### def bench_catalog_memory(machines, drinks, shared):
+	=> Memory per machine of private menus / coin tables vs frozen catalogs shared by the fleet
+
+### def bench_fleet(machines, orders, workers):
+	=> Orders per second of a FleetSimulator sharded over 1..N worker processes
+
+### def bench_event_simulation(machines, days, customers_per_hour):
+	=> Wall time of a discrete-event simulation of days of traffic on many machines
+
+### def bench_monte_carlo(configurations, replications, days, customers_per_hour):
+	=> Wall time of a Monte Carlo sweep of containers capacities (requires numpy)
+
+### def bench_provisioning(drinks, materials):
+	=> Machine provisioning: one API call per item vs the bulk catalog loader vs its compiled cache
+
+### def bench_reports(machines, containers, changed):
+	=> Nightly inventory report: report_containers_levels text vs streamed CSV (full and delta)
+
+### def bench_menu_render(drinks, displays):
+	=> Menu display latency: menu lines formatted for each display vs the cached render_menu
+
+### def bench_holds(outstanding, duration):
+	=> Ingredients holds: microseconds per reserve, commit and expiry with many holds outstanding
+
+### def bench_fleet_index(machines, drinks, queries, nearest):
+	=> Routing queries on a fleet: check_drink_availability on every machine vs FleetAvailabilityIndex
+
+### def build_sized_machine(size):
+	=> Machine with size materials and size drinks (3 materials each) and the usual coins
+
+### def bench_order_path(size, operations, repeat, seed):
+	=> Suite: nanoseconds per call of each ORDER_PATH_OPERATIONS on a machine of a given size
+
+### def compare_results(baseline, current, threshold):
+	=> Compares two suite runs (JSON files of the suite subcommand) and flags the regressions
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List
+from unittest import mock
+
+from vending_machine_catalog import load_catalog
+from vending_machine_event_simulation import EventSimulation, exponential_arrivals
+from vending_machine_fleet import FleetSimulator, exact_payments
+from vending_machine_fleet_index import FleetAvailabilityIndex
+from vending_machine_journal import DURABILITY_FSYNC, DURABILITY_GROUP, OrderJournal, recover_machine
+from vending_machine_metrics import disable_metrics, enable_metrics
+from vending_machine_reports import InventoryReporter
+from vending_machine_simulator import AcceptedCoinsDispenser, DrinksBusinessMaintenance, DrinksMenu, ORDER_SERVED
+from vending_machine_simulator import MaterialsContainersDispenser, VendingMachineOperations, set_clock
+from vending_machine_snapshot import load_snapshot, save_snapshot
+from vending_machine_tracing import disable_tracing, enable_tracing
+
+# operations timed by bench_order_path, in the order they are reported
+ORDER_PATH_OPERATIONS = (
+	'check_drink_availability',
+	'ask_user_drink',  # input mocked, the menu printed to os.devnull
+	'make_drink',
+	'takeout_material_container',
+	'refill_all_containers',
+	'add_revenue',
+	'order_replay',  # end to end process_order with the exact payment
+)
+# version of the JSON results written by the suite subcommand
+SUITE_RESULTS_VERSION = 1
+
+
+def build_concurrent_machine(
+		materials_groups: int = 4,
+		drinks_per_group: int = 4,
+		capacity: int = 10_000,
+		thread_safe: bool = True
+) -> VendingMachineOperations:
+	"""
+	=> Builds a machine where each group of 3 materials is used by drinks_per_group drinks
+	Orders of drinks from different groups use disjoint materials and can proceed in parallel
+
+	:param materials_groups:  # number of disjoint groups of materials
+	:param drinks_per_group:  # number of drinks sharing the materials of a group
+	:param capacity:  # capacity of every container, containers are filled
+	:param thread_safe:  # passed to VendingMachineOperations
+	:return: VendingMachineOperations ready to serve orders
+	"""
+	vmo = VendingMachineOperations(thread_safe=thread_safe)
+	for group in range(materials_groups):
+		materials = [f'material-{group}-{index}' for index in range(3)]
+		for material in materials:
+			vmo.materials_dispenser.allocate_material_container(material, capacity)
+			vmo.materials_dispenser.refill_material_container(material)
+		for index in range(drinks_per_group):
+			bom = {material: 1 + (index + position) % 5 for position, material in enumerate(materials)}
+			vmo.drinks_menu.add_drink(f'drink-{group}-{index}', 1.0 + index / 10, bom, f'/{group}.{index}')
+	return vmo
+
+
+def bench_concurrent_orders(
+		threads: int = 4,
+		orders: int = 20_000,
+		materials_groups: int = 4,
+		drinks_per_group: int = 4,
+		capacity: int = 10_000,
+		thread_safe: bool = True
+) -> Dict[str, float]:
+	"""
+	=> Orders drinks from one machine with a pool of threads (check_drink_availability then
+	make_drink, the check-then-act sequence of the front-end) until orders have been placed
+
+	:param threads:  # size of the thread pool
+	:param orders:  # total number of orders placed
+	:param materials_groups:  # see build_concurrent_machine
+	:param drinks_per_group:  # see build_concurrent_machine
+	:param capacity:  # see build_concurrent_machine - small capacities exhaust the stock
+	:param thread_safe:  # False shows the overselling of the unguarded dispenser
+	:return: dictionary of results: orders_per_second, served, rejected, negative_volumes and
+	oversold (volume handed out beyond the capacities, must be 0)
+	"""
+	vmo = build_concurrent_machine(materials_groups, drinks_per_group, capacity, thread_safe)
+	drinks = vmo.drinks_menu.get_all_drinks()
+	served: List[List[str]] = [[] for _ in range(threads)]
+
+	def place_orders(worker: int) -> int:
+		rejected = 0
+		for count in range(worker, orders, threads):
+			drink = drinks[count % len(drinks)]
+			if vmo.check_drink_availability(drink) and vmo.make_drink(drink):
+				served[worker].append(drink)
+			else:
+				rejected += 1
+		return rejected
+
+	switch_interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)  # force frequent thread switches to expose races
+	try:
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			rejected = sum(pool.map(place_orders, range(threads)))
+		elapsed = time.perf_counter() - start
+	finally:
+		sys.setswitchinterval(switch_interval)
+
+	# replay the served orders to compute the volume that should have been handed out
+	handed_out: Dict[str, int] = {}
+	for worker_orders in served:
+		for drink in worker_orders:
+			for material, volume in vmo.drinks_menu.get_drink_bom(drink).items():
+				handed_out[material] = handed_out.get(material, 0) + volume
+	dispenser = vmo.materials_dispenser
+	negative_volumes = 0
+	oversold = 0
+	for material in dispenser.materials_containers:
+		volume = dispenser.get_volume_material_container(material)
+		negative_volumes += volume < 0
+		# a lost update shows as more volume handed out than drawn from the container
+		oversold += max(0, handed_out.get(material, 0) - (capacity - volume))
+
+	return {
+		'threads': threads,
+		'orders': orders,
+		'elapsed_seconds': elapsed,
+		'orders_per_second': orders / elapsed if elapsed else float('inf'),
+		'served': sum(len(worker_orders) for worker_orders in served),
+		'rejected': rejected,
+		'negative_volumes': negative_volumes,
+		'oversold': oversold,
+	}
+
+
+def bench_snapshot_restore(
+		machines: int = 1_000,
+		materials_groups: int = 4,
+		drinks_per_group: int = 4,
+		capacity: int = 10_000
+) -> Dict[str, float]:
+	"""
+	=> Starts machines twice: through the API (allocate, refill, add_drink for every item) and
+	by loading the snapshot file of an identical machine (memory-mapped, indexes rebuilt once)
+
+	:param machines:  # number of machines started each way
+	:param materials_groups:  # see build_concurrent_machine
+	:param drinks_per_group:  # see build_concurrent_machine
+	:param capacity:  # see build_concurrent_machine
+	:return: dictionary of results: build_seconds, restore_seconds, speedup, snapshot_bytes
+	"""
+	start = time.perf_counter()
+	for _ in range(machines):
+		vmo = build_concurrent_machine(materials_groups, drinks_per_group, capacity, thread_safe=False)
+	build_seconds = time.perf_counter() - start
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'machine.vms')
+		snapshot_bytes = save_snapshot(vmo, path)
+		start = time.perf_counter()
+		for _ in range(machines):
+			load_snapshot(path)
+		restore_seconds = time.perf_counter() - start
+
+	return {
+		'machines': machines,
+		'build_seconds': build_seconds,
+		'restore_seconds': restore_seconds,
+		'speedup': build_seconds / restore_seconds if restore_seconds else float('inf'),
+		'snapshot_bytes': snapshot_bytes,
+	}
+
+
+def bench_journal(
+		orders: int = 5_000,
+		durability: str = DURABILITY_GROUP,
+		threads: int = 1
+) -> Dict[str, float]:
+	"""
+	=> Places paid orders (process_order: takeouts and a sale journaled per order) on one machine
+	journaled in a temporary directory, then recovers the machine from the journal
+
+	:param orders:  # total number of orders placed
+	:param durability:  # 'off' (no journal), DURABILITY_FSYNC or DURABILITY_GROUP
+	:param threads:  # orders are spread over a pool of threads
+	:return: dictionary of results: orders_per_second, served, fsyncs, records and recovered (True
+	if the recovered machine has the containers and revenue of the journaled one)
+	"""
+	vmo = build_concurrent_machine(capacity=orders * 5, thread_safe=threads > 1)
+	vmo.accepted_coins.add_accepted_coins('cent', 0.01)
+	drinks = vmo.drinks_menu.get_all_drinks()
+	payments = {drink: {'cent': round(vmo.drinks_menu.get_drink_price(drink) * 100)} for drink in drinks}
+
+	def place_orders(worker: int) -> int:
+		served = 0
+		for count in range(worker, orders, threads):
+			drink = drinks[count % len(drinks)]
+			served += vmo.process_order(drink, payments[drink])[0] == ORDER_SERVED
+		return served
+
+	with tempfile.TemporaryDirectory() as directory:
+		journal = None
+		if durability != 'off':
+			# the machine is built first: the journal starts from its snapshot
+			journal = OrderJournal(vmo, directory, durability=durability)
+			journal.checkpoint()
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			served = sum(pool.map(place_orders, range(threads)))
+		if journal is not None:
+			journal.sync()
+		elapsed = time.perf_counter() - start
+		recovered = None
+		if journal is not None:
+			journal.close()
+			recovered_vmo, _ = recover_machine(directory)
+			recovered = (
+				recovered_vmo.materials_dispenser.materials_containers == vmo.materials_dispenser.materials_containers
+				and recovered_vmo.financials.get_total_revenue() == vmo.financials.get_total_revenue()
+			)
+
+	return {
+		'durability': durability,
+		'threads': threads,
+		'orders': orders,
+		'elapsed_seconds': elapsed,
+		'orders_per_second': orders / elapsed if elapsed else float('inf'),
+		'served': served,
+		'records': journal.appended_records if journal is not None else 0,
+		'fsyncs': journal.fsync_count if journal is not None else 0,
+		'recovered': recovered,
+	}
+
+
+def resident_set_bytes() -> int:
+	"""
+	:return: current resident set size of the process (Linux /proc), 0 if unknown
+	"""
+	try:
+		with open('/proc/self/statm') as statm:
+			return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, IndexError):
+		return 0
+
+
+def bench_containers_memory(
+		machines: int = 10_000,
+		containers: int = 12,
+		compact: bool = False
+) -> Dict[str, float]:
+	"""
+	=> Builds machines whose containers are allocated and refilled, and measures the memory they
+	hold (run each backend in a fresh process for a meaningful RSS, as main() does)
+
+	:param machines:  # number of machines kept alive
+	:param containers:  # containers per machine
+	:param compact:  # True for the ArrayMaterialsContainersDispenser backend
+	:return: dictionary of results: bytes_per_machine (tracemalloc) and rss_bytes_per_machine
+	"""
+	gc.collect()
+	rss_before = resident_set_bytes()
+	tracemalloc.start()
+	fleet = []
+	for number in range(machines):
+		vmo = VendingMachineOperations(compact_containers=compact)
+		dispenser = vmo.materials_dispenser
+		for index in range(containers):
+			# capacities outside the small int cache, as real volumes are
+			dispenser.allocate_material_container(f'material-{index}', 10_000 + number % 1000)
+			dispenser.refill_material_container(f'material-{index}')
+		fleet.append(vmo)
+	traced_bytes = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	rss_after = resident_set_bytes()
+	return {
+		'compact': compact,
+		'machines': len(fleet),
+		'containers': containers,
+		'bytes_per_machine': traced_bytes / machines,
+		'rss_bytes_per_machine': (rss_after - rss_before) / machines,
+	}
+
+
+def bench_catalog_memory(
+		machines: int = 10_000,
+		drinks: int = 50,
+		shared: bool = True
+) -> Dict[str, float]:
+	"""
+	=> Builds a fleet of identical machines, each with its own menu and coins (add_drink and
+	add_accepted_coins per machine) or all sharing one frozen menu and one frozen coins catalog
+
+	:param machines:  # number of machines kept alive
+	:param drinks:  # drinks of the menu
+	:param shared:  # True to share the frozen catalogs
+	:return: dictionary of results: bytes_per_machine (tracemalloc)
+	"""
+	coins = (('dollar', 1.0), ('quarter', 0.25), ('dime', 0.10), ('nickel', 0.05))
+
+	def fill_catalogs(drinks_menu: DrinksMenu, accepted_coins: AcceptedCoinsDispenser):
+		for index in range(drinks):
+			bom = {f'material-{index % 7}': 10 + index, f'material-{(index + 1) % 7}': 5}
+			drinks_menu.add_drink(f'drink-{index}', 1.0 + index / 10, bom, f'/{index}')
+		for coin, value in coins:
+			accepted_coins.add_accepted_coins(coin, value)
+
+	gc.collect()
+	tracemalloc.start()
+	if shared:
+		drinks_menu, accepted_coins = DrinksMenu(), AcceptedCoinsDispenser()
+		fill_catalogs(drinks_menu, accepted_coins)
+		drinks_menu.freeze()
+		accepted_coins.freeze()
+		fleet = [
+			VendingMachineOperations(drinks_menu=drinks_menu, accepted_coins=accepted_coins)
+			for _ in range(machines)
+		]
+	else:
+		fleet = []
+		for _ in range(machines):
+			vmo = VendingMachineOperations()
+			fill_catalogs(vmo.drinks_menu, vmo.accepted_coins)
+			fleet.append(vmo)
+	traced_bytes = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return {
+		'shared': shared,
+		'machines': len(fleet),
+		'drinks': drinks,
+		'bytes_per_machine': traced_bytes / machines,
+	}
+
+
+def bench_fleet(machines: int = 10_000, orders: int = 200_000, workers: int = 1) -> Dict[str, float]:
+	"""
+	=> Plays random orders on a fleet of machines built like build_concurrent_machine, its
+	containers and counters in shared memory, sharded over worker processes
+
+	:param machines:  # size of the fleet
+	:param orders:  # orders played by the whole fleet
+	:param workers:  # worker processes
+	:return: dictionary of results: orders_per_second, served, revenue
+	"""
+	template = build_concurrent_machine(thread_safe=False)
+	template.accepted_coins.add_accepted_coins('dollar', 1.0)
+	template.accepted_coins.add_accepted_coins('dime', 0.10)
+	with FleetSimulator(template, machines, workers) as fleet:
+		fleet.run(fleet.workers, seed=1)  # starts the worker processes
+		start = time.perf_counter()
+		outcomes = fleet.run(orders, seed=2)
+		elapsed = time.perf_counter() - start
+		return {
+			'workers': fleet.workers,
+			'machines': machines,
+			'orders_per_second': orders / elapsed,
+			'served': outcomes.get(ORDER_SERVED, 0),
+			'revenue': fleet.get_fleet_revenue(),
+		}
+
+
+def bench_event_simulation(
+		machines: int = 100,
+		days: float = 7,
+		customers_per_hour: float = 20
+) -> Dict[str, float]:
+	"""
+	=> Simulates Poisson customers, a maintenance visit every 2 days and a daily revenue reset on
+	machines built like build_concurrent_machine
+
+	:param machines:
+	:param days:  # simulated duration
+	:param customers_per_hour:  # mean arrival rate at each machine
+	:return: dictionary of results: wall seconds, simulated days per wall second and the totals
+	"""
+	simulation = EventSimulation(seed=1)
+	for _ in range(machines):
+		vmo = build_concurrent_machine(capacity=2_000, thread_safe=False)
+		vmo.accepted_coins.add_accepted_coins('dollar', 1.0)
+		vmo.accepted_coins.add_accepted_coins('dime', 0.10)
+		machine = simulation.add_machine(vmo, exponential_arrivals(customers_per_hour))
+		simulation.schedule_maintenance(machine, 2 * 24 * 3600)
+		simulation.schedule_revenue_reset(machine, 24 * 3600)
+	start = time.perf_counter()
+	events = simulation.run(days * 24 * 3600)
+	elapsed = time.perf_counter() - start
+	return {
+		'machines': machines,
+		'days': days,
+		'events': events,
+		'seconds': elapsed,
+		'machine_days_per_second': machines * days / elapsed,
+		**simulation.get_totals(),
+	}
+
+
+def bench_monte_carlo(
+		configurations: int = 100,
+		replications: int = 10_000,
+		days: float = 1,
+		customers_per_hour: float = 40
+) -> Dict[str, float]:
+	"""
+	=> Sweeps the capacities of the containers of build_concurrent_machine from 500 up by 50
+
+	:param configurations:  # configurations of the sweep
+	:param replications:  # demand scenarios per configuration
+	:param days:  # refill period
+	:param customers_per_hour:
+	:return: dictionary of results: seconds, replications per second and the configuration
+	with the smallest revenue at risk
+	"""
+	from vending_machine_monte_carlo import MonteCarloAnalysis  # numpy is optional
+
+	template = build_concurrent_machine(thread_safe=False)
+	analysis = MonteCarloAnalysis(template.drinks_menu, template.materials_dispenser)
+	sweep = [
+		{'capacities': {material: 500 + 50 * index for material in analysis.materials}}
+		for index in range(configurations)
+	]
+	start = time.perf_counter()
+	results = analysis.run(sweep, replications, days * 24 * 3600, customers_per_hour)
+	elapsed = time.perf_counter() - start
+	best = min(range(configurations), key=lambda index: results[index]['revenue_at_risk'])
+	return {
+		'configurations': configurations,
+		'replications': replications,
+		'seconds': elapsed,
+		'replications_per_second': configurations * replications / elapsed,
+		'first_stockout_probability': results[0]['stockout_probability'],
+		'best_capacity': 500 + 50 * best,
+	}
+
+
+def bench_provisioning(drinks: int = 5_000, materials: int = 40) -> Dict[str, float]:
+	"""
+	=> Provisions a machine from a catalog of drinks (3 materials each) three ways: per item API
+	calls, the bulk loader (parse, validate, build) and the compiled cache of the bulk loader
+
+	:param drinks:  # drinks of the catalog
+	:param materials:  # containers of the catalog
+	:return: dictionary of results: api, bulk and cached seconds
+	"""
+	catalog = {
+		'containers': {f'material-{index}': 10_000 for index in range(materials)},
+		'drinks': {
+			f'drink-{index}': {
+				'price': 1.0 + index % 40 / 10,
+				'command': f'/{index}',
+				'bom': {f'material-{(index + offset) % materials}': 5 + offset for offset in range(3)}
+			}
+			for index in range(drinks)
+		},
+		'coins': {'dollar': 1.0, 'quarter': 0.25, 'dime': 0.10, 'nickel': 0.05},
+	}
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'catalog.json')
+		with open(path, 'w', encoding='utf-8') as stream:
+			json.dump(catalog, stream)
+
+		start = time.perf_counter()
+		with open(path, encoding='utf-8') as stream:
+			items = json.load(stream)
+		vmo = VendingMachineOperations()
+		for material, capacity in items['containers'].items():
+			vmo.materials_dispenser.allocate_material_container(material, capacity)
+		for drink, offer in items['drinks'].items():
+			vmo.drinks_menu.add_drink(drink, offer['price'], offer['bom'], offer['command'])
+		for coin, value in items['coins'].items():
+			vmo.accepted_coins.add_accepted_coins(coin, value)
+		api_seconds = time.perf_counter() - start
+
+		start = time.perf_counter()
+		load_catalog(path)
+		bulk_seconds = time.perf_counter() - start
+
+		cache = os.path.join(directory, 'cache')
+		load_catalog(path, cache)
+		start = time.perf_counter()
+		load_catalog(path, cache)
+		cached_seconds = time.perf_counter() - start
+	return {
+		'drinks': drinks,
+		'api_seconds': api_seconds,
+		'bulk_seconds': bulk_seconds,
+		'cached_seconds': cached_seconds,
+	}
+
+
+def bench_reports(machines: int = 10_000, containers: int = 12, changed: float = 0.05) -> Dict[str, float]:
+	"""
+	=> Reports the containers of a fleet three ways: report_containers_levels of every machine
+	(printed text), a full CSV report and a delta CSV report after changed of the machines served
+	one order - the reports are written to a temporary file
+
+	:param machines:  # machines of the fleet
+	:param containers:  # containers per machine
+	:param changed:  # share of the machines whose containers changed before the delta report
+	:return: dictionary of results: text, full and delta seconds, rows of the delta report
+	"""
+	dispensers = []
+	reporter = InventoryReporter()
+	for machine in range(machines):
+		vmo = VendingMachineOperations()
+		for index in range(containers):
+			vmo.materials_dispenser.allocate_material_container(f'material-{index}', 10_000)
+			vmo.materials_dispenser.refill_material_container(f'material-{index}')
+		dispensers.append(vmo.materials_dispenser)
+		reporter.add_machine(f'machine-{machine}', vmo.materials_dispenser)
+	with tempfile.TemporaryFile('w+', encoding='utf-8') as stream:
+		start = time.perf_counter()
+		with contextlib.redirect_stdout(stream):
+			for dispenser in dispensers:
+				DrinksBusinessMaintenance(dispenser).report_containers_levels()
+		text_seconds = time.perf_counter() - start
+
+		start = time.perf_counter()
+		reporter.write_report(stream)
+		full_seconds = time.perf_counter() - start
+
+		for dispenser in dispensers[:int(machines * changed)]:
+			dispenser.takeout_materials({'material-0': 10, 'material-1': 5})
+		start = time.perf_counter()
+		rows = reporter.write_report(stream, delta=True)
+		delta_seconds = time.perf_counter() - start
+	return {
+		'machines': machines,
+		'text_seconds': text_seconds,
+		'full_seconds': full_seconds,
+		'delta_seconds': delta_seconds,
+		'delta_rows': rows,
+	}
+
+
+def bench_menu_render(drinks: int = 1_000, displays: int = 1_000) -> Dict[str, float]:
+	"""
+	=> Displays the menu of a machine between orders: the lines formatted from get_menu_offers at
+	each display (as ask_user_drink did) vs the text cached by render_menu, which is only rendered
+	again when a drink goes out of stock or the menu changes
+
+	:param drinks:  # drinks of the menu, all available
+	:param displays:  # menu displays, one order served between two displays
+	:return: dictionary of results: microseconds per display of both ways
+	"""
+	vmo = VendingMachineOperations()
+	# one container per drink: serving an order reindexes the servings of one drink only
+	for index in range(drinks):
+		vmo.materials_dispenser.allocate_material_container(f'material-{index}', 10 ** 9)
+		vmo.materials_dispenser.refill_material_container(f'material-{index}')
+		vmo.drinks_menu.add_drink(f'drink-{index}', 1.0 + index % 40 / 10, {f'material-{index}': 1}, f'/{index}')
+
+	start = time.perf_counter()
+	for _ in range(displays):
+		''.join(
+			f"Want {drink} for {drink_price} US$?then type: {drink_command}\n"
+			for drink, drink_price, drink_command in vmo.get_menu_offers()
+		)
+		vmo.make_drink('drink-0')
+	formatted_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for _ in range(displays):
+		vmo.render_menu()
+		vmo.make_drink('drink-0')
+	cached_seconds = time.perf_counter() - start
+	return {
+		'drinks': drinks,
+		'formatted_microseconds': formatted_seconds / displays * 1e6,
+		'cached_microseconds': cached_seconds / displays * 1e6,
+	}
+
+
+def bench_holds(outstanding: int = 100_000, duration: float = 120.0) -> Dict[str, float]:
+	"""
+	=> Places outstanding holds on a drink bom (deadlines spread over duration seconds of simulated
+	time), commits one in two then lets the others expire while the clock advances by ticks of the
+	timing wheel: the cost per hold must not grow with the number of holds outstanding
+
+	:param outstanding:  # holds placed before any of them ends
+	:param duration:  # longest life of a hold in seconds
+	:return: dictionary of results: microseconds per reserve / commit / expiry
+	"""
+	dispenser = MaterialsContainersDispenser()
+	bom = {'coffee': 8, 'milk': 100, 'water': 150}
+	for material in bom:
+		dispenser.allocate_material_container(material, 10 ** 12)
+		dispenser.refill_material_container(material)
+	now = [1_000_000.0]
+	previous_clock = set_clock(lambda: now[0])
+	try:
+		randomizer = random.Random(0)
+		durations = [randomizer.uniform(1, duration) for _ in range(outstanding)]
+		start = time.perf_counter()
+		holds = [dispenser.reserve_materials(bom, hold_duration) for hold_duration in durations]
+		reserve_seconds = time.perf_counter() - start
+
+		start = time.perf_counter()
+		for hold in holds[::2]:
+			dispenser.commit_hold(hold)
+		commit_seconds = time.perf_counter() - start
+
+		start = time.perf_counter()
+		expired = 0
+		end = now[0] + duration + 1
+		while now[0] < end:
+			now[0] += dispenser.holds_wheel.tick
+			expired += dispenser.expire_holds()
+		expire_seconds = time.perf_counter() - start
+	finally:
+		set_clock(previous_clock)
+	return {
+		'outstanding': outstanding,
+		'reserve_microseconds': reserve_seconds / outstanding * 1e6,
+		'commit_microseconds': commit_seconds / len(holds[::2]) * 1e6,
+		'expire_microseconds': expire_seconds / max(expired, 1) * 1e6,
+		'expired': expired,
+		'left': len(dispenser.holds),
+	}
+
+
+def bench_fleet_index(
+		machines: int = 100_000,
+		drinks: int = 10,
+		queries: int = 1_000,
+		nearest: int = 5
+) -> Dict[str, float]:
+	"""
+	=> Fleet of machines sharing a frozen menu, spread over a square of about 10 machines per cell
+	of the index, with random container volumes so that each drink is out of stock in some of
+	them: "which machines can serve the drink" by asking every machine vs the inverted index, the
+	nearest machines serving it, and the cost of the index listeners on the order path
+
+	:param machines:  # size of the fleet
+	:param drinks:  # drinks of the shared menu (2 materials each out of 8)
+	:param queries:  # queries of each kind
+	:param nearest:  # machines wanted by the nearest queries
+	:return: dictionary of results: microseconds per query and per order
+	"""
+	randomizer = random.Random(0)
+	drinks_menu = DrinksMenu()
+	for index in range(drinks):
+		bom = {f'material-{index % 8}': 10, f'material-{(index + 3) % 8}': 5}
+		drinks_menu.add_drink(f'drink-{index}', 1.0 + index / 10, bom, f'/{index}')
+	drinks_menu.freeze()
+	side = (machines / 10) ** 0.5
+	fleet_index = FleetAvailabilityIndex(cell_size=1.0)
+	fleet = []
+	for number in range(machines):
+		vmo = VendingMachineOperations(compact_containers=True, drinks_menu=drinks_menu)
+		dispenser = vmo.materials_dispenser
+		dispenser.materials_containers = {
+			f'material-{column}': {'capacity': 100, 'volume': randomizer.choice((0, 5, 10, 100))}
+			for column in range(8)
+		}
+		dispenser.rebuild_indexes()
+		vmo.rebuild_servings_index()
+		fleet_index.add_machine(f'machine-{number}', vmo, (randomizer.uniform(0, side), randomizer.uniform(0, side)))
+		fleet.append((f'machine-{number}', vmo))
+	drinks_names = drinks_menu.get_all_drinks()
+	asked = [randomizer.choice(drinks_names) for _ in range(queries)]
+	locations = [(randomizer.uniform(0, side), randomizer.uniform(0, side)) for _ in range(queries)]
+
+	scanned = asked[:max(1, queries // 100)]  # each scan visits the whole fleet
+	start = time.perf_counter()
+	for drink in scanned:
+		[name for name, vmo in fleet if vmo.check_drink_availability(drink)]
+	scan_seconds = (time.perf_counter() - start) / len(scanned)
+
+	start = time.perf_counter()
+	for drink in asked:
+		fleet_index.get_drink_machines(drink)
+	lookup_seconds = (time.perf_counter() - start) / queries
+
+	start = time.perf_counter()
+	for drink, location in zip(asked, locations):
+		fleet_index.nearest_machines(drink, location, nearest)
+	nearest_seconds = (time.perf_counter() - start) / queries
+
+	served = [vmo for _, vmo in randomizer.sample(fleet, min(queries, machines))]
+	start = time.perf_counter()
+	for vmo, drink in zip(served, asked):
+		vmo.make_drink(drink)
+	order_seconds = (time.perf_counter() - start) / len(served)
+	return {
+		'machines': machines,
+		'scan_microseconds': scan_seconds * 1e6,
+		'lookup_microseconds': lookup_seconds * 1e6,
+		'nearest_microseconds': nearest_seconds * 1e6,
+		'order_microseconds': order_seconds * 1e6,
+		'serving_machines': fleet_index.count_drink_machines(drinks_names[0]),
+	}
+
+
+def build_sized_machine(size: int) -> VendingMachineOperations:
+	"""
+	=> Builds a machine of size materials and size drinks, drink i uses the materials i, i + 1 and
+	i + 2 (modulo size) so every container is shared by 3 drinks whatever the size
+
+	:param size:  # number of materials and of drinks
+	:return: VendingMachineOperations with filled containers that never run out during the suite
+	"""
+	vmo = VendingMachineOperations()
+	dispenser = vmo.materials_dispenser
+	for index in range(size):
+		dispenser.allocate_material_container(f'material-{index}', 10 ** 12)
+		dispenser.refill_material_container(f'material-{index}')
+	for index in range(size):
+		bom = {f'material-{(index + offset) % size}': 5 + offset for offset in range(3)}
+		vmo.drinks_menu.add_drink(f'drink-{index}', 1.0 + index % 40 / 10, bom, f'/{index}')
+	for coin, value in (('dollar', 1.0), ('quarter', 0.25), ('dime', 0.10), ('nickel', 0.05)):
+		vmo.accepted_coins.add_accepted_coins(coin, value)
+	return vmo
+
+
+def bench_order_path(size: int = 100, operations: int = 1_000, repeat: int = 3, seed: int = 0) -> Dict[str, float]:
+	"""
+	=> Times each of ORDER_PATH_OPERATIONS on a machine of build_sized_machine(size): the same
+	seeded random drinks are replayed by every operation, the best of repeat runs is kept
+
+	:param size:  # materials and drinks of the machine (10 to 10k)
+	:param operations:  # calls per run (refill_all_containers: operations // 100 calls)
+	:param repeat:  # runs per operation
+	:param seed:  # seed of the drinks ordered
+	:return: {operation: nanoseconds per call}
+	"""
+	vmo = build_sized_machine(size)
+	randomizer = random.Random(seed)
+	drinks = [f'drink-{randomizer.randrange(size)}' for _ in range(operations)]
+	materials = [f'material-{randomizer.randrange(size)}' for _ in range(operations)]
+	commands = [vmo.drinks_menu.get_drink_command(drink) for drink in drinks]
+	payments = exact_payments(vmo)
+	maintenance = DrinksBusinessMaintenance(vmo.materials_dispenser)
+
+	def replay_orders():
+		for drink in drinks:
+			vmo.process_order(drink, payments[drink])
+
+	def ask_user_drinks():
+		with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+			with mock.patch('builtins.input', side_effect=commands):
+				for _ in commands:
+					vmo.ask_user_drink()
+
+	runs = {
+		'check_drink_availability': (lambda: [vmo.check_drink_availability(drink) for drink in drinks], operations),
+		'ask_user_drink': (ask_user_drinks, operations),
+		'make_drink': (lambda: [vmo.make_drink(drink) for drink in drinks], operations),
+		'takeout_material_container': (
+			lambda: [vmo.materials_dispenser.takeout_material_container(material, 1) for material in materials],
+			operations
+		),
+		'refill_all_containers': (
+			lambda: [maintenance.refill_all_containers() for _ in range(max(1, operations // 100))],
+			max(1, operations // 100)
+		),
+		'add_revenue': (
+			lambda: [vmo.financials.add_revenue(1.5, drink, 150, 0) for drink in drinks], operations
+		),
+		'order_replay': (replay_orders, operations),
+	}
+	results = {}
+	for operation in ORDER_PATH_OPERATIONS:
+		run, calls = runs[operation]
+		best = float('inf')
+		for _ in range(repeat):
+			gc.collect()
+			start = time.perf_counter()
+			run()
+			best = min(best, time.perf_counter() - start)
+		results[operation] = best / calls * 1e9
+	return results
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.10) -> List[Dict[str, object]]:
+	"""
+	=> Compares the operations timed in two suite runs, sizes and operations missing from one of
+	the runs are skipped
+
+	:param baseline:  # results of the reference run (JSON of the suite subcommand)
+	:param current:  # results of the run to check
+	:param threshold:  # relative slowdown flagged as a regression, 0.10 = 10% slower
+	:return: list of {size, operation, baseline, current, ratio, regression} (ratio = current / baseline)
+	"""
+	rows = []
+	for size, operations in current['results'].items():
+		for operation, nanoseconds in operations.items():
+			reference = baseline['results'].get(size, {}).get(operation)
+			if reference is None:
+				continue
+			ratio = nanoseconds / reference if reference else float('inf')
+			rows.append({
+				'size': int(size),
+				'operation': operation,
+				'baseline': reference,
+				'current': nanoseconds,
+				'ratio': ratio,
+				'regression': ratio > 1 + threshold,
+			})
+	return rows
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+	subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+	concurrent = subparsers.add_parser('concurrent', help='thread pool stress test of one machine')
+	concurrent.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+	concurrent.add_argument('--orders', type=int, default=20_000)
+	concurrent.add_argument('--groups', type=int, default=4)
+	concurrent.add_argument('--drinks-per-group', type=int, default=4)
+	concurrent.add_argument('--capacity', type=int, default=10_000)
+	concurrent.add_argument('--unsafe', action='store_true', help='disable the containers locks')
+
+	snapshot = subparsers.add_parser('snapshot', help='fleet cold start: API build vs snapshot restore')
+	snapshot.add_argument('--machines', type=int, default=1_000)
+	snapshot.add_argument('--groups', type=int, nargs='+', default=[4, 16, 64])
+	snapshot.add_argument('--drinks-per-group', type=int, default=4)
+	snapshot.add_argument('--capacity', type=int, default=10_000)
+
+	journal = subparsers.add_parser(
+		'journal', help='order throughput: journal off, fsync per record, group commit'
+	)
+	journal.add_argument('--orders', type=int, default=5_000)
+	journal.add_argument('--durability', nargs='+', default=['off', DURABILITY_FSYNC, DURABILITY_GROUP])
+	journal.add_argument('--threads', type=int, default=1)
+
+	memory = subparsers.add_parser('memory', help='memory per machine: dictionary vs array containers')
+	memory.add_argument('--machines', type=int, default=10_000)
+	memory.add_argument('--containers', type=int, default=12)
+
+	catalog = subparsers.add_parser('catalog', help='memory per machine: private vs shared catalogs')
+	catalog.add_argument('--machines', type=int, nargs='+', default=[1_000, 10_000])
+	catalog.add_argument('--drinks', type=int, default=50)
+
+	fleet = subparsers.add_parser('fleet', help='fleet of machines sharded over worker processes')
+	fleet.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+	fleet.add_argument('--machines', type=int, default=10_000)
+	fleet.add_argument('--orders', type=int, default=200_000)
+
+	simulation = subparsers.add_parser('simulation', help='discrete-event simulation of days of traffic')
+	simulation.add_argument('--machines', type=int, default=100)
+	simulation.add_argument('--days', type=float, default=7)
+	simulation.add_argument('--customers-per-hour', type=float, default=20)
+
+	monte_carlo = subparsers.add_parser('montecarlo', help='Monte Carlo sweep of containers capacities')
+	monte_carlo.add_argument('--configurations', type=int, default=100)
+	monte_carlo.add_argument('--replications', type=int, default=10_000)
+	monte_carlo.add_argument('--days', type=float, default=1)
+	monte_carlo.add_argument('--customers-per-hour', type=float, default=40)
+
+	provisioning = subparsers.add_parser('provisioning', help='API calls vs bulk catalog loader vs cache')
+	provisioning.add_argument('--drinks', type=int, nargs='+', default=[1_000, 5_000])
+	provisioning.add_argument('--materials', type=int, default=40)
+
+	reports = subparsers.add_parser('reports', help='inventory report: text vs streamed CSV full / delta')
+	reports.add_argument('--machines', type=int, default=10_000)
+	reports.add_argument('--containers', type=int, default=12)
+	reports.add_argument('--changed', type=float, default=0.05)
+
+	menu = subparsers.add_parser('menu', help='menu display: formatted per display vs cached render_menu')
+	menu.add_argument('--drinks', type=int, nargs='+', default=[10, 100, 1_000])
+	menu.add_argument('--displays', type=int, default=1_000)
+
+	holds = subparsers.add_parser('holds', help='ingredients holds: reserve / commit / expiry per hold')
+	holds.add_argument('--outstanding', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+	holds.add_argument('--duration', type=float, default=120.0)
+
+	fleet_index = subparsers.add_parser('fleetindex', help='routing queries: scan of the fleet vs inverted index')
+	fleet_index.add_argument('--machines', type=int, nargs='+', default=[10_000, 100_000])
+	fleet_index.add_argument('--drinks', type=int, default=10)
+	fleet_index.add_argument('--queries', type=int, default=1_000)
+	fleet_index.add_argument('--nearest', type=int, default=5)
+
+	suite = subparsers.add_parser('suite', help='order path operations at several machine sizes, JSON results')
+	suite.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1_000, 10_000])
+	suite.add_argument('--operations', type=int, default=1_000)
+	suite.add_argument('--repeat', type=int, default=3)
+	suite.add_argument('--seed', type=int, default=0)
+	suite.add_argument('--output', help='JSON file of the results, to compare with another run')
+	suite.add_argument('--metrics', help='runs with the metrics on and writes them to this Prometheus text file')
+	suite.add_argument('--trace', help='runs with the order tracing on and writes the spans to this Chrome trace file')
+	suite.add_argument('--trace-sample-rate', type=float, default=0.01)
+
+	compare = subparsers.add_parser('compare', help='compares two suite results and flags the regressions')
+	compare.add_argument('baseline', help='JSON results of the reference run')
+	compare.add_argument('current', help='JSON results of the run to check')
+	compare.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged, 0.10 = 10%%')
+
+	args = parser.parse_args(argv)
+	if args.benchmark == 'concurrent':
+		for threads in args.threads:
+			result = bench_concurrent_orders(
+				threads, args.orders, args.groups, args.drinks_per_group, args.capacity, not args.unsafe
+			)
+			print(
+				f"threads={result['threads']:>3} orders/s={result['orders_per_second']:>10.0f}"
+				f" served={result['served']:>7} rejected={result['rejected']:>7}"
+				f" negative_volumes={result['negative_volumes']} oversold={result['oversold']}"
+			)
+	elif args.benchmark == 'snapshot':
+		for groups in args.groups:
+			result = bench_snapshot_restore(args.machines, groups, args.drinks_per_group, args.capacity)
+			print(
+				f"groups={groups:>4} machines={result['machines']:>6} build={result['build_seconds']:>8.3f}s"
+				f" restore={result['restore_seconds']:>8.3f}s speedup={result['speedup']:>5.1f}x"
+				f" snapshot_bytes={result['snapshot_bytes']}"
+			)
+	elif args.benchmark == 'journal':
+		for durability in args.durability:
+			result = bench_journal(args.orders, durability, args.threads)
+			print(
+				f"durability={result['durability']:>6} orders/s={result['orders_per_second']:>10.0f}"
+				f" served={result['served']:>7} records={result['records']:>7} fsyncs={result['fsyncs']:>7}"
+				f" recovered={result['recovered']}"
+			)
+	elif args.benchmark == 'memory':
+		for compact in (False, True):
+			# a fresh process per backend: freed memory is not always given back to the system
+			with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+				result = pool.submit(bench_containers_memory, args.machines, args.containers, compact).result()
+			print(
+				f"backend={'array' if compact else 'dict':>5} machines={result['machines']:>7}"
+				f" containers={result['containers']:>3} bytes/machine={result['bytes_per_machine']:>8.0f}"
+				f" rss/machine={result['rss_bytes_per_machine']:>8.0f}"
+			)
+	elif args.benchmark == 'catalog':
+		for machines in args.machines:
+			for shared in (False, True):
+				result = bench_catalog_memory(machines, args.drinks, shared)
+				print(
+					f"catalogs={'shared' if shared else 'private':>7} machines={result['machines']:>7}"
+					f" drinks={result['drinks']:>4} bytes/machine={result['bytes_per_machine']:>8.0f}"
+				)
+	elif args.benchmark == 'fleet':
+		for workers in args.workers:
+			result = bench_fleet(args.machines, args.orders, workers)
+			print(
+				f"workers={result['workers']:>3} machines={result['machines']:>7}"
+				f" orders/s={result['orders_per_second']:>10.0f} served={result['served']:>8}"
+				f" revenue={result['revenue']:>12.2f}"
+			)
+	elif args.benchmark == 'simulation':
+		result = bench_event_simulation(args.machines, args.days, args.customers_per_hour)
+		print(
+			f"machines={result['machines']:>6} days={result['days']:>5} events={result['events']:>9}"
+			f" seconds={result['seconds']:>7.2f} machine_days/s={result['machine_days_per_second']:>8.1f}"
+			f" served={result['served']:>8} lost_sales={result['lost_sales']:>7} stockouts={result['stockouts']:>6}"
+		)
+	elif args.benchmark == 'montecarlo':
+		result = bench_monte_carlo(args.configurations, args.replications, args.days, args.customers_per_hour)
+		print(
+			f"configurations={result['configurations']:>5} replications={result['replications']:>7}"
+			f" seconds={result['seconds']:>7.2f} replications/s={result['replications_per_second']:>9.0f}"
+			f" best_capacity={result['best_capacity']}"
+		)
+	elif args.benchmark == 'provisioning':
+		for drinks in args.drinks:
+			result = bench_provisioning(drinks, args.materials)
+			print(
+				f"drinks={result['drinks']:>7} api={result['api_seconds']:>8.4f}s"
+				f" bulk={result['bulk_seconds']:>8.4f}s cached={result['cached_seconds']:>8.4f}s"
+			)
+	elif args.benchmark == 'reports':
+		result = bench_reports(args.machines, args.containers, args.changed)
+		print(
+			f"machines={result['machines']:>7} text={result['text_seconds']:>8.3f}s"
+			f" full_csv={result['full_seconds']:>8.3f}s delta_csv={result['delta_seconds']:>8.3f}s"
+			f" delta_rows={result['delta_rows']:>7}"
+		)
+	elif args.benchmark == 'menu':
+		for drinks in args.drinks:
+			result = bench_menu_render(drinks, args.displays)
+			print(
+				f"drinks={result['drinks']:>7} formatted={result['formatted_microseconds']:>9.1f}us"
+				f" cached={result['cached_microseconds']:>9.1f}us"
+			)
+	elif args.benchmark == 'holds':
+		for outstanding in args.outstanding:
+			result = bench_holds(outstanding, args.duration)
+			print(
+				f"outstanding={result['outstanding']:>8} reserve={result['reserve_microseconds']:>6.2f}us"
+				f" commit={result['commit_microseconds']:>6.2f}us expire={result['expire_microseconds']:>6.2f}us"
+				f" expired={result['expired']:>8} left={result['left']}"
+			)
+	elif args.benchmark == 'fleetindex':
+		for machines in args.machines:
+			result = bench_fleet_index(machines, args.drinks, args.queries, args.nearest)
+			print(
+				f"machines={result['machines']:>7} scan={result['scan_microseconds']:>10.1f}us"
+				f" lookup={result['lookup_microseconds']:>6.2f}us nearest={result['nearest_microseconds']:>7.1f}us"
+				f" order={result['order_microseconds']:>6.1f}us serving={result['serving_machines']:>7}"
+			)
+	elif args.benchmark == 'suite':
+		results = {
+			'version': SUITE_RESULTS_VERSION,
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'created': time.time(),
+			'operations': args.operations,
+			'repeat': args.repeat,
+			'seed': args.seed,
+			'metrics': bool(args.metrics),
+			'trace_sample_rate': args.trace_sample_rate if args.trace else 0,
+			'results': {},
+		}
+		registry = enable_metrics() if args.metrics else None
+		if args.trace:
+			enable_tracing(args.trace, args.trace_sample_rate)
+		for size in args.sizes:
+			timings = bench_order_path(size, args.operations, args.repeat, args.seed)
+			results['results'][str(size)] = timings
+			for operation, nanoseconds in timings.items():
+				print(f"size={size:>6} operation={operation:<28} ns/op={nanoseconds:>12.0f}")
+		# the wrappers are removed in the reverse order they were installed
+		if args.trace:
+			disable_tracing()
+		if registry is not None:
+			disable_metrics()
+			registry.write_prometheus(args.metrics)
+		if args.output:
+			with open(args.output, 'w', encoding='utf-8') as stream:
+				json.dump(results, stream, indent=1)
+	elif args.benchmark == 'compare':
+		with open(args.baseline, encoding='utf-8') as stream:
+			baseline = json.load(stream)
+		with open(args.current, encoding='utf-8') as stream:
+			current = json.load(stream)
+		rows = compare_results(baseline, current, args.threshold)
+		for row in rows:
+			print(
+				f"size={row['size']:>6} operation={row['operation']:<28} baseline={row['baseline']:>12.0f}"
+				f" current={row['current']:>12.0f} ratio={row['ratio']:>6.2f}"
+				f"{' REGRESSION' if row['regression'] else ''}"
+			)
+		# non-zero exit status when a regression is flagged, for continuous integration
+		return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
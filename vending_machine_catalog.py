@@ -0,0 +1,343 @@
+"""
+Vending Machine Catalog
+=> Bulk declarative loader of the containers, drinks menu and coins of a machine from JSON or CSV
+catalogs: the catalog is parsed and validated as a whole (referential integrity included), the
+machine is then built in bulk and its indexes rebuilt once instead of one
+allocate_material_container / add_drink / add_accepted_coins call per item
+
+The validated and compiled machine is cached on disk as a snapshot (vending_machine_snapshot)
+named after a content hash of the catalog: later startups with the same catalog memory-map the
+snapshot and skip parsing and validation
+
+It consists of the following elements:
+
+### catalog sources:
+	JSON file:
+		{"containers": {material: {"capacity": number, "volume": number} or capacity},
+		"drinks": {drink: {"price": number, "command": keystrokes, "bom": {material: volume}}},
+		"coins": {coin: {"value": number, "count": number of coins} or value}}
+	directory of CSV files (with a header line, every file optional):
+		containers.csv: material,capacity[,volume]
+		drinks.csv: drink,price,command,material,volume   # one line per bom material
+		coins.csv: coin,value[,count]
+
+### class CatalogValidationError(ValueError):
+	=> Raised with the list of all the problems found in a catalog (errors attribute)
+
+### def parse_catalog(source):
+	=> Reads a JSON file or a CSV directory into a catalog dictionary (see normalized catalog)
+
+### def validate_catalog(catalog):
+	=> Checks values, duplicates and referential integrity, raises CatalogValidationError
+
+### def build_machine(catalog, thread_safe, compact_containers, command_trie):
+	=> Builds a VendingMachineOperations from a validated catalog in bulk
+
+### def catalog_digest(source, command_trie):
+	=> Content hash of a catalog source, the key of the compiled cache
+
+### def load_catalog(source, cache_directory, thread_safe, compact_containers, command_trie):
+	=> Parses, validates and builds a machine, or loads it from the compiled cache
+
+### normalized catalog (dictionary):
+	{'containers': {material: {'capacity': number, 'volume': number}},
+	'drinks': {drink: {'price': number, 'bom': {material: volume}, 'command': keystrokes}},
+	'coins': {coin: {'value': number, 'count': number of coins}},
+	'duplicates': ['section name', ...]}   # names defined twice in the source
+"""
+
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, List, Union
+
+from vending_machine_simulator import DrinksMenu, VendingMachineOperations, to_cents
+from vending_machine_snapshot import load_snapshot, save_snapshot
+
+# part of the cache key: a new version invalidates the compiled catalogs of the previous ones
+CATALOG_CACHE_VERSION = 1
+
+CSV_FILES = ('containers.csv', 'drinks.csv', 'coins.csv')
+
+
+class CatalogValidationError(ValueError):
+	"""
+	=> A catalog cannot be loaded: errors lists every problem found (not only the first one)
+	"""
+
+	def __init__(self, errors: List[str]) -> None:
+		self.errors = errors
+		shown = '; '.join(errors[:5])
+		more = f' (and {len(errors) - 5} more)' if len(errors) > 5 else ''
+		super().__init__(f'invalid catalog: {shown}{more}')
+
+
+def parse_number(text: str) -> Union[int, float, str]:
+	"""
+	Number of a CSV cell (int when it is written as an integer), the text itself if it is not a number
+	"""
+	text = text.strip()
+	try:
+		return int(text)
+	except ValueError:
+		try:
+			return float(text)
+		except ValueError:
+			return text
+
+
+def parse_json_catalog(path: str) -> dict:
+	"""
+	Reads a JSON catalog, the names defined twice in an object are reported in 'duplicates'
+	"""
+	duplicates: List[str] = []
+
+	def unique_pairs(pairs: list) -> dict:
+		result = dict(pairs)
+		if len(result) != len(pairs):
+			seen = set()
+			for key, _ in pairs:
+				if key in seen:
+					duplicates.append(key)
+				seen.add(key)
+		return result
+
+	with open(path, encoding='utf-8') as stream:
+		source = json.load(stream, object_pairs_hook=unique_pairs)
+	if not isinstance(source, dict):
+		raise CatalogValidationError(['a JSON catalog is an object'])
+	sections = ('containers', 'drinks', 'coins')
+	errors = [f'{name!r} is not an object' for name in sections if not isinstance(source.get(name, {}), dict)]
+	if errors:
+		raise CatalogValidationError(errors)
+	containers, coins = {}, {}
+	for material, container in source.get('containers', {}).items():
+		if not isinstance(container, dict):
+			container = {'capacity': container}
+		containers[material] = {'capacity': container.get('capacity'), 'volume': container.get('volume', 0)}
+	for coin, value in source.get('coins', {}).items():
+		if not isinstance(value, dict):
+			value = {'value': value}
+		coins[coin] = {'value': value.get('value'), 'count': value.get('count', 0)}
+	drinks = {
+		drink: {'price': offer.get('price'), 'bom': offer.get('bom', {}), 'command': offer.get('command')}
+		if isinstance(offer, dict) else {'price': None, 'bom': {}, 'command': None}
+		for drink, offer in source.get('drinks', {}).items()
+	}
+	return {'containers': containers, 'drinks': drinks, 'coins': coins, 'duplicates': duplicates}
+
+
+def parse_csv_catalog(directory: str) -> dict:
+	"""
+	Reads the CSV files of a catalog directory, the names defined twice are reported in 'duplicates'
+	"""
+	duplicates: List[str] = []
+
+	def read_rows(name: str) -> List[Dict[str, str]]:
+		path = os.path.join(directory, name)
+		if not os.path.exists(path):
+			return []
+		with open(path, newline='', encoding='utf-8') as stream:
+			return [
+				{key.strip(): (value or '').strip() for key, value in row.items() if key is not None}
+				for row in csv.DictReader(stream)
+			]
+
+	containers = {}
+	for row in read_rows('containers.csv'):
+		material = row.get('material', '')
+		if material in containers:
+			duplicates.append(material)
+		containers[material] = {
+			'capacity': parse_number(row.get('capacity', '')),
+			'volume': parse_number(row.get('volume') or '0')
+		}
+	drinks = {}
+	for row in read_rows('drinks.csv'):
+		drink = row.get('drink', '')
+		offer = {'price': parse_number(row.get('price', '')), 'bom': {}, 'command': row.get('command')}
+		known_offer = drinks.setdefault(drink, offer)
+		if known_offer['price'] != offer['price'] or known_offer['command'] != offer['command']:
+			duplicates.append(drink)
+		material = row.get('material', '')
+		if material:
+			if material in known_offer['bom']:
+				duplicates.append(f'{drink}/{material}')
+			known_offer['bom'][material] = parse_number(row.get('volume', ''))
+	coins = {}
+	for row in read_rows('coins.csv'):
+		coin = row.get('coin', '')
+		if coin in coins:
+			duplicates.append(coin)
+		coins[coin] = {'value': parse_number(row.get('value', '')), 'count': parse_number(row.get('count') or '0')}
+	return {'containers': containers, 'drinks': drinks, 'coins': coins, 'duplicates': duplicates}
+
+
+def parse_catalog(source: str) -> dict:
+	"""
+	=> Reads a catalog without validating it
+	:param source:  # path of a JSON file or of a directory of CSV files
+	:return: normalized catalog dictionary
+	:raise CatalogValidationError: if the JSON is malformed
+	"""
+	if os.path.isdir(source):
+		return parse_csv_catalog(source)
+	try:
+		return parse_json_catalog(source)
+	except json.JSONDecodeError as error:
+		raise CatalogValidationError([f'malformed JSON: {error}']) from error
+
+
+def is_number(value) -> bool:
+	return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def validate_catalog(catalog: dict):
+	"""
+	=> Checks a whole catalog: names, numbers, duplicates, every bom material has a container and
+	every command is unique
+	:param catalog:  # normalized catalog (parse_catalog)
+	:raise CatalogValidationError: with all the problems found
+	"""
+	errors = [f'{name!r} is defined more than once' for name in catalog.get('duplicates', [])]
+
+	def check_name(kind: str, name) -> bool:
+		if not isinstance(name, str) or not name or '\0' in name:
+			errors.append(f'invalid {kind} name {name!r}')
+			return False
+		return True
+
+	containers = catalog['containers']
+	for material, container in containers.items():
+		if check_name('material', material):
+			capacity, volume = container['capacity'], container['volume']
+			if not is_number(capacity) or capacity < 0:
+				errors.append(f'container {material!r}: invalid capacity {capacity!r}')
+			elif not is_number(volume) or not 0 <= volume <= capacity:
+				errors.append(f'container {material!r}: invalid volume {volume!r}')
+
+	commands: Dict[str, str] = {}
+	for drink, offer in catalog['drinks'].items():
+		if not check_name('drink', drink):
+			continue
+		if not is_number(offer['price']) or offer['price'] < 0:
+			errors.append(f'drink {drink!r}: invalid price {offer["price"]!r}')
+		command = offer['command']
+		if check_name('command', command):
+			if command in commands:
+				errors.append(f'drink {drink!r}: command {command!r} already orders {commands[command]!r}')
+			else:
+				commands[command] = drink
+		bom = offer['bom']
+		if not isinstance(bom, dict):
+			errors.append(f'drink {drink!r}: the bom is not a {{material: volume}} mapping')
+			continue
+		for material, volume in bom.items():
+			if not is_number(volume) or volume < 0:
+				errors.append(f'drink {drink!r}: invalid volume {volume!r} of {material!r}')
+			if material not in containers:
+				errors.append(f'drink {drink!r}: material {material!r} has no container')
+
+	for coin, coin_offer in catalog['coins'].items():
+		if check_name('coin', coin):
+			if not is_number(coin_offer['value']) or coin_offer['value'] <= 0:
+				errors.append(f'coin {coin!r}: invalid value {coin_offer["value"]!r}')
+			elif to_cents(coin_offer['value']) == 0:  # the payments are counted in whole cents
+				errors.append(f'coin {coin!r}: value {coin_offer["value"]!r} is worth less than a cent')
+			count = coin_offer['count']
+			if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+				errors.append(f'coin {coin!r}: invalid count {count!r}')
+	if errors:
+		raise CatalogValidationError(errors)
+
+
+def build_machine(
+		catalog: dict,
+		thread_safe: bool = False,
+		compact_containers: bool = False,
+		command_trie: bool = False
+) -> VendingMachineOperations:
+	"""
+	=> Builds a machine from a validated catalog: the dictionaries are assigned in bulk and the
+	indexes rebuilt once (listeners are not notified)
+	:param catalog:  # normalized catalog, validated
+	:param thread_safe:  # see VendingMachineOperations
+	:param compact_containers:  # see VendingMachineOperations
+	:param command_trie:  # see DrinksMenu
+	:return: VendingMachineOperations
+	"""
+	vmo = VendingMachineOperations(
+		thread_safe=thread_safe, compact_containers=compact_containers,
+		drinks_menu=DrinksMenu(command_trie=command_trie)
+	)
+	vmo.materials_dispenser.materials_containers = {
+		material: {'capacity': container['capacity'], 'volume': container['volume']}
+		for material, container in catalog['containers'].items()
+	}
+	vmo.drinks_menu.drinks_menu = {
+		drink: {'price': offer['price'], 'bom': dict(offer['bom']), 'command': offer['command']}
+		for drink, offer in catalog['drinks'].items()
+	}
+	coins = vmo.accepted_coins
+	coins.accepted_coins = {coin: coin_offer['value'] for coin, coin_offer in catalog['coins'].items()}
+	coins.coins_inventory = {coin: coin_offer['count'] for coin, coin_offer in catalog['coins'].items()}
+	vmo.rebuild_indexes()
+	return vmo
+
+
+def catalog_digest(source: str, command_trie: bool = False) -> str:
+	"""
+	=> Hash of everything the compiled machine depends on: the content of the catalog files, the
+	cache version and the menu options stored in the snapshot
+	:param source:  # JSON file or CSV directory
+	:param command_trie:
+	:return: hexadecimal sha256
+	"""
+	digest = hashlib.sha256(f'vms-catalog-{CATALOG_CACHE_VERSION}-{int(command_trie)}'.encode())
+	paths = [os.path.join(source, name) for name in CSV_FILES] if os.path.isdir(source) else [source]
+	for path in paths:
+		digest.update(os.path.basename(path).encode() + b'\0')
+		if os.path.exists(path):
+			with open(path, 'rb') as stream:
+				content = stream.read()
+			digest.update(len(content).to_bytes(8, 'little'))
+			digest.update(content)
+		else:
+			digest.update(b'missing')
+	return digest.hexdigest()
+
+
+def load_catalog(
+		source: str,
+		cache_directory: Union[str, None] = None,
+		thread_safe: bool = False,
+		compact_containers: bool = False,
+		command_trie: bool = False
+) -> VendingMachineOperations:
+	"""
+	=> Loads the machine of a catalog: from the compiled cache when the catalog did not change,
+	otherwise the catalog is parsed, validated, built and the result cached
+	:param source:  # JSON file or CSV directory
+	:param cache_directory:  # directory of the compiled catalogs, None to disable the cache
+	:param thread_safe:  # see VendingMachineOperations
+	:param compact_containers:  # see VendingMachineOperations
+	:param command_trie:  # see DrinksMenu
+	:return: VendingMachineOperations
+	:raise CatalogValidationError: if the catalog is not valid (nothing is cached then)
+	"""
+	cache_path = None
+	if cache_directory is not None:
+		cache_path = os.path.join(cache_directory, f'catalog-{catalog_digest(source, command_trie)}.vms')
+		if os.path.exists(cache_path):
+			try:
+				return load_snapshot(cache_path, thread_safe, compact_containers)
+			except (ValueError, OSError):  # damaged, unreadable or another snapshot version: compiled again
+				pass
+	catalog = parse_catalog(source)
+	validate_catalog(catalog)
+	vmo = build_machine(catalog, thread_safe, compact_containers, command_trie)
+	if cache_path is not None:
+		os.makedirs(cache_directory, exist_ok=True)
+		save_snapshot(vmo, cache_path)
+	return vmo
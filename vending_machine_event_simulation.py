@@ -0,0 +1,308 @@
+"""
+Vending Machine Event Simulation
+=> Discrete-event simulation of machines on a simulated clock: customer arrivals and their orders,
+maintenance visits (DrinksBusinessMaintenance.refill_all_containers) and revenue resets are events
+of a heap-based calendar, so weeks of traffic for many machines run in seconds
+
+While the simulation runs, the clock of vending_machine_simulator (set_clock) follows the
+simulated time: the sales booked by the financials and date_stamp carry simulated timestamps, and
+the revenue timelines come from the financials sales ledger (get_revenue_by_period)
+
+It consists of the following elements:
+
+### inter-arrival distributions: callables(random.Random) -> seconds until the next customer
+	def exponential_arrivals(customers_per_hour):   # Poisson arrivals
+	def uniform_arrivals(low, high):
+	def constant_arrivals(interval):
+
+### class EventCalendar:
+	=> Heap of (time, sequence, action, arguments), events of the same time run in schedule order
+	## methods:
+		def schedule(self, time, action, *arguments):
+		def run(self, until):
+
+### class EventSimulation:
+	## attributes:
+		calendar: EventCalendar, now: current simulated time (seconds since the epoch)
+		machines: list of the simulated VendingMachineOperations
+		statistics: one dictionary per machine (see SIMULATION_STATISTICS)
+	## methods:
+		def add_machine(self, vmo, inter_arrival, drinks_weights):
+		def schedule_maintenance(self, machine, interval, first_visit):
+		def schedule_revenue_reset(self, machine, interval, first_reset):
+		def run(self, duration):
+		def get_revenue_timeline(self, machine, period):
+		def get_totals(self):
+"""
+
+import heapq
+import random
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+from vending_machine_simulator import (
+	DrinksBusinessMaintenance, ORDER_SERVED, ORDER_UNAVAILABLE, VendingMachineOperations, fewest_coins_change,
+	set_clock, to_cents
+)
+
+# counters kept for each machine, see EventSimulation.statistics
+SIMULATION_STATISTICS = (
+	'arrivals',  # customers who came to the machine
+	'served',  # orders served
+	'lost_sales',  # orders refused because the drink was unavailable
+	'lost_revenue',  # price of the lost sales
+	'stockouts',  # times a drink of the menu went out of stock
+	'maintenance_visits',
+	'revenue_resets',
+)
+
+
+def exponential_arrivals(customers_per_hour: float) -> Callable[[random.Random], float]:
+	"""
+	=> Poisson arrivals: exponentially distributed inter-arrival times
+	:param customers_per_hour:  # mean arrival rate
+	"""
+	rate = customers_per_hour / 3600
+	return lambda randomizer: randomizer.expovariate(rate)
+
+
+def uniform_arrivals(low: float, high: float) -> Callable[[random.Random], float]:
+	"""
+	=> Inter-arrival times uniformly distributed between low and high seconds
+	"""
+	return lambda randomizer: randomizer.uniform(low, high)
+
+
+def constant_arrivals(interval: float) -> Callable[[random.Random], float]:
+	"""
+	=> One customer every interval seconds
+	"""
+	return lambda randomizer: interval
+
+
+class EventCalendar:
+	"""
+	=> Future events of a simulation in a binary heap keyed by time
+	"""
+
+	def __init__(self, start: float = 0.0) -> None:
+		"""
+		:param start:  # simulated time of the beginning of the calendar
+		"""
+		self.now = start
+		self.events: List[Tuple[float, int, Callable, tuple]] = []
+		# tie breaker: events of the same time run in the order they were scheduled
+		self.sequence = 0
+		self.events_count = 0
+
+	def schedule(self, time: float, action: Callable, *arguments):
+		"""
+		=> Schedules action(*arguments) at a simulated time (not before now)
+		"""
+		self.sequence += 1
+		heapq.heappush(self.events, (max(time, self.now), self.sequence, action, arguments))
+
+	def run(self, until: float) -> int:
+		"""
+		=> Runs the events due up to until in time order (now is advanced to each event time) then
+		sets now to until, the events scheduled later stay in the calendar
+		:param until:  # simulated time to stop at
+		:return: number of events run
+		"""
+		events = self.events
+		count = 0
+		while events and events[0][0] <= until:
+			self.now, _, action, arguments = heapq.heappop(events)
+			action(*arguments)
+			count += 1
+		self.now = max(self.now, until)
+		self.events_count += count
+		return count
+
+
+class EventSimulation:
+	"""
+	=> Simulates customers, maintenance visits and revenue resets on several machines
+
+	external methods activated:
+		vending_machine_simulator.set_clock
+		vmo.process_order
+		vmo.get_drink_servings
+		vmo.drinks_menu.get_drink_price
+		vmo.drinks_menu.get_material_drinks
+		vmo.materials_dispenser.add_containers_listener
+		vmo.financials.reset_revenue
+		vmo.financials.get_revenue_by_period
+		DrinksBusinessMaintenance.refill_all_containers
+	"""
+
+	def __init__(self, start: Union[float, None] = None, seed: int = 0) -> None:
+		"""
+		:param start:  # simulated time of the beginning (seconds since the epoch), now by default
+		:param seed:  # seed of the random arrivals and choices of drinks
+		"""
+		self.start = time.time() if start is None else start
+		self.calendar = EventCalendar(self.start)
+		self.randomizer = random.Random(seed)
+		self.machines: List[VendingMachineOperations] = []
+		self.statistics: List[Dict[str, float]] = []
+		self.maintenances: List[DrinksBusinessMaintenance] = []
+		# per machine: (drinks, cumulated weights) of the customers choices
+		self.choices: List[Tuple[List[str], List[float]]] = []
+		# per machine: {drink: coins paying its exact price}
+		self.payments: List[Dict[str, Dict[str, int]]] = []
+		self.inter_arrivals: List[Callable[[random.Random], float]] = []
+
+	@property
+	def now(self) -> float:
+		return self.calendar.now
+
+	def add_machine(
+			self,
+			vmo: VendingMachineOperations,
+			inter_arrival: Callable[[random.Random], float],
+			drinks_weights: Union[Dict[str, float], None] = None
+	) -> int:
+		"""
+		=> Adds a machine and schedules its first customer
+		The customers pay the exact price with the fewest accepted coins (drinks whose price cannot
+		be paid exactly are not ordered), the financials must use the default (module) clock to
+		book the sales at simulated times
+		:param vmo:
+		:param inter_arrival:  # e.g. exponential_arrivals(30)
+		:param drinks_weights:  # {drink: relative popularity}, the drinks of the menu equally by default
+		:return: machine number
+		"""
+		machine = len(self.machines)
+		if drinks_weights is None:
+			drinks_weights = {drink: 1.0 for drink in vmo.drinks_menu.get_all_drinks()}
+		payments = {}
+		for drink in drinks_weights:
+			if vmo.drinks_menu.exist_drink(drink):
+				price_cents = to_cents(vmo.drinks_menu.get_drink_price(drink))
+				coins = [
+					(coin, vmo.accepted_coins.get_coin_cents(coin), price_cents)
+					for coin in vmo.accepted_coins.get_all_coins()
+				]
+				payment = fewest_coins_change(price_cents, coins)
+				if payment is not None:
+					payments[drink] = payment
+		drinks = [drink for drink in drinks_weights if drink in payments]
+		cumulated_weights, total = [], 0.0
+		for drink in drinks:
+			total += drinks_weights[drink]
+			cumulated_weights.append(total)
+
+		self.machines.append(vmo)
+		self.statistics.append(dict.fromkeys(SIMULATION_STATISTICS, 0))
+		self.maintenances.append(DrinksBusinessMaintenance(vmo.materials_dispenser))
+		self.choices.append((drinks, cumulated_weights))
+		self.payments.append(payments)
+		self.inter_arrivals.append(inter_arrival)
+		self.watch_stockouts(machine)
+		if drinks:
+			self.calendar.schedule(self.now + inter_arrival(self.randomizer), self.customer_arrival, machine)
+		return machine
+
+	def watch_stockouts(self, machine: int):
+		"""
+		Counts the drinks going out of stock through a containers listener (registered after the
+		listener of the machine, the servings index is up to date when it runs)
+		"""
+		vmo = self.machines[machine]
+		statistics = self.statistics[machine]
+		out_of_stock = {drink for drink in vmo.drinks_menu.get_all_drinks() if vmo.get_drink_servings(drink) == 0}
+
+		def on_container_change(operation: str, material: str, amount):
+			for drink in vmo.drinks_menu.get_material_drinks(material):
+				if vmo.get_drink_servings(drink) == 0:
+					if drink not in out_of_stock:
+						out_of_stock.add(drink)
+						statistics['stockouts'] += 1
+				else:
+					out_of_stock.discard(drink)
+
+		vmo.materials_dispenser.add_containers_listener(on_container_change)
+
+	def customer_arrival(self, machine: int):
+		"""
+		Event: a customer orders a drink then the next customer is scheduled
+		"""
+		vmo = self.machines[machine]
+		statistics = self.statistics[machine]
+		drinks, cumulated_weights = self.choices[machine]
+		drink = self.randomizer.choices(drinks, cum_weights=cumulated_weights)[0]
+		statistics['arrivals'] += 1
+		outcome, _ = vmo.process_order(drink, self.payments[machine][drink])
+		if outcome == ORDER_SERVED:
+			statistics['served'] += 1
+		elif outcome == ORDER_UNAVAILABLE:
+			statistics['lost_sales'] += 1
+			statistics['lost_revenue'] += vmo.drinks_menu.get_drink_price(drink)
+		self.calendar.schedule(
+			self.now + self.inter_arrivals[machine](self.randomizer), self.customer_arrival, machine
+		)
+
+	def schedule_maintenance(self, machine: int, interval: float, first_visit: Union[float, None] = None):
+		"""
+		=> Schedules a maintenance visit refilling all the containers every interval seconds
+		:param machine:
+		:param interval:  # seconds between two visits
+		:param first_visit:  # simulated time of the first visit, now + interval by default
+		"""
+		first_visit = self.now + interval if first_visit is None else first_visit
+		self.calendar.schedule(first_visit, self.maintenance_visit, machine, interval)
+
+	def maintenance_visit(self, machine: int, interval: float):
+		"""
+		Event: refills all the containers of a machine and schedules the next visit
+		"""
+		self.maintenances[machine].refill_all_containers()
+		self.statistics[machine]['maintenance_visits'] += 1
+		self.calendar.schedule(self.now + interval, self.maintenance_visit, machine, interval)
+
+	def schedule_revenue_reset(self, machine: int, interval: float, first_reset: Union[float, None] = None):
+		"""
+		=> Schedules a reset of the current revenue (end of a business cycle) every interval seconds
+		:param machine:
+		:param interval:  # seconds between two resets
+		:param first_reset:  # simulated time of the first reset, now + interval by default
+		"""
+		first_reset = self.now + interval if first_reset is None else first_reset
+		self.calendar.schedule(first_reset, self.revenue_reset, machine, interval)
+
+	def revenue_reset(self, machine: int, interval: float):
+		"""
+		Event: resets the current revenue of a machine and schedules the next reset
+		"""
+		self.machines[machine].financials.reset_revenue()
+		self.statistics[machine]['revenue_resets'] += 1
+		self.calendar.schedule(self.now + interval, self.revenue_reset, machine, interval)
+
+	def run(self, duration: float) -> int:
+		"""
+		=> Runs the simulation for duration simulated seconds, the module clock follows the
+		simulated time meanwhile and is restored afterwards
+		:param duration:  # e.g. 7 * 24 * 3600 for a week
+		:return: number of events run
+		"""
+		previous_clock = set_clock(lambda: self.calendar.now)
+		try:
+			return self.calendar.run(self.now + duration)
+		finally:
+			set_clock(previous_clock)
+
+	def get_revenue_timeline(self, machine: int, period: float = 3600) -> Dict[float, float]:
+		"""
+		=> Revenue of a machine per period of simulated time since the start of the simulation
+		:param machine:
+		:param period:  # seconds, per hour by default
+		:return: {period start timestamp: revenue} for the periods with sales
+		"""
+		return self.machines[machine].financials.get_revenue_by_period(period, self.start)
+
+	def get_totals(self) -> Dict[str, float]:
+		"""
+		=> Sums the statistics of all the machines
+		"""
+		return {name: sum(statistics[name] for statistics in self.statistics) for name in SIMULATION_STATISTICS}
@@ -0,0 +1,345 @@
+"""
+Vending Machine Fleet
+=> Simulates a fleet of thousands of identical VendingMachineOperations sharded over a process
+pool, so that the simulated order traffic uses every core of the host
+
+The containers and the revenue counters of the whole fleet live in multiprocessing.shared_memory
+arrays: each worker process owns a contiguous shard of machines and writes their state in place
+(through the dispenser and financials listeners), the coordinator reads the fleet totals from the
+same memory without any machine object being pickled between the processes
+
+It consists of the following elements:
+
+### class FleetSharedState:
+	=> Shared memory arrays of a fleet: capacities and volumes (machines x materials) and the
+	counters (machines x FLEET_COUNTERS) - created by the coordinator, attached by the workers
+	## attributes:
+		machines, materials: dimensions of the arrays
+		capacities, volumes, counters: flat memoryviews (row of a machine = machine * width)
+	## methods:
+		def names(self):
+		def close(self):
+		def unlink(self):
+
+### def run_fleet_shard(names, template, materials, machines, first, last, orders, seed, restock):
+	=> Worker task: rebuilds the machines of a shard from the shared state, plays random orders
+	against them and returns {outcome: number of orders}
+
+### class FleetSimulator:
+	## attributes:
+		template: the machine every machine of the fleet starts as
+		machines, workers: size of the fleet and of the process pool
+		state: FleetSharedState of the fleet
+	## methods:
+		def run(self, orders, seed):
+		def get_fleet_revenue(self):
+		def get_fleet_sales(self):
+		def get_fleet_restocks(self):
+		def get_fleet_volumes(self):
+		def get_machine_volumes(self, machine):
+		def get_machine_revenue(self, machine):
+		def close(self):
+"""
+
+import math
+import multiprocessing
+import os
+import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple, Union
+
+from vending_machine_simulator import ORDER_UNAVAILABLE, VendingMachineOperations, fewest_coins_change
+from vending_machine_snapshot import dumps_snapshot, loads_snapshot
+
+# columns of the counters array, one row per machine
+COUNTER_REVENUE_CENTS = 0
+COUNTER_SALES = 1
+COUNTER_RESTOCKS = 2
+FLEET_COUNTERS = 3
+
+
+class FleetSharedState:
+	"""
+	=> Shared memory of a fleet, indexed [machine * materials + material] for the containers and
+	[machine * FLEET_COUNTERS + counter] for the counters
+
+	A machine is only written by the worker owning its shard, so the arrays need no lock: the
+	coordinator reads totals that are at most a few orders behind while the workers run
+	"""
+
+	def __init__(self, machines: int, materials: int, names: Union[Tuple[str, str], None] = None) -> None:
+		"""
+		:param machines:
+		:param materials:
+		:param names:  # names of the (containers, counters) blocks to attach, None to create them
+		"""
+		self.machines = machines
+		self.materials = materials
+		containers_size = max(1, 2 * machines * materials) * 8
+		counters_size = max(1, machines * FLEET_COUNTERS) * 8
+		if names is None:
+			self.containers_memory = SharedMemory(create=True, size=containers_size)
+			self.counters_memory = SharedMemory(create=True, size=counters_size)
+		else:
+			self.containers_memory = SharedMemory(name=names[0])
+			self.counters_memory = SharedMemory(name=names[1])
+		cells = machines * materials
+		containers = self.containers_memory.buf.cast('d')
+		self.capacities = containers[:cells]
+		self.volumes = containers[cells:2 * cells]
+		containers.release()
+		self.counters = self.counters_memory.buf.cast('q')[:machines * FLEET_COUNTERS]
+		if names is None:
+			self.counters[:] = memoryview(array('q', [0]) * len(self.counters))
+
+	def names(self) -> Tuple[str, str]:
+		"""
+		:return: names under which the workers attach the shared memory blocks
+		"""
+		return self.containers_memory.name, self.counters_memory.name
+
+	def close(self):
+		"""
+		=> Detaches this process from the shared memory (the views must not be used afterwards)
+		"""
+		for view in (self.capacities, self.volumes, self.counters):
+			view.release()
+		self.containers_memory.close()
+		self.counters_memory.close()
+
+	def unlink(self):
+		"""
+		=> Frees the shared memory blocks, called once by the coordinator
+		"""
+		self.containers_memory.unlink()
+		self.counters_memory.unlink()
+
+
+def exact_payments(vmo: VendingMachineOperations) -> Dict[str, Dict[str, int]]:
+	"""
+	Coins paying the exact price of each drink with the fewest coins (no change needed)
+	:return: {drink: inserted coins}, drinks whose price no combination of coins reaches are left out
+	"""
+	coins = vmo.accepted_coins
+	payments = {}
+	for drink in vmo.drinks_menu.get_all_drinks():
+		price_cents = round(vmo.drinks_menu.get_drink_price(drink) * 100)
+		payment = fewest_coins_change(
+			price_cents, [(coin, coins.get_coin_cents(coin), price_cents) for coin in coins.get_all_coins()]
+		)
+		if payment is not None:
+			payments[drink] = payment
+	return payments
+
+
+def run_fleet_shard(
+		names: Tuple[str, str],
+		template: bytes,
+		materials: List[str],
+		machines: int,
+		first: int,
+		last: int,
+		orders: int,
+		seed: int,
+		restock: bool = True
+) -> Dict[str, int]:
+	"""
+	=> Plays orders of random drinks on random machines of the shard first..last-1
+	The machines are rebuilt from the shared containers (the menu and coins catalogs of the template
+	are frozen and shared by all of them) and write their containers and sales back through their
+	listeners, they are dropped at the end of the task
+	:param names:  # FleetSharedState.names()
+	:param template:  # snapshot of the template machine (dumps_snapshot)
+	:param materials:  # materials in the column order of the shared arrays
+	:param machines:  # size of the fleet
+	:param first:  # first machine of the shard
+	:param last:  # end of the shard (excluded)
+	:param orders:
+	:param seed:  # seed of the random traffic
+	:param restock:  # True to refill the containers of a machine when an order is unavailable
+	:return: {outcome: number of orders}
+	"""
+	state = FleetSharedState(machines, len(materials), names)
+	catalog = loads_snapshot(template, thread_safe=False)
+	catalog.drinks_menu.freeze()
+	catalog.accepted_coins.freeze()
+	payments = exact_payments(catalog)
+	drinks = list(payments)
+	columns = {material: column for column, material in enumerate(materials)}
+	fleet: Dict[int, VendingMachineOperations] = {}
+
+	def open_machine(machine: int) -> VendingMachineOperations:
+		row = machine * len(materials)
+		vmo = VendingMachineOperations(
+			compact_containers=True, drinks_menu=catalog.drinks_menu, accepted_coins=catalog.accepted_coins
+		)
+		dispenser = vmo.materials_dispenser
+		dispenser.materials_containers = {
+			material: {'capacity': state.capacities[row + column], 'volume': state.volumes[row + column]}
+			for material, column in columns.items()
+		}
+		dispenser.rebuild_indexes()
+		vmo.rebuild_servings_index()
+
+		def on_container_change(operation: str, material: str, amount):
+			state.volumes[row + columns[material]] = dispenser.get_volume_material_container(material)
+
+		def on_financials_change(operation: str, sale: Union[tuple, None]):
+			if operation == 'sale':
+				state.counters[machine * FLEET_COUNTERS + COUNTER_REVENUE_CENTS] += sale[2]
+				state.counters[machine * FLEET_COUNTERS + COUNTER_SALES] += 1
+
+		dispenser.add_containers_listener(on_container_change)
+		vmo.financials.add_financials_listener(on_financials_change)
+		return vmo
+
+	outcomes: Dict[str, int] = {}
+	randomizer = random.Random(seed)
+	try:
+		if drinks and last > first:
+			for _ in range(orders):
+				machine = randomizer.randrange(first, last)
+				vmo = fleet.get(machine)
+				if vmo is None:
+					vmo = fleet[machine] = open_machine(machine)
+				drink = randomizer.choice(drinks)
+				outcome, _ = vmo.process_order(drink, payments[drink])
+				outcomes[outcome] = outcomes.get(outcome, 0) + 1
+				if outcome == ORDER_UNAVAILABLE and restock:
+					for material in list(vmo.materials_dispenser.materials_containers):
+						vmo.materials_dispenser.refill_material_container(material)
+					state.counters[machine * FLEET_COUNTERS + COUNTER_RESTOCKS] += 1
+	finally:
+		fleet.clear()
+		state.close()
+	return outcomes
+
+
+class FleetSimulator:
+	"""
+	=> Coordinator of a fleet of machines built like one template machine, sharded over a pool of
+	worker processes (one shard per worker)
+
+	external methods activated:
+		vending_machine_snapshot.dumps_snapshot
+		run_fleet_shard (in the workers)
+	"""
+
+	def __init__(
+			self,
+			template: VendingMachineOperations,
+			machines: int,
+			workers: Union[int, None] = None,
+			restock: bool = True
+	) -> None:
+		"""
+		:param template:  # containers, menu and coins every machine starts with
+		:param machines:  # size of the fleet
+		:param workers:  # number of worker processes, os.cpu_count() by default
+		:param restock:  # refill the containers of a machine when one of its orders is unavailable
+		"""
+		self.template = template
+		self.machines = machines
+		self.workers = max(1, min(workers or os.cpu_count() or 1, max(1, machines)))
+		self.restock = restock
+		self.snapshot = dumps_snapshot(template)
+		self.materials: List[str] = list(template.materials_dispenser.materials_containers)
+		self.state = FleetSharedState(machines, len(self.materials))
+		capacities = [
+			template.materials_dispenser.get_capacity_material_container(material) for material in self.materials
+		]
+		volumes = [
+			template.materials_dispenser.get_volume_material_container(material) for material in self.materials
+		]
+		self.state.capacities[:] = memoryview(array('d', capacities) * machines)
+		self.state.volumes[:] = memoryview(array('d', volumes) * machines)
+		shard = math.ceil(machines / self.workers)
+		self.shards: List[Tuple[int, int]] = [
+			(first, min(first + shard, machines)) for first in range(0, machines, shard)
+		]
+		self.pool: Union[ProcessPoolExecutor, None] = None
+
+	def run(self, orders: int, seed: int = 0) -> Dict[str, int]:
+		"""
+		=> Spreads random orders over the shards (in proportion of their size) and waits for them
+		:param orders:  # orders played by the whole fleet
+		:param seed:  # seed of the traffic, each shard derives its own
+		:return: {outcome: number of orders}
+		"""
+		if self.pool is None:
+			self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+		futures = []
+		assigned = 0
+		for number, (first, last) in enumerate(self.shards):
+			shard_orders = orders * last // self.machines - assigned
+			assigned += shard_orders
+			futures.append(self.pool.submit(
+				run_fleet_shard, self.state.names(), self.snapshot, self.materials, self.machines,
+				first, last, shard_orders, seed * len(self.shards) + number, self.restock
+			))
+		outcomes: Dict[str, int] = {}
+		for future in futures:
+			for outcome, count in future.result().items():
+				outcomes[outcome] = outcomes.get(outcome, 0) + count
+		return outcomes
+
+	def get_fleet_revenue(self) -> float:
+		"""
+		:return: revenue of the whole fleet since it was created
+		"""
+		return sum(self.state.counters[COUNTER_REVENUE_CENTS::FLEET_COUNTERS]) / 100
+
+	def get_fleet_sales(self) -> int:
+		"""
+		:return: number of drinks sold by the whole fleet
+		"""
+		return sum(self.state.counters[COUNTER_SALES::FLEET_COUNTERS])
+
+	def get_fleet_restocks(self) -> int:
+		"""
+		:return: number of times a machine of the fleet was refilled
+		"""
+		return sum(self.state.counters[COUNTER_RESTOCKS::FLEET_COUNTERS])
+
+	def get_fleet_volumes(self) -> Dict[str, float]:
+		"""
+		:return: {material: volume left in all the containers of the fleet}
+		"""
+		width = len(self.materials)
+		return {
+			material: sum(self.state.volumes[column::width]) if width else 0
+			for column, material in enumerate(self.materials)
+		}
+
+	def get_machine_volumes(self, machine: int) -> Dict[str, float]:
+		"""
+		:param machine:  # 0..machines-1
+		:return: {material: volume} of one machine
+		"""
+		row = machine * len(self.materials)
+		return {material: self.state.volumes[row + column] for column, material in enumerate(self.materials)}
+
+	def get_machine_revenue(self, machine: int) -> float:
+		"""
+		:param machine:  # 0..machines-1
+		:return: revenue of one machine
+		"""
+		return self.state.counters[machine * FLEET_COUNTERS + COUNTER_REVENUE_CENTS] / 100
+
+	def close(self):
+		"""
+		=> Stops the workers and frees the shared memory
+		"""
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+		self.state.close()
+		self.state.unlink()
+
+	def __enter__(self) -> 'FleetSimulator':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
@@ -0,0 +1,274 @@
+"""
+Vending Machine Fleet Index
+=> Answers the routing queries of a fleet of VendingMachineOperations in memory: which machines
+can serve a drink right now, and the nearest machines serving it, without asking every machine
+check_drink_availability
+
+Each machine registered in a FleetAvailabilityIndex gets a containers listener and a machine menu
+listener (it follows set_drinks_menu) running after the servings index of the machine: when a
+container change makes a drink of the machine go in or out of stock
+(a takeout leaves less than one serving, a refill or a released hold gives it back) or a menu
+change or switch adds or removes a drink, the machine is added to or removed from the inverted
+index {drink: machines}. A change that does not flip any availability only compares the
+servings of the drinks using the material
+
+The located machines serving a drink are also filed in a grid of cell_size cells per drink:
+nearest_machines visits the cells ring by ring around the customer and stops as soon as no
+unvisited cell can hold a closer machine, or sorts the occupied cells by distance when the drink
+is only served far away
+
+It consists of the following elements:
+
+### class FleetAvailabilityIndex:
+	## attributes:
+		machines: {machine name: VendingMachineOperations}
+		locations: {machine name: (x, y)} of the located machines, planar coordinates
+		machine_drinks: {machine name: set of the drinks the machine can serve}
+		drink_machines: {drink: set of the machines that can serve it} (inverted index)
+		drink_cells: {drink: {(column, row): set of the located machines that can serve it}}
+	## methods:
+		def add_machine(self, name, vmo, location):
+		def remove_machine(self, name):
+		def refresh_machine(self, name):
+		def get_drink_machines(self, drink):
+		def count_drink_machines(self, drink):
+		def nearest_machines(self, drink, location, count):
+"""
+
+import heapq
+import math
+import threading
+from typing import Callable, Dict, List, Set, Tuple, Union
+
+from vending_machine_simulator import VendingMachineOperations
+
+# side of the grid cells in the units of the locations (e.g. km): about the distance between
+# neighbour machines of a dense area
+FLEET_INDEX_CELL_SIZE = 1.0
+
+
+class FleetAvailabilityIndex:
+	"""
+	=> Inverted index drink -> machines able to serve it, kept up to date by listeners, and grid
+	of the located machines per drink for the nearest machines queries
+
+	external methods activated:
+		vmo.get_available_drinks
+		vmo.drinks_servings (read only)
+		vmo.drinks_menu.get_material_drinks
+		vmo.add_menu_listener / remove_menu_listener
+		vmo.materials_dispenser.add_containers_listener / remove_containers_listener
+	"""
+
+	def __init__(self, cell_size: float = FLEET_INDEX_CELL_SIZE) -> None:
+		"""
+		:param cell_size:  # side of the grid cells, in the units of the locations
+		"""
+		self.cell_size = cell_size
+		self.machines: Dict[str, VendingMachineOperations] = {}
+		self.locations: Dict[str, Tuple[float, float]] = {}
+		self.machine_drinks: Dict[str, Set[str]] = {}
+		self.drink_machines: Dict[str, Set[str]] = {}
+		self.drink_cells: Dict[str, Dict[Tuple[int, int], Set[str]]] = {}
+		# (containers listener, menu listener) of each machine
+		self.listeners: Dict[str, Tuple[Callable, Callable]] = {}
+		# the listeners run on the threads serving the orders of the machines
+		self.index_lock = threading.Lock()
+
+	def location_cell(self, location: Tuple[float, float]) -> Tuple[int, int]:
+		return math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size)
+
+	def set_drink_availability(self, name: str, drink: str, available: bool):
+		"""
+		Files or unfiles a machine for a drink in the inverted index and the grid (index_lock held)
+		"""
+		location = self.locations.get(name)
+		if available:
+			self.machine_drinks[name].add(drink)
+			self.drink_machines.setdefault(drink, set()).add(name)
+			if location is not None:
+				cells = self.drink_cells.setdefault(drink, {})
+				cells.setdefault(self.location_cell(location), set()).add(name)
+			return
+		self.machine_drinks[name].discard(drink)
+		machines = self.drink_machines.get(drink)
+		if machines is not None:
+			machines.discard(name)
+			if not machines:
+				del self.drink_machines[drink]
+		if location is not None:
+			cells = self.drink_cells.get(drink, {})
+			cell = self.location_cell(location)
+			names = cells.get(cell)
+			if names is not None:
+				names.discard(name)
+				if not names:
+					del cells[cell]
+				if not cells:
+					self.drink_cells.pop(drink, None)
+
+	def index_drinks(self, name: str, drinks):
+		"""
+		Compares the availability of some drinks of a machine with the index and files the flips
+		"""
+		vmo = self.machines[name]
+		servings = vmo.drinks_servings
+		machine_drinks = self.machine_drinks[name]
+		# compared under the lock: another thread filing the same drink cannot slip in between
+		with self.index_lock:
+			for drink in drinks:
+				available = servings.get(drink, 0) > 0
+				if available != (drink in machine_drinks):
+					self.set_drink_availability(name, drink, available)
+
+	def add_machine(
+			self, name: str, vmo: VendingMachineOperations, location: Union[Tuple[float, float], None] = None
+	) -> bool:
+		"""
+		=> Registers a machine and indexes the drinks it can serve
+		:param name:  # machine name returned by the queries
+		:param vmo:
+		:param location:  # (x, y) planar coordinates, None for a machine never returned by nearest_machines
+		:return: True if the machine was added False if the name is already registered
+		"""
+		if name in self.machines:
+			return False
+		self.machines[name] = vmo
+		self.machine_drinks[name] = set()
+		if location is not None:
+			self.locations[name] = (location[0], location[1])
+		# registered after the listeners of vmo: the servings index is up to date when they run
+		on_container_change = lambda operation, material, amount: self.index_drinks(
+			name, vmo.drinks_menu.get_material_drinks(material)
+		)
+
+		def on_menu_change(operation, drink):
+			if operation == 'switch':  # the drinks of both menus may flip
+				self.index_drinks(name, set(vmo.drinks_servings) | self.machine_drinks[name])
+			else:
+				self.index_drinks(name, (drink,))
+
+		vmo.materials_dispenser.add_containers_listener(on_container_change)
+		vmo.add_menu_listener(on_menu_change)
+		self.listeners[name] = (on_container_change, on_menu_change)
+		self.index_drinks(name, vmo.get_available_drinks())
+		return True
+
+	def remove_machine(self, name: str) -> bool:
+		"""
+		=> Unregisters a machine and its listeners
+		:param name:
+		:return: True if the machine was registered False otherwise
+		"""
+		if name not in self.machines:
+			return False
+		vmo = self.machines[name]
+		on_container_change, on_menu_change = self.listeners.pop(name)
+		vmo.materials_dispenser.remove_containers_listener(on_container_change)
+		vmo.remove_menu_listener(on_menu_change)
+		with self.index_lock:
+			for drink in list(self.machine_drinks[name]):
+				self.set_drink_availability(name, drink, False)
+		del self.machines[name]
+		del self.machine_drinks[name]
+		self.locations.pop(name, None)
+		return True
+
+	def refresh_machine(self, name: str) -> bool:
+		"""
+		=> Indexes a machine again after a change its listeners do not see: vmo.rebuild_indexes
+		after a bulk restore of its state
+		:param name:
+		:return: True if the machine is registered False otherwise
+		"""
+		vmo = self.machines.get(name)
+		if vmo is None:
+			return False
+		self.index_drinks(name, set(vmo.get_available_drinks()) | self.machine_drinks[name])
+		return True
+
+	def get_drink_machines(self, drink: str) -> Set[str]:
+		"""
+		=> Returns the machines that can serve a drink right now - O(1)
+		:param drink:
+		:return: set of machine names, empty if no machine serves the drink - the set is the index
+		itself: read only, and copied under index_lock if orders are served on other threads while
+		it is iterated
+		"""
+		return self.drink_machines.get(drink, set())
+
+	def count_drink_machines(self, drink: str) -> int:
+		"""
+		:return: number of machines that can serve a drink right now
+		"""
+		return len(self.drink_machines.get(drink, ()))
+
+	def nearest_machines(self, drink: str, location: Tuple[float, float], count: int = 1) -> List[Tuple[float, str]]:
+		"""
+		=> Returns the located machines nearest to a location that can serve a drink right now
+		:param drink:
+		:param location:  # (x, y) of the customer
+		:param count:  # number of machines wanted
+		:return: list of (distance, machine name) by increasing distance, at most count of them
+		"""
+		x, y = location
+		locations = self.locations
+		cell_size = self.cell_size
+		# max heap of the count nearest machines found so far: (-distance, name)
+		nearest: List[Tuple[float, str]] = []
+
+		def visit(names: Set[str]):
+			for name in names:
+				machine_x, machine_y = locations[name]
+				distance = math.hypot(machine_x - x, machine_y - y)
+				if len(nearest) < count:
+					heapq.heappush(nearest, (-distance, name))
+				elif distance < -nearest[0][0]:
+					heapq.heapreplace(nearest, (-distance, name))
+
+		with self.index_lock:
+			cells = self.drink_cells.get(drink)
+			if not cells or count <= 0:
+				return []
+			column, row = self.location_cell(location)
+			radius = 0
+			visited = 0
+			while True:
+				ring = ring_cells(column, row, radius)
+				for cell in ring:
+					names = cells.get(cell)
+					if names:
+						visit(names)
+				visited += len(ring)
+				# the cells of the next ring are at least radius * cell_size away from the location
+				if len(nearest) == count and -nearest[0][0] <= radius * cell_size:
+					break
+				if visited + 8 * (radius + 1) <= len(cells):
+					radius += 1
+					continue
+				# the next ring has more cells than the drink occupies (the drink is only served far
+				# away): the occupied cells left are visited by increasing distance instead
+				remaining = []
+				for (cell_column, cell_row), names in cells.items():
+					if max(abs(cell_column - column), abs(cell_row - row)) > radius:
+						distance_x = max(cell_column * cell_size - x, 0, x - (cell_column + 1) * cell_size)
+						distance_y = max(cell_row * cell_size - y, 0, y - (cell_row + 1) * cell_size)
+						remaining.append((math.hypot(distance_x, distance_y), cell_column, cell_row))
+				remaining.sort()
+				for cell_distance, cell_column, cell_row in remaining:
+					if len(nearest) == count and -nearest[0][0] <= cell_distance:
+						break
+					visit(cells[cell_column, cell_row])
+				break
+		return sorted((-distance, name) for distance, name in nearest)
+
+
+def ring_cells(column: int, row: int, radius: int) -> List[Tuple[int, int]]:
+	"""
+	Cells at radius cells (Chebyshev distance) of the cell (column, row)
+	"""
+	if radius == 0:
+		return [(column, row)]
+	cells = [(column + offset, row + side) for side in (-radius, radius) for offset in range(-radius, radius + 1)]
+	cells.extend((column + side, row + offset) for side in (-radius, radius) for offset in range(1 - radius, radius))
+	return cells
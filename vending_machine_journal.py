@@ -0,0 +1,405 @@
+"""
+Vending Machine Journal
+=> Append-only journal of the state changes of a VendingMachineOperations (containers allocate /
+refill / takeout, add_drink / update_drink / menu switches, accepted coins and coins held, sales
+and revenue cycle resets) so that a crash loses neither the inventory nor the takings
+
+The journal follows the machine through its listeners, one JSON line per change. Recovery loads
+the last snapshot (vending_machine_snapshot) and replays the journal written after it
+
+Durability modes:
+	DURABILITY_FSYNC: every record is written and fsynced before the order path goes on
+	DURABILITY_GROUP: records are buffered and a committer thread writes and fsyncs them in groups
+	every group_interval seconds (or as soon as group_size records are waiting), the order path
+	never waits for the disk - sync() waits until everything appended so far is durable
+	DURABILITY_NONE: records are written without fsync (left to the operating system)
+
+Files of a journal directory, generation g starting at 0:
+	snapshot-<g>.vms: state of the machine at the start of journal-<g> (none for generation 0)
+	journal-<g>.jsonl: changes made since snapshot-<g>
+checkpoint() starts journal-<g+1>, saves snapshot-<g+1> then removes the files of generation g:
+a crash at any step leaves a snapshot and the journals to replay after it
+
+It consists of the following elements:
+
+### class OrderJournal:
+	## attributes:
+		vmo: the journaled VendingMachineOperations
+		directory, generation: files of the journal
+		appended_records, durable_records: records appended / known to be on disk
+		fsync_count: number of fsyncs issued
+	## methods:
+		def on_container_change(self, operation, material, amount):
+		def on_menu_change(self, operation, drink):
+		def on_coins_change(self, operation, change):
+		def on_financials_change(self, operation, sale):
+		def append(self, record):
+		def sync(self):
+		def checkpoint(self):
+		def close(self):
+
+### def apply_record(vmo, record):
+	=> Replays one journal record on a machine
+
+### def recover_machine(directory, thread_safe):
+	=> Rebuilds a machine from the last snapshot and the journals written after it
+
+### def open_journaled_machine(directory, durability, group_interval, group_size, thread_safe):
+	=> Recovers the machine of a journal directory and journals its next changes
+"""
+
+import json
+import os
+import re
+import threading
+from typing import List, Tuple, Union
+
+from vending_machine_simulator import DrinksMenu, VendingMachineOperations
+from vending_machine_snapshot import load_snapshot, save_snapshot
+
+DURABILITY_FSYNC = 'fsync'
+DURABILITY_GROUP = 'group'
+DURABILITY_NONE = 'none'
+
+GENERATION_FILE = re.compile(r'(snapshot|journal)-(\d+)\.(vms|jsonl)$')
+
+
+def snapshot_path(directory: str, generation: int) -> str:
+	return os.path.join(directory, f'snapshot-{generation:08d}.vms')
+
+
+def journal_path(directory: str, generation: int) -> str:
+	return os.path.join(directory, f'journal-{generation:08d}.jsonl')
+
+
+class OrderJournal:
+	"""
+	=> Journals the changes of one VendingMachineOperations (see the module durability modes)
+
+	The changes of the machine must not be journaled from several threads while checkpoint()
+	runs: the snapshot has to match the end of the journal it closes
+
+	external methods activated:
+		vmo.materials_dispenser.add_containers_listener
+		vmo.add_menu_listener
+		vmo.accepted_coins.add_coins_listener
+		vmo.financials.add_financials_listener
+		(and the matching remove_..._listener methods)
+		save_snapshot
+	"""
+
+	def __init__(
+			self,
+			vmo: VendingMachineOperations,
+			directory: str,
+			generation: int = 0,
+			durability: str = DURABILITY_GROUP,
+			group_interval: float = 0.005,
+			group_size: int = 1024
+	) -> None:
+		"""
+		:param vmo:  # machine whose changes are journaled
+		:param directory:  # journal directory, created if needed
+		:param generation:  # generation of the journal file to append to (see recover_machine)
+		:param durability:  # DURABILITY_FSYNC, DURABILITY_GROUP or DURABILITY_NONE
+		:param group_interval:  # group commit: longest time a record waits for its fsync
+		:param group_size:  # group commit: number of waiting records that triggers a commit
+		"""
+		if durability not in (DURABILITY_FSYNC, DURABILITY_GROUP, DURABILITY_NONE):
+			raise ValueError(f'unknown durability {durability!r}')
+		self.vmo = vmo
+		self.directory = directory
+		self.generation = generation
+		self.durability = durability
+		self.group_interval = group_interval
+		self.group_size = group_size
+		os.makedirs(directory, exist_ok=True)
+		self.stream = open(journal_path(directory, generation), 'a', encoding='utf-8')
+		self.pending: List[str] = []
+		self.appended_records: int = 0
+		self.durable_records: int = 0
+		self.fsync_count: int = 0
+		# guards pending and the counters, notifies the committer and the sync() waiters
+		self.condition = threading.Condition()
+		# serializes the writes to the journal file
+		self.write_lock = threading.Lock()
+		self.closed = False
+		self.committer: Union[threading.Thread, None] = None
+		if durability == DURABILITY_GROUP:
+			self.committer = threading.Thread(target=self.run_committer, name='journal-committer', daemon=True)
+			self.committer.start()
+		vmo.materials_dispenser.add_containers_listener(self.on_container_change)
+		vmo.add_menu_listener(self.on_menu_change)
+		vmo.accepted_coins.add_coins_listener(self.on_coins_change)
+		vmo.financials.add_financials_listener(self.on_financials_change)
+
+	def on_container_change(self, operation: str, material: str, amount):
+		"""
+		Listener of materials_dispenser: journals 'allocate', 'refill' and 'takeout' - the holds of
+		the orders being paid are not journaled, a recovered machine has no order in progress
+		"""
+		if operation == 'hold' or operation == 'release':
+			return
+		self.append([operation, material, amount])
+
+	def on_menu_change(self, operation: str, drink: str):
+		"""
+		Listener of the machine menu: journals the drinks added with their price, bom and command,
+		the new price and command of the drinks updated and the whole menu the machine switched to
+		"""
+		drinks_menu = self.vmo.drinks_menu
+		if operation == 'switch':
+			drinks = []
+			for switched_drink in drinks_menu.get_all_drinks():
+				drinks.append([
+					switched_drink, drinks_menu.get_drink_price(switched_drink),
+					drinks_menu.get_drink_bom(switched_drink), drinks_menu.get_drink_command(switched_drink)
+				])
+			self.append(['set_menu', drinks, drinks_menu.commands_trie is not None, drinks_menu.is_frozen()])
+			return
+		if operation == 'update':
+			self.append([
+				'update_drink', drink, drinks_menu.get_drink_price(drink), drinks_menu.get_drink_command(drink)
+			])
+			return
+		self.append([
+			'add_drink', drink, drinks_menu.get_drink_price(drink),
+			drinks_menu.get_drink_bom(drink), drinks_menu.get_drink_command(drink)
+		])
+
+	def on_coins_change(self, operation: str, change: tuple):
+		"""
+		Listener of accepted_coins: journals the coins accepted ('add_coin'), the maintenance loads
+		('load_coins') and the coins kept and handed back by each payment ('collect')
+		"""
+		self.append([operation, *change])
+
+	def on_financials_change(self, operation: str, sale: Union[tuple, None]):
+		"""
+		Listener of financials: journals the sales (revenue) and the revenue cycle resets
+		"""
+		if operation == 'sale':
+			self.append(['revenue', *sale])
+		else:
+			self.append(['reset_revenue'])
+
+	def append(self, record: list):
+		"""
+		=> Appends a record to the journal according to the durability mode
+		:param record:  # [operation, arguments...] see apply_record
+		"""
+		line = json.dumps(record, separators=(',', ':')) + '\n'
+		if self.durability == DURABILITY_GROUP:
+			with self.condition:
+				self.pending.append(line)
+				self.appended_records += 1
+				if len(self.pending) >= self.group_size:
+					self.condition.notify_all()
+			return
+		with self.write_lock:
+			self.stream.write(line)
+			self.stream.flush()
+			if self.durability == DURABILITY_FSYNC:
+				os.fsync(self.stream.fileno())
+				self.fsync_count += 1
+		with self.condition:
+			self.appended_records += 1
+			self.durable_records = self.appended_records
+
+	def commit_pending(self):
+		"""
+		Writes the records waiting in pending and fsyncs them in one go
+		"""
+		# the write lock is taken first so that groups reach the file in the order they were taken
+		with self.write_lock:
+			with self.condition:
+				lines, self.pending = self.pending, []
+				target = self.appended_records
+			if lines:
+				self.stream.write(''.join(lines))
+				self.stream.flush()
+				os.fsync(self.stream.fileno())
+				self.fsync_count += 1
+		with self.condition:
+			self.durable_records = max(self.durable_records, target)
+			self.condition.notify_all()
+
+	def run_committer(self):
+		"""
+		Group commit thread: commits the pending records every group_interval seconds
+		"""
+		while True:
+			with self.condition:
+				if not self.pending and not self.closed:
+					self.condition.wait(self.group_interval)
+				closed = self.closed
+			self.commit_pending()
+			if closed:
+				return
+
+	def sync(self):
+		"""
+		=> Returns once every record appended so far is on disk
+		"""
+		if self.durability != DURABILITY_GROUP:
+			return
+		with self.condition:
+			target = self.appended_records
+			if self.durable_records >= target:
+				return
+			self.condition.notify_all()
+			while self.durable_records < target and self.committer.is_alive():
+				self.condition.wait(self.group_interval)
+		if self.durable_records < target:  # committer stopped by close()
+			self.commit_pending()
+
+	def checkpoint(self) -> int:
+		"""
+		=> Saves a snapshot of the machine and starts a new journal generation, the files of the
+		previous generation are removed once the snapshot is on disk
+		:return: new generation
+		"""
+		with self.write_lock:
+			with self.condition:
+				lines, self.pending = self.pending, []
+				self.durable_records = self.appended_records
+			self.stream.write(''.join(lines))
+			self.stream.flush()
+			os.fsync(self.stream.fileno())
+			self.fsync_count += 1
+			previous = self.generation
+			self.stream.close()
+			self.generation = previous + 1
+			self.stream = open(journal_path(self.directory, self.generation), 'a', encoding='utf-8')
+		save_snapshot(self.vmo, snapshot_path(self.directory, self.generation))
+		for path in (snapshot_path(self.directory, previous), journal_path(self.directory, previous)):
+			if os.path.exists(path):
+				os.remove(path)
+		return self.generation
+
+	def close(self):
+		"""
+		=> Stops journaling: the pending records are committed and the listeners removed
+		"""
+		self.vmo.materials_dispenser.remove_containers_listener(self.on_container_change)
+		self.vmo.remove_menu_listener(self.on_menu_change)
+		self.vmo.accepted_coins.remove_coins_listener(self.on_coins_change)
+		self.vmo.financials.remove_financials_listener(self.on_financials_change)
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+		if self.committer is not None:
+			self.committer.join()
+		self.commit_pending()
+		self.stream.close()
+
+
+def apply_record(vmo: VendingMachineOperations, record: list) -> bool:
+	"""
+	=> Replays one journal record through the machine API
+	:param vmo:
+	:param record:  # [operation, arguments...] as written by OrderJournal
+	:return: True if the record was applied False if it is not recognized or was refused
+	"""
+	operation = record[0] if record else None
+	dispenser = vmo.materials_dispenser
+	if operation == 'takeout':
+		return dispenser.takeout_material_container(record[1], record[2])
+	if operation == 'refill':
+		return dispenser.refill_material_container(record[1])
+	if operation == 'allocate':
+		return dispenser.allocate_material_container(record[1], record[2])
+	if operation == 'add_drink':
+		return vmo.drinks_menu.add_drink(record[1], record[2], record[3], record[4])
+	if operation == 'update_drink':
+		drink, price, command = record[1:4]
+		drinks_menu = vmo.drinks_menu
+		# each update changed the price or the command: the other one is already as recorded
+		if drinks_menu.get_drink_price(drink) != price and not drinks_menu.set_drink_price(drink, price):
+			return False
+		return drinks_menu.get_drink_command(drink) == command or drinks_menu.set_drink_command(drink, command)
+	if operation == 'set_menu':
+		drinks, command_trie, frozen = record[1:4]
+		drinks_menu = DrinksMenu(command_trie=command_trie)
+		for drink, price, bom, command in drinks:
+			if not drinks_menu.add_drink(drink, price, bom, command):
+				return False
+		if frozen:
+			drinks_menu.freeze()
+		vmo.set_drinks_menu(drinks_menu)
+		return True
+	if operation == 'add_coin':
+		return vmo.accepted_coins.add_accepted_coins(record[1], record[2])
+	if operation == 'load_coins':
+		return vmo.accepted_coins.load_coins(record[1], record[2])
+	if operation == 'collect':
+		return vmo.accepted_coins.collect_payment(record[1], record[2])
+	if operation == 'revenue':
+		timestamp, drink, cents, paid_cents, change_cents = record[1:6]
+		vmo.financials.add_revenue(cents / 100, drink, paid_cents, change_cents, timestamp)
+		return True
+	if operation == 'reset_revenue':
+		vmo.financials.reset_revenue()
+		return True
+	return False
+
+
+def recover_machine(
+		directory: str, thread_safe: Union[bool, None] = None
+) -> Tuple[VendingMachineOperations, int]:
+	"""
+	=> Loads the last snapshot of a journal directory and replays the journals written after it,
+	a torn last line (crash during a write: no trailing newline) is ignored and cut from the file so
+	that the records appended after recovery can be replayed, a complete line that cannot be parsed
+	raises ValueError - the records after it are never dropped
+	:param directory:
+	:param thread_safe:  # mode of the machine, None for the mode of the snapshot
+	:return: (machine, generation of the last journal)
+	"""
+	snapshots, journals = [], []
+	if os.path.isdir(directory):
+		for name in os.listdir(directory):
+			match = GENERATION_FILE.match(name)
+			if match:
+				(snapshots if match.group(1) == 'snapshot' else journals).append(int(match.group(2)))
+	if snapshots:
+		base = max(snapshots)
+		vmo = load_snapshot(snapshot_path(directory, base), thread_safe)
+	else:
+		base = 0
+		vmo = VendingMachineOperations(thread_safe=bool(thread_safe))
+	generations = sorted(generation for generation in journals if generation >= base)
+	for generation in generations:
+		with open(journal_path(directory, generation), 'rb+') as stream:
+			valid_end = 0
+			for line in stream:
+				if not line.endswith(b'\n'):
+					# only the last line of a file can miss its newline
+					stream.truncate(valid_end)
+					break
+				try:
+					record = json.loads(line)
+				except ValueError:
+					raise ValueError(
+						f'corrupt record at byte {valid_end} of {journal_path(directory, generation)}'
+					) from None
+				apply_record(vmo, record)
+				valid_end += len(line)
+	return vmo, max(generations, default=base)
+
+
+def open_journaled_machine(
+		directory: str,
+		durability: str = DURABILITY_GROUP,
+		group_interval: float = 0.005,
+		group_size: int = 1024,
+		thread_safe: Union[bool, None] = None
+) -> Tuple[VendingMachineOperations, OrderJournal]:
+	"""
+	=> Recovers the machine of a journal directory (empty machine for a new directory) and
+	journals its next changes
+	:return: (machine, journal) - close the journal to stop journaling
+	"""
+	vmo, generation = recover_machine(directory, thread_safe)
+	journal = OrderJournal(vmo, directory, generation, durability, group_interval, group_size)
+	return vmo, journal
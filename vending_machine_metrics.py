@@ -0,0 +1,308 @@
+"""
+Vending Machine Metrics
+=> Opt-in runtime metrics of the hot paths of VendingMachineOperations, the materials
+dispensers, DrinksMenu and VendingMachineFinancials: calls, failures (a refused order, a failed
+takeout, an unknown drink...) and a log-bucketed latency histogram per method
+
+enable_metrics() replaces the instrumented methods of these classes by timing wrappers and
+disable_metrics() puts the original functions back: while the metrics are off the classes are
+untouched, so the order path pays no wrapper cost at all. The wrappers are installed on the
+classes, they measure every machine of the process (methods bound before enable_metrics, e.g. the
+listeners, are not measured)
+
+It consists of the following elements:
+
+### class MethodMetrics:
+	=> calls, failures, total_ns and the latency histogram of one method
+	bucket i counts the calls of at most 2**i microseconds, the last bucket the slower ones
+
+### class MetricsRegistry:
+	## attributes:
+		methods: {'Class.method': MethodMetrics}
+	## methods:
+		def get_method_metrics(self, method):
+		def reset(self):
+		def to_json(self):
+		def to_prometheus(self):
+		def write_json(self, path):
+		def write_prometheus(self, path):
+
+### def enable_metrics(registry): / def disable_metrics(): / def is_metrics_enabled():
+	=> installs / removes the wrappers of INSTRUMENTED_METHODS
+
+### INSTRUMENTED_METHODS:
+	{class: {method name: failure predicate of the result or None}}
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from vending_machine_simulator import (
+	ArrayMaterialsContainersDispenser, DrinksMenu, MaterialsContainersDispenser, ORDER_SERVED, PAYMENT_ACCEPTED,
+	VendingMachineFinancials, VendingMachineOperations
+)
+
+# buckets of the latency histograms: 1 microsecond, 2, 4 ... 2**20 (about 1 second) then slower
+LATENCY_BUCKETS = 21
+PROMETHEUS_PREFIX = 'vms_method'
+
+
+def returned_false(result) -> bool:
+	return result is False
+
+
+def returned_unknown(result) -> bool:
+	# '#' for a drink or command not in the menu
+	return result == '#'
+
+
+def hold_refused(result) -> bool:
+	# -1 instead of a hold id
+	return result < 0
+
+
+def order_refused(result) -> bool:
+	return result[0] != ORDER_SERVED
+
+
+def payment_refused(result) -> bool:
+	return result[0] != PAYMENT_ACCEPTED
+
+
+# the getters called in the inner loops of the servings index (get_volume_material_container,
+# get_drink_bom, get_material_drinks...) are left out: timing them would cost more than they do
+CONTAINERS_METHODS = {
+	'allocate_material_container': returned_false,
+	'refill_material_container': returned_false,
+	'takeout_material_container': returned_false,
+	'takeout_materials': returned_false,
+	'reserve_materials': hold_refused,
+	'commit_hold': returned_false,
+	'release_hold': returned_false,
+	'expire_holds': None,
+}
+
+INSTRUMENTED_METHODS: Dict[type, Dict[str, Union[Callable[[Any], bool], None]]] = {
+	VendingMachineOperations: {
+		'check_drink_availability': returned_false,
+		'reserve_drink': hold_refused,
+		'ask_user_drink': returned_unknown,
+		'get_menu_offers': None,
+		'render_menu': None,
+		'checkout_payment': payment_refused,
+		'process_order': order_refused,
+		'make_drink': returned_false,
+		'make_drinks': None,
+	},
+	MaterialsContainersDispenser: CONTAINERS_METHODS,
+	# only the methods the array backend overrides, the others are those of its base class
+	ArrayMaterialsContainersDispenser: CONTAINERS_METHODS,
+	DrinksMenu: {
+		'add_drink': returned_false,
+		'set_drink_price': returned_false,
+		'set_drink_command': returned_false,
+		'get_drink_by_command': returned_unknown,
+		'match_command_prefix': None,
+		'resolve_command_prefix': returned_unknown,
+	},
+	VendingMachineFinancials: {
+		'add_revenue': None,
+		'reset_revenue': None,
+		'get_current_revenue': None,
+		'get_total_revenue': None,
+		'get_revenue_between': None,
+		'get_revenue_by_period': None,
+		'top_drinks': None,
+	},
+}
+
+
+class MethodMetrics:
+	"""
+	=> Counters and latency histogram of one instrumented method
+	"""
+	__slots__ = ('calls', 'failures', 'total_ns', 'buckets', 'lock')
+
+	def __init__(self) -> None:
+		self.calls = 0
+		self.failures = 0
+		self.total_ns = 0
+		self.buckets = [0] * (LATENCY_BUCKETS + 1)
+		# the wrappers run on every thread serving orders
+		self.lock = threading.Lock()
+
+	def record(self, elapsed_ns: int, failed: bool):
+		"""
+		Counts a call of elapsed_ns nanoseconds - bucket i holds the calls of at most 2**i microseconds
+		"""
+		bucket = min((max(elapsed_ns - 1, 0) // 1000).bit_length(), LATENCY_BUCKETS)
+		with self.lock:
+			self.calls += 1
+			self.failures += failed
+			self.total_ns += elapsed_ns
+			self.buckets[bucket] += 1
+
+
+class MetricsRegistry:
+	"""
+	=> Metrics of the instrumented methods, exported as JSON or in the Prometheus text format
+	"""
+
+	def __init__(self) -> None:
+		self.methods: Dict[str, MethodMetrics] = {}
+
+	def get_method_metrics(self, method: str) -> MethodMetrics:
+		"""
+		:param method:  # 'Class.method'
+		:return: MethodMetrics of the method, created on first use
+		"""
+		metrics = self.methods.get(method)
+		if metrics is None:
+			metrics = self.methods.setdefault(method, MethodMetrics())
+		return metrics
+
+	def reset(self):
+		"""
+		=> Zeroes every counter and histogram, the wrappers installed keep recording in this registry
+		"""
+		for metrics in self.methods.values():
+			with metrics.lock:
+				metrics.calls = metrics.failures = metrics.total_ns = 0
+				metrics.buckets = [0] * (LATENCY_BUCKETS + 1)
+
+	def to_json(self) -> Dict[str, dict]:
+		"""
+		:return: {'Class.method': {'calls', 'failures', 'total_seconds', 'buckets'}} of the methods
+		called at least once, buckets is [[upper bound in seconds or None for the slower calls, calls]]
+		"""
+		bounds = [2 ** index / 1e6 for index in range(LATENCY_BUCKETS)] + [None]
+		return {
+			method: {
+				'calls': metrics.calls,
+				'failures': metrics.failures,
+				'total_seconds': metrics.total_ns / 1e9,
+				'buckets': [[bound, count] for bound, count in zip(bounds, metrics.buckets) if count],
+			}
+			for method, metrics in sorted(self.methods.items())
+			if metrics.calls
+		}
+
+	def to_prometheus(self) -> str:
+		"""
+		:return: counters and cumulative histograms in the Prometheus text exposition format
+		"""
+		lines = [
+			f'# HELP {PROMETHEUS_PREFIX}_calls_total Calls of the instrumented VMS methods',
+			f'# TYPE {PROMETHEUS_PREFIX}_calls_total counter',
+		]
+		methods = [(method, metrics) for method, metrics in sorted(self.methods.items()) if metrics.calls]
+		lines.extend(
+			f'{PROMETHEUS_PREFIX}_calls_total{{method="{method}"}} {metrics.calls}' for method, metrics in methods
+		)
+		lines.append(f'# HELP {PROMETHEUS_PREFIX}_failures_total Failed calls (refused, not found, exception)')
+		lines.append(f'# TYPE {PROMETHEUS_PREFIX}_failures_total counter')
+		lines.extend(
+			f'{PROMETHEUS_PREFIX}_failures_total{{method="{method}"}} {metrics.failures}' for method, metrics in methods
+		)
+		lines.append(f'# HELP {PROMETHEUS_PREFIX}_latency_seconds Latency of the instrumented VMS methods')
+		lines.append(f'# TYPE {PROMETHEUS_PREFIX}_latency_seconds histogram')
+		for method, metrics in methods:
+			cumulated = 0
+			for index, count in enumerate(metrics.buckets):
+				cumulated += count
+				bound = f'{2 ** index / 1e6:g}' if index < LATENCY_BUCKETS else '+Inf'
+				lines.append(
+					f'{PROMETHEUS_PREFIX}_latency_seconds_bucket{{method="{method}",le="{bound}"}} {cumulated}'
+				)
+			lines.append(f'{PROMETHEUS_PREFIX}_latency_seconds_sum{{method="{method}"}} {metrics.total_ns / 1e9:g}')
+			lines.append(f'{PROMETHEUS_PREFIX}_latency_seconds_count{{method="{method}"}} {metrics.calls}')
+		return '\n'.join(lines) + '\n'
+
+	def write_json(self, path: str):
+		"""
+		=> Writes to_json() to a file, replaced atomically
+		"""
+		write_atomically(path, json.dumps(self.to_json(), indent=1))
+
+	def write_prometheus(self, path: str):
+		"""
+		=> Writes to_prometheus() to a file (e.g. for the textfile collector of the node exporter),
+		replaced atomically so the collector never reads a partial file
+		"""
+		write_atomically(path, self.to_prometheus())
+
+
+def write_atomically(path: str, text: str):
+	temporary = f'{path}.tmp'
+	with open(temporary, 'w', encoding='utf-8') as stream:
+		stream.write(text)
+	os.replace(temporary, path)
+
+
+def instrument(method: Callable, metrics: MethodMetrics, failed: Union[Callable[[Any], bool], None]) -> Callable:
+	"""
+	Wraps a method so that each call is timed and recorded, an exception counts as a failure
+	"""
+	perf_counter_ns = time.perf_counter_ns
+	record = metrics.record
+
+	@functools.wraps(method)
+	def instrumented(*arguments, **keywords):
+		start = perf_counter_ns()
+		try:
+			result = method(*arguments, **keywords)
+		except BaseException:
+			record(perf_counter_ns() - start, True)
+			raise
+		record(perf_counter_ns() - start, failed is not None and failed(result))
+		return result
+
+	return instrumented
+
+
+# registry of the wrappers installed and the original functions they replaced
+enabled_registry: Union[MetricsRegistry, None] = None
+original_methods: List[Tuple[type, str, Callable]] = []
+
+
+def enable_metrics(registry: Union[MetricsRegistry, None] = None) -> MetricsRegistry:
+	"""
+	=> Installs the wrappers of INSTRUMENTED_METHODS, does nothing if the metrics are already on
+	:param registry:  # registry receiving the metrics, a new one by default
+	:return: the registry the wrappers record in
+	"""
+	global enabled_registry
+	if enabled_registry is not None:
+		return enabled_registry
+	enabled_registry = registry if registry is not None else MetricsRegistry()
+	for cls, methods in INSTRUMENTED_METHODS.items():
+		for name, failed in methods.items():
+			method = cls.__dict__.get(name)
+			if method is None:  # inherited: instrumented on the class defining it
+				continue
+			metrics = enabled_registry.get_method_metrics(f'{cls.__name__}.{name}')
+			original_methods.append((cls, name, method))
+			setattr(cls, name, instrument(method, metrics, failed))
+	return enabled_registry
+
+
+def disable_metrics() -> Union[MetricsRegistry, None]:
+	"""
+	=> Puts the original methods back, the classes are then exactly as if the metrics were never on
+	:return: the registry the wrappers recorded in (None if the metrics were off)
+	"""
+	global enabled_registry
+	registry = enabled_registry
+	while original_methods:
+		cls, name, method = original_methods.pop()
+		setattr(cls, name, method)
+	enabled_registry = None
+	return registry
+
+
+def is_metrics_enabled() -> bool:
+	return enabled_registry is not None
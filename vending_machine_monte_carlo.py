@@ -0,0 +1,256 @@
+"""
+Vending Machine Monte Carlo
+=> Optional (NumPy) what-if analysis of menu and capacity configurations: thousands of random
+demand scenarios are replayed at once as arrays, one row per replication, instead of ordering
+drink after drink on VendingMachineOperations objects
+
+Each replication starts with full containers and plays the Poisson orders of one refill period
+(horizon): an order is served when the containers hold its whole bom (as check_drink_availability)
+and refused otherwise - a refused order is a lost sale and the first one is the stock-out
+
+It consists of the following elements:
+
+### def alias_table(probabilities):
+	=> Walker / Vose alias table sampling the drinks ordered in O(1)
+
+### class MonteCarloAnalysis:
+	=> Compiles the drinks menu (boms, prices) and the containers capacities of a machine with
+	CompiledRecipeMatrix and estimates, per configuration, the time to the first stock-out, the
+	servings and revenue before the refill and the revenue at risk (lost sales)
+
+	## attributes:
+		drinks, materials: rows / columns of the compiled recipes
+		recipes, requires: drinks x materials matrices (see CompiledRecipeMatrix)
+		prices: drinks vector, capacities: materials vector (-1 without container)
+
+	## methods:
+		def configuration(self, capacities, drinks_weights):
+		def run(self, configurations, replications, horizon, customers_per_hour):
+
+### configurations (dictionaries, all the keys optional):
+	{'capacities': {material: capacity}, 'drinks_weights': {drink: relative popularity}}
+	missing capacities are those of the machine, missing weights are 0 (all the drinks equally
+	popular when no weight is given)
+
+### results (one dictionary per configuration):
+	stockout_probability: share of the replications with a lost sale before the horizon
+	mean_time_to_stockout: seconds, replications without stock-out count as the horizon
+	median_time_to_stockout: seconds, the horizon when most replications never stock out
+	expected_servings, expected_revenue: served before the refill
+	revenue_at_risk, revenue_at_risk_p95: mean / 95th percentile of the lost sales revenue
+
+NumPy is an optional dependency of the simulator: it is only required by this module
+"""
+
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from vending_machine_recipe_matrix import CompiledRecipeMatrix
+
+# volumes (replications x configurations x materials) held at once by run()
+MONTE_CARLO_BATCH_CELLS = 1 << 22
+
+
+def alias_table(probabilities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	=> Walker / Vose alias table of a discrete distribution: index i = floor(u * n) is kept when
+	the fraction of u * n is below thresholds[i] and replaced by aliases[i] otherwise
+	:param probabilities:  # vector summing to 1
+	:return: (thresholds, aliases) vectors
+	"""
+	count = len(probabilities)
+	scaled = np.asarray(probabilities, dtype=float) * count
+	thresholds = np.ones(count)
+	aliases = np.arange(count)
+	small = [index for index in range(count) if scaled[index] < 1]
+	large = [index for index in range(count) if scaled[index] >= 1]
+	while small and large:
+		index, alias = small.pop(), large.pop()
+		thresholds[index], aliases[index] = scaled[index], alias
+		scaled[alias] -= 1 - scaled[index]
+		(small if scaled[alias] < 1 else large).append(alias)
+	return thresholds, aliases
+
+
+class MonteCarloAnalysis:
+	"""
+	=> Vectorized Monte Carlo replications of the orders of one machine under several
+	configurations of its containers capacities and drinks popularity
+
+	The orders are replayed step by step (an order served changes the volumes the next one sees)
+	but each step is a handful of array operations over every replication of every configuration
+
+	external methods activated:
+		CompiledRecipeMatrix (compile then detach)
+		drinks_menu.get_drink_price
+		materials_dispenser.get_capacity_material_container
+	"""
+
+	def __init__(self, drinks_menu, materials_dispenser, seed: Union[int, None] = 0) -> None:
+		"""
+		:param drinks_menu:  # DrinksMenu whose drinks are ordered
+		:param materials_dispenser:  # capacities of the containers (the default configuration)
+		:param seed:  # seed of the random scenarios, None for a random seed
+		"""
+		matrix = CompiledRecipeMatrix(drinks_menu, materials_dispenser)
+		matrix.detach()
+		self.drinks: List[str] = matrix.drinks
+		self.drinks_index: Dict[str, int] = matrix.drinks_index
+		self.materials: List[str] = matrix.materials
+		self.materials_index: Dict[str, int] = matrix.materials_index
+		self.recipes = matrix.recipes
+		self.requires = matrix.requires
+		self.prices = np.array([drinks_menu.get_drink_price(drink) for drink in self.drinks], dtype=float)
+		# get_capacity_material_container returns -1 when the material has no container
+		self.capacities = np.array(
+			[materials_dispenser.get_capacity_material_container(material) for material in self.materials],
+			dtype=float
+		)
+		# sparse form of the recipes, one row per position in the boms and one column per drink:
+		# the column of each material of a bom and its volume, padded with the column len(materials)
+		# whose volume is unlimited so that every order checks the same number of containers
+		bom_size = max(1, int(self.requires.sum(axis=1).max(initial=0)))
+		self.bom_columns = np.full((bom_size, len(self.drinks)), len(self.materials), dtype=np.intp)
+		self.bom_volumes = np.zeros((bom_size, len(self.drinks)))
+		for row in range(len(self.drinks)):
+			columns = np.flatnonzero(self.requires[row])
+			self.bom_columns[:len(columns), row] = columns
+			self.bom_volumes[:len(columns), row] = self.recipes[row, columns]
+		self.generator = np.random.default_rng(seed)
+
+	def configuration(
+			self,
+			capacities: Union[Dict[str, float], None] = None,
+			drinks_weights: Union[Dict[str, float], None] = None
+	) -> Dict[str, np.ndarray]:
+		"""
+		=> Compiles a configuration to a capacities vector and a drinks probabilities vector
+		:param capacities:  # {material: capacity} replacing the machine capacities
+		:param drinks_weights:  # {drink: relative popularity}, all the drinks equally by default
+		:return: {'capacities': materials vector, 'probabilities': drinks vector}
+		:raise ValueError: for an unknown drink, a negative weight or weights summing to 0
+		"""
+		configured_capacities = self.capacities.copy()
+		for material, capacity in (capacities or {}).items():
+			column = self.materials_index.get(material)
+			if column is not None:  # materials used by no drink do not matter
+				configured_capacities[column] = capacity
+		if drinks_weights is None:
+			weights = np.ones(len(self.drinks))
+		else:
+			weights = np.zeros(len(self.drinks))
+			for drink, weight in drinks_weights.items():
+				if drink not in self.drinks_index or weight < 0:
+					raise ValueError(f'invalid popularity {weight!r} of drink {drink!r}')
+				weights[self.drinks_index[drink]] = weight
+		if len(self.drinks) == 0 or weights.sum() <= 0:
+			raise ValueError('no drink can be ordered in this configuration')
+		return {'capacities': configured_capacities, 'probabilities': weights / weights.sum()}
+
+	def run(
+			self,
+			configurations: Union[List[dict], None] = None,
+			replications: int = 10_000,
+			horizon: float = 24 * 3600,
+			customers_per_hour: float = 20
+	) -> List[Dict[str, float]]:
+		"""
+		=> Estimates the results of each configuration (see the module docstring)
+		:param configurations:  # list of configuration dictionaries, [{}] (the machine as is) by default
+		:param replications:  # random demand scenarios per configuration
+		:param horizon:  # seconds between two refills
+		:param customers_per_hour:  # mean rate of the Poisson orders
+		:return: list of results, in configurations order
+		"""
+		compiled = [self.configuration(**configuration) for configuration in (configurations or [{}])]
+		batch = max(1, MONTE_CARLO_BATCH_CELLS // (replications * (len(self.materials) + 1)))
+		results = []
+		for first in range(0, len(compiled), batch):
+			results.extend(self.run_batch(compiled[first:first + batch], replications, horizon, customers_per_hour))
+		return results
+
+	def run_batch(
+			self,
+			compiled: List[Dict[str, np.ndarray]],
+			replications: int,
+			horizon: float,
+			customers_per_hour: float
+	) -> List[Dict[str, float]]:
+		"""
+		Replays the orders of all the replications of a batch of compiled configurations, one order
+		of every replication per step until they all reached the horizon
+		The replications of all the configurations are flattened in one dimension (configuration
+		major) and the volumes in a flat array read and written with take / put
+		"""
+		configurations = len(compiled)
+		drinks_count = len(self.drinks)
+		width = len(self.materials) + 1
+		shape = (configurations, replications)
+		size = configurations * replications
+		thresholds, aliases = zip(*(alias_table(configuration['probabilities']) for configuration in compiled))
+		thresholds, aliases = np.concatenate(thresholds), np.concatenate(aliases)
+		# offset of the alias table of the configuration of each replication
+		tables = np.repeat(np.arange(configurations) * drinks_count, replications)
+
+		capacities = np.stack([configuration['capacities'] for configuration in compiled])
+		capacities[capacities < 0] = -np.inf  # no container: the drinks requiring it are never served
+		volumes = np.empty((configurations, replications, width))
+		volumes[:, :, :-1] = capacities[:, np.newaxis, :]
+		volumes[:, :, -1] = np.inf
+		volumes = volumes.ravel()
+		bases = np.arange(size) * width
+
+		served = np.zeros(size, dtype=np.int64)
+		revenue = np.zeros(size)
+		lost_revenue = np.zeros(size)
+		stockout_times = np.full(size, np.inf)
+		times = np.zeros(size)
+		while True:
+			times += self.generator.exponential(3600 / customers_per_hour, size)
+			in_horizon = times <= horizon
+			if not in_horizon.any():
+				break
+			# drinks ordered: alias method sampling, O(1) per order whatever the menu size
+			uniforms = self.generator.random(size) * drinks_count
+			drinks = uniforms.astype(np.intp)
+			np.minimum(drinks, drinks_count - 1, out=drinks)
+			entries = drinks + tables
+			drinks = np.where(uniforms - drinks < thresholds.take(entries), drinks, aliases.take(entries))
+
+			cells = self.bom_columns.take(drinks, axis=1)
+			cells += bases
+			demand = self.bom_volumes.take(drinks, axis=1)
+			available = volumes.take(cells)
+			feasible = available[0] >= demand[0]
+			for position in range(1, len(demand)):
+				feasible &= available[position] >= demand[position]
+			serve = feasible & in_horizon
+			lose = in_horizon & ~feasible
+			# the cells of one order are distinct: put writes each volume once
+			available -= demand * serve
+			volumes.put(cells, available)
+
+			prices = self.prices.take(drinks)
+			served += serve
+			revenue += prices * serve
+			lost_revenue += prices * lose
+			first_loss = lose & np.isinf(stockout_times)
+			stockout_times[first_loss] = times[first_loss]
+
+		served, revenue, lost_revenue, stockout_times = (
+			array.reshape(shape) for array in (served, revenue, lost_revenue, stockout_times)
+		)
+		censored_times = np.minimum(stockout_times, horizon)
+		return [
+			{
+				'stockout_probability': float(np.mean(np.isfinite(stockout_times[index]))),
+				'mean_time_to_stockout': float(censored_times[index].mean()),
+				'median_time_to_stockout': float(np.median(censored_times[index])),
+				'expected_servings': float(served[index].mean()),
+				'expected_revenue': float(revenue[index].mean()),
+				'revenue_at_risk': float(lost_revenue[index].mean()),
+				'revenue_at_risk_p95': float(np.percentile(lost_revenue[index], 95)),
+			}
+			for index in range(configurations)
+		]
@@ -0,0 +1,225 @@
+"""
+Vending Machine Order Pipeline
+=> Headless, non interactive engine replaying a stream of order and payment events through
+VendingMachineOperations (check_drink_availability -> checkout -> make_drink -> add_revenue)
+
+The events are consumed lazily, one at a time, and the results are yielded as soon as they are
+known: memory only holds the orders waiting for their payment, bounded by max_pending
+
+It consists of the following elements:
+
+### events (dictionaries, one JSON object per line in JSONL sources):
+	{"event": "order", "order_id": id, "drink": name}        # or "command": keystrokes
+	{"event": "payment", "order_id": id, "coins": {coin name: number of coins}}
+	{"event": "order", "order_id": id, "drink": name, "coins": {...}}   # order paid at once
+
+### results (dictionaries):
+	{"order_id": id, "drink": name, "outcome": outcome, "change": amount, "change_coins": {coin: count}}
+	change_coins are the coins handed back (the change, or the payment if the order is not served)
+	outcome is one of the VendingMachineOperations.process_order outcomes or
+	PIPELINE_UNKNOWN_ORDER, PIPELINE_INVALID_EVENT, PIPELINE_ABANDONED
+	an event whose order_id is None or not hashable, whose drink or command is not a string, whose
+	coins are not non-negative integer counts, or which orders again an order_id still pending is
+	reported as PIPELINE_INVALID_EVENT
+
+### class OrderPipeline:
+	## attributes:
+		vmo: the VendingMachineOperations the events are applied to
+		pending_orders: {order_id: drink} orders waiting for their payment
+		events_count, results_count, elapsed_seconds: statistics of the last/current run
+	## methods:
+		def process(self, events):
+		def process_event(self, event):
+		def valid_event_fields(self, event):
+		def events_per_second(self):
+
+### def read_jsonl_events(source):
+	=> Lazily reads events from a JSONL file path, an open file or '-' (stdin)
+
+### def write_jsonl_results(results, destination):
+	=> Writes results as JSON lines, returns the number of results written
+"""
+
+import json
+import sys
+import time
+from typing import Dict, IO, Iterable, Iterator, List, Union
+
+from vending_machine_simulator import ORDER_UNKNOWN_DRINK, VendingMachineOperations
+
+# outcomes produced by the pipeline itself
+PIPELINE_UNKNOWN_ORDER = 'unknown_order'  # payment of an order never seen (or already settled)
+PIPELINE_INVALID_EVENT = 'invalid_event'  # event type or fields not recognized, duplicate pending order
+PIPELINE_ABANDONED = 'abandoned'  # order dropped unpaid to keep max_pending orders in memory
+
+
+class OrderPipeline:
+	"""
+	=> Applies a stream of order / payment events to one VendingMachineOperations
+
+	external methods activated:
+		vmo.drinks_menu.exist_drink
+		vmo.drinks_menu.get_drink_by_command
+		vmo.get_payment_amount
+		vmo.process_order
+		vmo.accepted_coins.get_coins_cents
+		vmo.accepted_coins.valid_coins_counts
+	"""
+
+	def __init__(self, vmo: VendingMachineOperations, max_pending: int = 100_000) -> None:
+		"""
+		:param vmo:  # machine the events are applied to
+		:param max_pending:  # orders kept waiting for their payment, the oldest is abandoned beyond
+		"""
+		self.vmo = vmo
+		self.max_pending = max_pending
+		self.pending_orders: Dict[str, str] = {}
+		self.events_count: int = 0
+		self.results_count: int = 0
+		self.elapsed_seconds: float = 0.0
+
+	def process(self, events: Iterable[dict]) -> Iterator[dict]:
+		"""
+		=> Lazily applies the events and yields the results
+		Statistics are updated as the stream is consumed
+		:param events:  # any iterable of events: generator, read_jsonl_events(...), list
+		:return: generator of results
+		"""
+		start = time.perf_counter() - self.elapsed_seconds
+		for event in events:
+			self.events_count += 1
+			for result in self.process_event(event):
+				self.results_count += 1
+				yield result
+			self.elapsed_seconds = time.perf_counter() - start
+
+	def process_event(self, event: dict) -> List[dict]:
+		"""
+		=> Applies one event
+		:param event:
+		:return: list of the results it produced (usually 0 or 1)
+		"""
+		if not isinstance(event, dict):
+			return [self.result(None, None, PIPELINE_INVALID_EVENT)]
+		order_id = event.get('order_id')
+		event_type = event.get('event')
+		coins = event.get('coins')
+		if not self.valid_event_fields(event):
+			return [self.result(order_id, None, PIPELINE_INVALID_EVENT)]
+
+		if event_type == 'order':
+			if order_id in self.pending_orders:
+				# the pending order keeps waiting for its payment
+				return [self.result(order_id, None, PIPELINE_INVALID_EVENT)]
+			ordered_drink = event.get('drink')
+			if ordered_drink is None and 'command' in event:
+				ordered_drink = self.vmo.drinks_menu.get_drink_by_command(event['command'])
+			if not self.vmo.drinks_menu.exist_drink(ordered_drink):
+				change_coins = dict(coins) if coins is not None else {}
+				return [self.result(order_id, ordered_drink, ORDER_UNKNOWN_DRINK, change_coins)]
+			if coins is not None:
+				return [self.settle(order_id, ordered_drink, coins)]
+			results = []
+			self.pending_orders[order_id] = ordered_drink
+			if len(self.pending_orders) > self.max_pending:
+				abandoned_id = next(iter(self.pending_orders))
+				abandoned_drink = self.pending_orders.pop(abandoned_id)
+				results.append(self.result(abandoned_id, abandoned_drink, PIPELINE_ABANDONED))
+			return results
+
+		if event_type == 'payment':
+			if coins is None:
+				return [self.result(order_id, None, PIPELINE_INVALID_EVENT)]
+			ordered_drink = self.pending_orders.pop(order_id, None)
+			if ordered_drink is None:
+				return [self.result(order_id, None, PIPELINE_UNKNOWN_ORDER, dict(coins))]
+			return [self.settle(order_id, ordered_drink, coins)]
+
+		return [self.result(order_id, None, PIPELINE_INVALID_EVENT)]
+
+	def valid_event_fields(self, event: dict) -> bool:
+		"""
+		Checks the fields of an event before they are used as keys or amounts: order_id is a
+		hashable value other than None, drink and command (if given) are strings, coins (if given)
+		map coin names to non-negative integers
+		"""
+		order_id = event.get('order_id')
+		if order_id is None:
+			return False
+		for name in ('drink', 'command'):
+			if event.get(name) is not None and not isinstance(event[name], str):
+				return False
+		try:
+			hash(order_id)
+		except TypeError:
+			return False
+		coins = event.get('coins')
+		return coins is None or isinstance(coins, dict) and self.vmo.accepted_coins.valid_coins_counts(coins)
+
+	def settle(self, order_id, ordered_drink: str, coins: Dict[str, int]) -> dict:
+		"""
+		Runs the checkout of a paid order
+		:return: result of the order
+		"""
+		outcome, change_coins = self.vmo.process_order(ordered_drink, coins)
+		return self.result(order_id, ordered_drink, outcome, change_coins)
+
+	def result(
+			self, order_id, ordered_drink, outcome: str, change_coins: Union[Dict[str, int], None] = None
+	) -> dict:
+		"""
+		Builds a result, change is the amount of the accepted coins among change_coins
+		"""
+		change_coins = change_coins or {}
+		change = self.vmo.accepted_coins.get_coins_cents(change_coins) / 100 if change_coins else 0
+		return {
+			'order_id': order_id, 'drink': ordered_drink, 'outcome': outcome,
+			'change': change, 'change_coins': change_coins
+		}
+
+	def events_per_second(self) -> float:
+		"""
+		:return: throughput of the events processed so far
+		"""
+		if self.elapsed_seconds <= 0:
+			return 0.0
+		return self.events_count / self.elapsed_seconds
+
+
+def read_jsonl_events(source: Union[str, IO[str]]) -> Iterator[dict]:
+	"""
+	=> Lazily reads one event per line, blank lines are skipped, malformed lines yield None
+	(reported as PIPELINE_INVALID_EVENT by the pipeline)
+	:param source:  # path of a JSONL file, an open text file or '-' for stdin
+	:return: generator of events
+	"""
+	if isinstance(source, str):
+		if source == '-':
+			yield from read_jsonl_events(sys.stdin)
+			return
+		with open(source, encoding='utf-8') as stream:
+			yield from read_jsonl_events(stream)
+		return
+	for line in source:
+		line = line.strip()
+		if not line:
+			continue
+		try:
+			yield json.loads(line)
+		except ValueError:
+			yield None
+
+
+def write_jsonl_results(results: Iterable[dict], destination: IO[str]) -> int:
+	"""
+	=> Writes one JSON object per result
+	:param results:  # e.g. OrderPipeline.process(...)
+	:param destination:  # open text file (sys.stdout for a shell pipe)
+	:return: number of results written
+	"""
+	count = 0
+	for result in results:
+		destination.write(json.dumps(result))
+		destination.write('\n')
+		count += 1
+	return count
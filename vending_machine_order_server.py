@@ -0,0 +1,260 @@
+"""
+Vending Machine Order Server
+=> asyncio front-end serving the menu -> selection -> payment -> dispense flow of
+VendingMachineOperations over a local TCP or Unix socket, one coroutine per customer session
+
+All the sessions share one VendingMachineOperations: every state change is done by
+VendingMachineOperations.process_order, a synchronous call between two awaits, so the sessions
+interleaved on the event loop never observe a half made order
+
+It consists of the following elements:
+
+### class VendingMachineOrderServer:
+	=> Serves customer sessions with the following line protocol (fields separated by tabs):
+		server: MENU <command> <drink> <price>   # one line per drink available right now
+		server: CHOOSE
+		client: <command>
+		server: PRICE <price>                    # only if the drink can be ordered, its ingredients
+												 # are then held until the end of the payment
+		server: COIN <coin> <value>              # for each accepted coin until the price is covered
+		client: <number of coins>
+		server: RESULT <outcome> <change>        # outcome of VendingMachineOperations.process_order
+		                                         # and amount of the coins handed back
+
+	## attributes:
+		vmo: the shared VendingMachineOperations
+		sessions_count, active_sessions: sessions served since start / currently open
+		orders_outcomes: {outcome: number of sessions}
+
+	## methods:
+		async def start(self, host, port):
+		async def start_unix(self, path):
+		async def handle_session(self, reader, writer):
+		async def close(self):
+
+### async def simulated_customer(host, port, path, command):
+	=> Plays one customer session against a server, returns (outcome, change)
+
+### async def run_simulated_customers(customers, host, port, path, commands, concurrency):
+	=> Plays many concurrent customer sessions, returns {outcome: number of sessions}
+"""
+
+import asyncio
+import math
+import random
+from typing import Dict, List, Tuple, Union
+
+from vending_machine_simulator import (
+	ORDER_UNAVAILABLE, ORDER_UNKNOWN_DRINK, RESERVATION_SECONDS, VendingMachineOperations
+)
+
+
+class VendingMachineOrderServer:
+	"""
+	=> asyncio server running the customer sessions of one VendingMachineOperations
+
+	external methods activated:
+		vmo.get_menu_offers
+		vmo.reserve_drink
+		vmo.get_payment_amount
+		vmo.process_order
+		vmo.materials_dispenser.release_hold
+		vmo.drinks_menu.get_drink_by_command
+		vmo.drinks_menu.get_drink_price
+		vmo.accepted_coins.get_all_coins
+		vmo.accepted_coins.get_coin_value
+		vmo.accepted_coins.get_coins_cents
+	"""
+
+	def __init__(
+			self,
+			vmo: VendingMachineOperations,
+			session_timeout: float = 60.0,
+			hold_duration: float = RESERVATION_SECONDS
+	) -> None:
+		"""
+		:param vmo:  # machine state shared by all the sessions
+		:param session_timeout:  # seconds a customer may take to answer before the session is dropped
+		:param hold_duration:  # seconds the ingredients of a drink are held for the customer paying it
+		"""
+		self.vmo = vmo
+		self.session_timeout = session_timeout
+		self.hold_duration = hold_duration
+		self.sessions_count: int = 0
+		self.active_sessions: int = 0
+		self.orders_outcomes: Dict[str, int] = {}
+		self.server: Union[asyncio.AbstractServer, None] = None
+
+	async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[str, int]:
+		"""
+		=> Starts listening on a local TCP socket
+		:param host:
+		:param port:  # 0 lets the system pick a free port
+		:return: (host, port) actually listened to
+		"""
+		self.server = await asyncio.start_server(self.handle_session, host, port, backlog=4096)
+		return self.server.sockets[0].getsockname()[:2]
+
+	async def start_unix(self, path: str) -> str:
+		"""
+		=> Starts listening on a Unix socket
+		:param path:  # file system path of the socket
+		:return: path
+		"""
+		self.server = await asyncio.start_unix_server(self.handle_session, path, backlog=4096)
+		return path
+
+	async def close(self):
+		"""
+		=> Stops listening, sessions in progress are left to finish
+		"""
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+			self.server = None
+
+	async def read_answer(self, reader: asyncio.StreamReader) -> str:
+		"""
+		Waits for the next customer line
+		:return: the line without its end of line
+		:raise ConnectionError: if the customer left
+		"""
+		line = await asyncio.wait_for(reader.readline(), self.session_timeout)
+		if not line:
+			raise ConnectionError('customer left the session')
+		# undecodable bytes are replaced: a garbled line is a wrong answer, not a crashed session
+		return line.decode(errors='replace').strip()
+
+	async def handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		"""
+		=> Runs one customer session: menu, selection, payment, dispense
+		"""
+		self.sessions_count += 1
+		self.active_sessions += 1
+		hold_id = -1
+		try:
+			menu = [
+				f'MENU\t{command}\t{drink}\t{price}\n' for drink, price, command in self.vmo.get_menu_offers()
+			]
+			menu.append('CHOOSE\n')
+			writer.write(''.join(menu).encode())
+			await writer.drain()
+
+			user_choice = await self.read_answer(reader)
+			ordered_drink = self.vmo.drinks_menu.get_drink_by_command(user_choice)
+			if ordered_drink != '#':
+				# the serving is held while the customer pays: another session cannot take it
+				hold_id = self.vmo.reserve_drink(ordered_drink, self.hold_duration)
+			if ordered_drink == '#':
+				outcome, change = ORDER_UNKNOWN_DRINK, 0
+			elif hold_id < 0:
+				outcome, change = ORDER_UNAVAILABLE, 0
+			else:
+				drink_price = self.vmo.drinks_menu.get_drink_price(ordered_drink)
+				writer.write(f'PRICE\t{drink_price}\n'.encode())
+				inserted_coins: Dict[str, int] = {}
+				for coin in self.vmo.accepted_coins.get_all_coins():
+					coin_value = self.vmo.accepted_coins.get_coin_value(coin)
+					writer.write(f'COIN\t{coin}\t{coin_value}\n'.encode())
+					await writer.drain()
+					answer = await self.read_answer(reader)
+					# '²' is a digit int() refuses
+					inserted_coins[coin] = int(answer) if answer.isascii() and answer.isdigit() else 0
+					if self.vmo.get_payment_amount(inserted_coins) >= drink_price:
+						break
+				# no await from here on: the order is checked and committed in one step
+				outcome, change_coins = self.vmo.process_order(ordered_drink, inserted_coins, hold_id)
+				change = self.vmo.accepted_coins.get_coins_cents(change_coins) / 100
+
+			self.orders_outcomes[outcome] = self.orders_outcomes.get(outcome, 0) + 1
+			writer.write(f'RESULT\t{outcome}\t{change}\n'.encode())
+			await writer.drain()
+		except (asyncio.TimeoutError, ConnectionError):
+			pass
+		finally:
+			# payment refused or customer gone: the held serving goes back to the other sessions
+			# (a hold committed by process_order is already over)
+			if hold_id >= 0:
+				self.vmo.materials_dispenser.release_hold(hold_id)
+			self.active_sessions -= 1
+			writer.close()
+
+
+async def simulated_customer(
+		host: str = '127.0.0.1',
+		port: int = 0,
+		path: Union[str, None] = None,
+		command: Union[str, None] = None
+) -> Tuple[str, float]:
+	"""
+	=> Plays one customer session: picks a drink of the menu and pays it coin type after coin type
+	:param host:  # TCP server address (ignored if path is given)
+	:param port:
+	:param path:  # Unix socket of the server
+	:param command:  # keystrokes to type, by default a random drink of the menu
+	:return: (outcome, change) as sent by the server
+	"""
+	if path is not None:
+		reader, writer = await asyncio.open_unix_connection(path)
+	else:
+		reader, writer = await asyncio.open_connection(host, port)
+	try:
+		commands: List[str] = []
+		while True:
+			fields = (await reader.readline()).decode().rstrip('\n').split('\t')
+			if fields[0] == 'MENU':
+				commands.append(fields[1])
+			elif fields[0] == 'CHOOSE':
+				break
+			else:
+				raise ConnectionError(f'unexpected server line {fields}')
+		if command is None:
+			command = random.choice(commands) if commands else '#'
+		writer.write(f'{command}\n'.encode())
+
+		remaining = 0.0
+		while True:
+			fields = (await reader.readline()).decode().rstrip('\n').split('\t')
+			if fields[0] == 'PRICE':
+				remaining = float(fields[1])
+			elif fields[0] == 'COIN':
+				number_coins = max(0, math.ceil(round(remaining / float(fields[2]), 6)))
+				remaining -= number_coins * float(fields[2])
+				writer.write(f'{number_coins}\n'.encode())
+			elif fields[0] == 'RESULT':
+				return fields[1], float(fields[2])
+			else:
+				raise ConnectionError(f'unexpected server line {fields}')
+	finally:
+		writer.close()
+
+
+async def run_simulated_customers(
+		customers: int,
+		host: str = '127.0.0.1',
+		port: int = 0,
+		path: Union[str, None] = None,
+		commands: Union[List[str], None] = None,
+		concurrency: int = 512
+) -> Dict[str, int]:
+	"""
+	=> Plays many customer sessions at once against a server
+	:param customers:  # number of sessions
+	:param host:
+	:param port:
+	:param path:  # Unix socket of the server
+	:param commands:  # keystrokes typed by the customers in turn, by default random menu choices
+	:param concurrency:  # maximum number of sessions open at the same time
+	:return: {outcome: number of sessions}
+	"""
+	semaphore = asyncio.Semaphore(concurrency)
+	outcomes: Dict[str, int] = {}
+
+	async def customer(number: int):
+		command = commands[number % len(commands)] if commands else None
+		async with semaphore:
+			outcome, _ = await simulated_customer(host, port, path, command)
+		outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+	await asyncio.gather(*(customer(number) for number in range(customers)))
+	return outcomes
@@ -0,0 +1,184 @@
+"""
+Vending Machine Recipe Matrix
+=> Optional compiled (NumPy) form of the drinks menu used to check every drink at once
+
+It consists of the following elements:
+
+### class CompiledRecipeMatrix:
+	=> Interns material names to column indices and compiles the drinks_menu boms into a dense
+	drinks x materials matrix, the containers volumes available (volume minus the holds) become a
+	vector kept up to date by a MaterialsContainersDispenser listener. One vectorized operation returns the availability
+	and max servings of every drink, giving the same results as the dict based
+	VendingMachineOperations.check_drink_availability / compute_drink_servings
+
+	## attributes:
+		drinks: list of drinks (row order)
+		drinks_index: {drink string: row index}
+		materials: list of materials (column order)
+		materials_index: {material string: column index}
+		recipes: drinks x materials float matrix of required volumes
+		requires: drinks x materials bool matrix, True where the material figures in the bom
+		volumes: materials float vector of the available volumes, -1 where the material has no container
+
+	## methods:
+		def compile(self):
+		def ensure_compiled(self):
+		def on_container_change(self, operation, material, amount):
+		def max_servings(self):
+		def availability(self):
+		def available_drinks(self):
+		def servings_by_drink(self):
+		def detach(self):
+
+### def compile_recipe_matrix(vmo):
+	=> Builds the CompiledRecipeMatrix of a VendingMachineOperations object
+
+NumPy is an optional dependency of the simulator: it is only required by this module
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from vending_machine_simulator import UNLIMITED_SERVINGS
+
+
+class CompiledRecipeMatrix:
+	"""
+	=> Dense drinks x materials compiled form of a DrinksMenu bound to a MaterialsContainersDispenser
+
+	The matrix is recompiled only when drinks_menu.menu_version changes, container changes update
+	a single entry of the volumes vector so repeated checks reuse the compiled matrix
+
+	external methods activated:
+		drinks_menu.get_all_drinks
+		drinks_menu.get_drink_bom
+		materials_dispenser.get_available_volume_material_container
+		materials_dispenser.expire_holds
+		materials_dispenser.add_containers_listener
+		materials_dispenser.remove_containers_listener
+	"""
+
+	def __init__(self, drinks_menu, materials_dispenser) -> None:
+		self.drinks_menu = drinks_menu
+		self.materials_dispenser = materials_dispenser
+		self.menu_version: int = -1
+		self.drinks: List[str] = []
+		self.drinks_index: Dict[str, int] = {}
+		self.materials: List[str] = []
+		self.materials_index: Dict[str, int] = {}
+		self.recipes = np.zeros((0, 0))
+		self.requires = np.zeros((0, 0), dtype=bool)
+		self.consumes = np.zeros((0, 0), dtype=bool)
+		self.volumes = np.zeros(0)
+		self.materials_dispenser.add_containers_listener(self.on_container_change)
+		self.compile()
+
+	def compile(self):
+		"""
+		=> Interns the materials of every bom and builds the recipes matrix and volumes vector
+		"""
+		self.drinks = self.drinks_menu.get_all_drinks()
+		self.drinks_index = {drink: row for row, drink in enumerate(self.drinks)}
+		self.materials = []
+		self.materials_index = {}
+		boms = [self.drinks_menu.get_drink_bom(drink) for drink in self.drinks]
+		for bom in boms:
+			for material in bom:
+				if material not in self.materials_index:
+					self.materials_index[material] = len(self.materials)
+					self.materials.append(material)
+
+		self.recipes = np.zeros((len(self.drinks), len(self.materials)))
+		self.requires = np.zeros((len(self.drinks), len(self.materials)), dtype=bool)
+		for row, bom in enumerate(boms):
+			for material, vol_required in bom.items():
+				column = self.materials_index[material]
+				self.recipes[row, column] = vol_required
+				self.requires[row, column] = True
+		self.consumes = self.requires & (self.recipes > 0)
+
+		# get_available_volume_material_container returns -1 when the material has no container
+		self.volumes = np.array(
+			[self.materials_dispenser.get_available_volume_material_container(m) for m in self.materials],
+			dtype=float
+		)
+		self.menu_version = self.drinks_menu.menu_version
+
+	def ensure_compiled(self):
+		"""
+		=> Recompiles the matrix if the drinks_menu changed since the last compile
+		"""
+		if self.menu_version != self.drinks_menu.menu_version:
+			self.compile()
+
+	def on_container_change(self, operation: str, material: str, amount):
+		"""
+		Listener of materials_dispenser: refreshes the volume entry of the material
+		:param operation:  # 'allocate', 'refill', 'takeout', 'hold' or 'release'
+		:param material:
+		:param amount:  # not used, the available volume is read back from the dispenser
+		"""
+		column = self.materials_index.get(material)
+		if column is not None:
+			self.volumes[column] = self.materials_dispenser.get_available_volume_material_container(material)
+
+	def max_servings(self) -> np.ndarray:
+		"""
+		=> Returns the number of servings of every drink (drinks order) in one vectorized operation
+		:return: int64 vector, 0 if an ingredient lacks a container or volume, UNLIMITED_SERVINGS
+		if the bom does not consume any volume
+		"""
+		self.ensure_compiled()
+		# the expired holds give their volume back (release listeners) as for the dict path
+		if self.materials_dispenser.holds:
+			self.materials_dispenser.expire_holds()
+		volumes = self.volumes[np.newaxis, :]
+		has_containers = np.all((volumes >= 0) | ~self.requires, axis=1)
+		ratios = np.full(self.recipes.shape, np.inf)
+		np.floor_divide(
+			np.broadcast_to(np.maximum(volumes, 0), self.recipes.shape), self.recipes,
+			out=ratios, where=self.consumes
+		)
+		min_ratios = ratios.min(axis=1, initial=np.inf)
+		limited = np.isfinite(min_ratios)
+		# UNLIMITED_SERVINGS does not survive a float64 round trip, so it is set on the int vector
+		servings = np.full(len(self.drinks), UNLIMITED_SERVINGS, dtype=np.int64)
+		servings[limited] = min_ratios[limited]
+		servings[~has_containers] = 0
+		return servings
+
+	def availability(self) -> np.ndarray:
+		"""
+		=> Returns for every drink (drinks order) True if it can be made False otherwise
+		"""
+		return self.max_servings() > 0
+
+	def available_drinks(self) -> list:
+		"""
+		=> Returns the drinks that can be ordered right now, in drinks_menu order
+		"""
+		available = self.availability()  # recompiles first so self.drinks matches
+		return [drink for drink, flag in zip(self.drinks, available) if flag]
+
+	def servings_by_drink(self) -> Dict[str, int]:
+		"""
+		=> Returns the max servings as a {drink: servings} dictionary
+		"""
+		servings = self.max_servings().tolist()
+		return dict(zip(self.drinks, servings))
+
+	def detach(self):
+		"""
+		=> Stops following the containers changes of materials_dispenser
+		"""
+		self.materials_dispenser.remove_containers_listener(self.on_container_change)
+
+
+def compile_recipe_matrix(vmo) -> CompiledRecipeMatrix:
+	"""
+	=> Builds the CompiledRecipeMatrix of a VendingMachineOperations object
+	:param vmo:  # VendingMachineOperations whose drinks_menu and materials_dispenser are compiled
+	:return: CompiledRecipeMatrix following the changes of vmo.materials_dispenser
+	"""
+	return CompiledRecipeMatrix(vmo.drinks_menu, vmo.materials_dispenser)
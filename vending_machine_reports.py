@@ -0,0 +1,187 @@
+"""
+Vending Machine Reports
+=> Streams the containers levels of a fleet of machines as CSV or JSON lines, in full or as
+deltas, instead of DrinksBusinessMaintenance.report_containers_levels printing free-form text
+per container of one machine
+
+Each machine registered in an InventoryReporter gets a containers listener marking the materials
+whose container changed (dirty tracking): a delta report only visits those containers and emits
+the ones whose volume differs from the volume last reported. The rows are formatted into a
+buffer written to the stream in chunks of about REPORT_CHUNK_SIZE characters, so the memory used
+does not depend on the size of the fleet
+
+It consists of the following elements:
+
+### class InventoryReporter:
+	## attributes:
+		dispensers: {machine name: materials dispenser}
+		dirty: {machine name: set of the materials changed since the last report}, guarded by
+		dirty_lock as the listeners of thread_safe dispensers add to it from the ordering threads
+		reported: {machine name: {material: volume last reported}}
+	## methods:
+		def add_machine(self, name, materials_dispenser):
+		def remove_machine(self, name):
+		def write_report(self, stream, report_format, delta, header):
+
+### report rows (REPORT_COLUMNS):
+	timestamp (clock_now() of the report), machine, material, capacity, volume
+"""
+
+import csv
+import io
+import json
+import threading
+from typing import Callable, Dict, List, Set, TextIO, Union
+
+from vending_machine_simulator import clock_now
+
+REPORT_CSV = 'csv'
+REPORT_JSON_LINES = 'jsonl'
+REPORT_COLUMNS = ('timestamp', 'machine', 'material', 'capacity', 'volume')
+
+# characters requiring a CSV field to be quoted
+CSV_SPECIAL_CHARACTERS = frozenset(',"\r\n')
+
+# characters buffered before a write to the stream
+REPORT_CHUNK_SIZE = 1 << 16
+
+
+class InventoryReporter:
+	"""
+	=> Full and delta reports of the containers levels of many machines
+
+	external methods activated:
+		materials_dispenser.add_containers_listener
+		materials_dispenser.remove_containers_listener
+		materials_dispenser.materials_containers (read only)
+	"""
+
+	def __init__(self, chunk_size: int = REPORT_CHUNK_SIZE) -> None:
+		"""
+		:param chunk_size:  # characters buffered before a write to the stream
+		"""
+		self.chunk_size = chunk_size
+		self.dispensers: Dict[str, object] = {}
+		self.dirty: Dict[str, Set[str]] = {}
+		self.dirty_lock = threading.Lock()
+		self.reported: Dict[str, Dict[str, float]] = {}
+		self.listeners: Dict[str, Callable[[str, str, Union[int, float]], None]] = {}
+		# {report format: {material: material name encoded in this format}}
+		self.encoded_names: Dict[str, Dict[str, str]] = {REPORT_CSV: {}, REPORT_JSON_LINES: {}}
+
+	def add_machine(self, name: str, materials_dispenser) -> bool:
+		"""
+		=> Registers the containers of a machine, all of them are dirty until the next report
+		:param name:  # machine name in the reports
+		:param materials_dispenser:  # e.g. vmo.materials_dispenser
+		:return: True if the machine was added False if the name is already registered
+		"""
+		if name in self.dispensers:
+			return False
+		dirty = set(materials_dispenser.materials_containers)
+		dirty_lock = self.dirty_lock
+
+		def listener(operation, material, amount):
+			# a report reading the set meanwhile must not miss this material
+			with dirty_lock:
+				dirty.add(material)
+
+		materials_dispenser.add_containers_listener(listener)
+		self.dispensers[name] = materials_dispenser
+		self.dirty[name] = dirty
+		self.reported[name] = {}
+		self.listeners[name] = listener
+		return True
+
+	def remove_machine(self, name: str) -> bool:
+		"""
+		=> Unregisters a machine and its containers listener
+		:param name:
+		:return: True if the machine was registered False otherwise
+		"""
+		if name not in self.dispensers:
+			return False
+		self.dispensers.pop(name).remove_containers_listener(self.listeners.pop(name))
+		del self.dirty[name]
+		del self.reported[name]
+		return True
+
+	def encoded_name(self, report_format: str, name: str) -> str:
+		"""
+		Machine or material name quoted as the report format requires
+		"""
+		if report_format == REPORT_CSV:
+			if not CSV_SPECIAL_CHARACTERS.intersection(name):
+				return name
+			buffer = io.StringIO()
+			csv.writer(buffer, lineterminator='').writerow((name,))
+			return buffer.getvalue()
+		return json.dumps(name)
+
+	def write_report(
+			self,
+			stream: TextIO,
+			report_format: str = REPORT_CSV,
+			delta: bool = False,
+			header: bool = True
+	) -> int:
+		"""
+		=> Writes one row per container of every machine (full report) or per container whose
+		volume changed since the last report (delta report), machines in registration order
+		:param stream:  # text stream, e.g. an open file or sys.stdout
+		:param report_format:  # REPORT_CSV or REPORT_JSON_LINES
+		:param delta:  # True to only report the containers changed since the last report
+		:param header:  # CSV only: True to start with the REPORT_COLUMNS row
+		:return: number of containers reported
+		:raise ValueError: for an unknown report_format
+		"""
+		if report_format not in (REPORT_CSV, REPORT_JSON_LINES):
+			raise ValueError(f'unknown report format {report_format!r}')
+		timestamp = clock_now()
+		# rows are formatted directly: the names are encoded once and the numbers need no quoting
+		if report_format == REPORT_CSV:
+			row_format = '{0},{1},{2},{3},{4}\n'
+		else:
+			row_format = (
+				'{{"timestamp": {0}, "machine": {1}, "material": {2}, "capacity": {3}, "volume": {4}}}\n'
+			)
+		# materials are shared by the machines of a fleet: their names are encoded once
+		encoded_materials = self.encoded_names[report_format]
+		chunk: List[str] = [','.join(REPORT_COLUMNS) + '\n'] if header and report_format == REPORT_CSV else []
+		chunk_length = 0
+		rows = 0
+		for name, dispenser in self.dispensers.items():
+			dirty = self.dirty[name]
+			reported = self.reported[name]
+			containers = dispenser.materials_containers
+			# changes made while the report runs mark their materials dirty again
+			with self.dirty_lock:
+				if delta:
+					materials = sorted(dirty)
+				else:
+					materials = list(containers)
+				dirty.clear()
+			if not materials:
+				continue
+			machine = self.encoded_name(report_format, name)
+			for material in materials:
+				container = containers.get(material)
+				if container is None:
+					continue
+				volume = container['volume']
+				if delta and reported.get(material) == volume:
+					continue
+				reported[material] = volume
+				encoded_material = encoded_materials.get(material)
+				if encoded_material is None:
+					encoded_material = encoded_materials[material] = self.encoded_name(report_format, material)
+				line = row_format.format(timestamp, machine, encoded_material, container['capacity'], volume)
+				chunk.append(line)
+				chunk_length += len(line)
+				rows += 1
+			if chunk_length >= self.chunk_size:
+				stream.write(''.join(chunk))
+				chunk.clear()
+				chunk_length = 0
+		stream.write(''.join(chunk))
+		return rows
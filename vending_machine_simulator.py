@@ -18,6 +18,30 @@ It consists of the following elements:
 		def get_capacity_material_container(self, material):
 		def get_volume_material_container(self, material):
 		def refill_material_container(self, material):
+		def takeout_material_container(self,material, volume):
+		def takeout_materials(self, demand):
+		def add_containers_listener(self, listener):
+		def add_threshold_observer(self, material, observer, low_water, empty):
+		def reserve_materials(self, demand, duration):
+		def commit_hold(self, hold_id, demand):
+		def release_hold(self, hold_id):
+		def expire_holds(self, now):
+		def get_available_volume_material_container(self, material):
+		def rebuild_indexes(self):
+
+	=> threshold observers: maintenance tooling is notified when a takeout brings a container down
+	to its low-water or empty level instead of polling the levels (see add_threshold_observer)
+	=> ingredients holds: reserve_materials holds the bom of a drink while it is paid, the held
+	volume cannot be taken out by any other order until the hold is committed, released or expires
+	(expiries are scheduled on a TimingWheel)
+
+### class TimingWheel:
+	=> Hierarchical timing wheel returning the keys whose deadline is reached, O(1) per key
+
+### class ArrayMaterialsContainersDispenser(MaterialsContainersDispenser):
+	=> Compact backend with the same methods: capacities and volumes are kept in typed arrays
+	indexed by an interned material id instead of one dictionary per container
+	materials_containers is a read-only view (assigning a dictionary loads it in bulk)
 
 ### class AcceptedCoinsDispenser:
 	=> This class is related to the payment of drinks with coins (no credit cards in this version)
@@ -25,9 +49,22 @@ It consists of the following elements:
 	## attributes:
 		accepted coins with following structure:
 		{coin_name string: coin_value float}
+		coins_cents {coin_name string: coin value in integer cents}
+		coins_inventory {coin_name string: number of coins held by the machine}
 	
 	## Methods
 		def add_accepted_coin(self, coin, value):
+		def load_coins(self, coin, count):
+		def compute_change(self, change_cents, inserted_coins):
+		def valid_coins_counts(self, coins):
+		def collect_payment(self, inserted_coins, change_coins):
+		def rebuild_indexes(self):
+		def freeze(self):
+		def derive(self):
+		def share_catalog(self):
+	
+	=> shared catalogs: a frozen dispenser is an immutable coins catalog, share_catalog() gives each
+	machine a dispenser sharing its coin tables with a private coins inventory
 		
 ### Class Drinks Menu
 => This class deals with the drink coins_dispenser OFFER that clients can purchase
@@ -42,9 +79,21 @@ It consists of the following elements:
 	=> methods:
 		def exist_drink(self, drink: str) -> bool:
 		def add_drink(self, drink: str, price: float, bom: Dict[str, int], command: str) -> bool:
+		def set_drink_price(self, drink: str, price: float) -> bool:
+		def set_drink_command(self, drink: str, command: str) -> bool:
 		def get_drink_price(self, drink: str) -> float:
 		def get_drink_bom(self, drink: str) -> Dict[str, int]:
 		def get_drink_command(self, drink: str) -> str:
+		def get_drink_by_command(self, command: str) -> str:
+		def match_command_prefix(self, prefix: str) -> list:
+		def get_material_drinks(self, material: str) -> list:
+		def add_menu_listener(self, listener):
+		def rebuild_indexes(self):
+		def freeze(self):
+		def derive(self):
+	
+	=> shared catalogs: a frozen menu is immutable and can be shared by any number of machines,
+	derive() returns a mutable copy (copy-on-write) to prepare the next version of the menu
 		
 
 ### class VendingMachineOperations:
@@ -52,16 +101,44 @@ It consists of the following elements:
 	
 	## attributes:
 		uses objects defined in other classes namely:
-		materials_dispenser, drinks_bom, drinks_menu, accepted_coins, business_cumulated_revenue
+		materials_dispenser, drinks_bom, drinks_menu, accepted_coins, financials (VendingMachineFinancials)
+		drinks_servings: servings remaining index {drink: servings} updated by container/menu listeners
+		availability_version: incremented each time a drink becomes available or unavailable
 		
 	=> methods:
 		def check_drink_availability(self, drink):
+		def reserve_drink(self, drink, duration):
+		def get_drink_servings(self, drink):
+		def get_available_drinks(self):
 		def update_drink_volume(self, drink):
 		def reset_revenue(self):
 		def add_revenue(self, amount):
 		def drink_checkout(self, ordered_drink):
+		def checkout_payment(self, ordered_drink, inserted_coins):
+		def process_order(self, ordered_drink, inserted_coins, hold_id):
 		def ask_user_drink(self):
+		def get_menu_offers(self):
+		def render_menu(self):
 		def make_drink(self, ordered_drink):
+		def make_drinks(self, orders):
+		def rebuild_indexes(self):
+		def set_drinks_menu(self, drinks_menu):
+		def set_coins_catalog(self, coins_catalog):
+		
+	=> cached menu: render_menu keeps the text of the menu keyed by (drinks_menu.menu_version,
+	availability_version), it is only rendered again after a drink, price or command change or
+	when a drink becomes available or unavailable
+	=> components injection: VendingMachineOperations(drinks_menu=..., accepted_coins=..., ...)
+	builds a machine on components already populated, a fleet of identical machines shares one
+	frozen DrinksMenu and the coin tables of one frozen AcceptedCoinsDispenser (share_catalog)
+	=> thread_safe mode: VendingMachineOperations(thread_safe=True) serves orders from several
+	threads, containers are locked in material name order and no ingredient is ever oversold
+	=> reservations: reserve_drink holds the bom of a drink while it is paid, then
+	process_order(drink, coins, hold_id) commits it - a held serving is unavailable to the others
+	=> menu listeners: VendingMachineOperations.add_menu_listener follows the menu of the machine
+	across set_drinks_menu (a frozen menu keeps no listener), the switch is notified as 'switch'
+	=> compact_containers mode: VendingMachineOperations(compact_containers=True) uses an
+	ArrayMaterialsContainersDispenser (less memory per machine for large fleets)
 		
 ### class DrinksBusinessMaintenance:
 	=> This class manages all maintenance operations
@@ -75,13 +152,132 @@ It consists of the following elements:
 		def add_admin_command(self, control_command):
 		def report_containers_levels(self):
 		def refill_all_containers(self):
+		def watch_containers_levels(self, observer, low_water_ratio, empty):
 		
-	
+### def set_clock(clock): / def clock_now():
+	=> module clock read by date_stamp and by VendingMachineFinancials (wall clock by default),
+	a simulation replaces it to run the machines on simulated time
 	
 """
 
+import heapq
+import math
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Mapping
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict, Union
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+# servings reported for a drink whose bom does not consume any volume
+UNLIMITED_SERVINGS = sys.maxsize
+
+# returned by hold_containers when the dispenser is not thread safe
+NO_CONTAINERS_LOCK = nullcontext()
+
+# outcomes of VendingMachineOperations.process_order
+ORDER_SERVED = 'served'
+ORDER_UNKNOWN_DRINK = 'unknown_drink'
+ORDER_UNAVAILABLE = 'unavailable'
+ORDER_INSUFFICIENT_PAYMENT = 'insufficient_payment'
+ORDER_NO_CHANGE = 'no_change'  # the coins held by the machine cannot make the change
+ORDER_INVALID_COINS = 'invalid_coins'  # a number of coins inserted is not a non-negative integer
+# outcome of VendingMachineOperations.checkout_payment when the payment can be collected
+PAYMENT_ACCEPTED = 'payment_accepted'
+
+# levels passed to the threshold observers of MaterialsContainersDispenser
+THRESHOLD_LOW_WATER = 'low_water'
+THRESHOLD_EMPTY = 'empty'
+
+# change plans memoized by AcceptedCoinsDispenser before the memo is emptied
+CHANGE_MEMO_SIZE = 4096
+
+# default life of an ingredients hold (MaterialsContainersDispenser.reserve_materials) in seconds
+RESERVATION_SECONDS = 120.0
+# seconds per slot of the first level of the holds timing wheel (expiries are at most one tick late)
+HOLDS_WHEEL_TICK = 0.1
+
+
+def to_cents(amount: float) -> int:
+	"""
+	=> Converts a dollar amount (float) to integer cents
+	:param amount:
+	:return: amount in cents
+	"""
+	return int(round(amount * 100))
+
+
+def fewest_coins_change(change_cents: int, coins: List[Tuple[str, int, int]]) -> Union[Dict[str, int], None]:
+	"""
+	=> Bounded change-making: finds the payout of change_cents using the fewest coins when only
+	a limited number of each coin is available. Dynamic programming over the amounts 0..change_cents,
+	each coin type is added with a sliding window minimum so the cost is O(coin types x change_cents)
+	
+	:param change_cents:  # change to give back in cents
+	:param coins:  # list of (coin name, value in cents, number of coins available)
+	:return: {coin name: number of coins} or None if the change cannot be made
+	"""
+	unreachable = change_cents + 1  # more coins than any payout can use
+	best = [0] + [unreachable] * change_cents
+	chosen_per_coin = []
+	for coin, cents, count in coins:
+		new_best = best[:]
+		chosen = [0] * (change_cents + 1)
+		if cents > 0 and count > 0:
+			for residue in range(min(cents, change_cents + 1)):
+				# window of (step, best[amount] - step) with increasing second item
+				window = deque()
+				for step, amount in enumerate(range(residue, change_cents + 1, cents)):
+					candidate = best[amount] - step
+					while window and window[-1][1] >= candidate:
+						window.pop()
+					window.append((step, candidate))
+					while window[0][0] < step - count:
+						window.popleft()
+					first_step, first_candidate = window[0]
+					if first_candidate + step < new_best[amount]:
+						new_best[amount] = first_candidate + step
+						chosen[amount] = step - first_step
+		best = new_best
+		chosen_per_coin.append(chosen)
+	if best[change_cents] >= unreachable:
+		return None
+	payout: Dict[str, int] = {}
+	amount = change_cents
+	for (coin, cents, count), chosen in zip(reversed(coins), reversed(chosen_per_coin)):
+		if chosen[amount]:
+			payout[coin] = chosen[amount]
+			amount -= chosen[amount] * cents
+	return payout
+
+
+# source of the current time of the module (seconds since the epoch), see set_clock
+module_clock: Callable[[], float] = time.time
+
+
+def set_clock(clock: Union[Callable[[], float], None] = None) -> Callable[[], float]:
+	"""
+	=> Replaces the clock read by date_stamp and by the financials created with the default clock,
+	e.g. by a simulation running on simulated time
+	:param clock:  # returns the current time in seconds since the epoch, None for the wall clock
+	:return: the previous clock (to restore it)
+	"""
+	global module_clock
+	previous_clock = module_clock
+	module_clock = clock or time.time
+	return previous_clock
+
+
+def clock_now() -> float:
+	"""
+	=> Returns the current time of the module clock (wall clock unless set_clock replaced it)
+	:return: seconds since the epoch
+	"""
+	return module_clock()
 
 
 def date_stamp():
@@ -89,7 +285,7 @@ def date_stamp():
 	=> Returns date_stamp for prints
 	:return: date_time
 	"""
-	now = datetime.now()
+	now = datetime.fromtimestamp(clock_now())
 	date_time = now.strftime("%Y/%m/%d, %H:%M")
 	return date_time
 
@@ -97,6 +293,119 @@ def date_stamp():
 # ## ===vending_machine_simulator=> MaterialsContainersDispenser
 # ###################################################################################
 
+class ContainersLock:
+	"""
+	=> Context manager holding the locks of several containers
+	The locks are acquired in material name order (and released in reverse order) so that two
+	orders sharing materials can never deadlock, orders using disjoint materials do not contend
+	"""
+	
+	def __init__(self, locks: list) -> None:
+		self.locks = locks
+	
+	def __enter__(self):
+		for lock in self.locks:
+			lock.acquire()
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		for lock in reversed(self.locks):
+			lock.release()
+		return False
+
+
+class TimingWheel:
+	"""
+	=> Hierarchical timing wheel: schedules the expiry of keys (the ingredients holds) in O(1)
+	Level 0 has one slot per tick, each slot of the level above spans a whole turn of the level
+	below: a key is filed in the level matching how far its deadline is, then cascades down one
+	level at a time as the wheel turns - advance() only visits the slots of the elapsed ticks
+	Cancelling is lazy: the owner ignores the expired keys it no longer knows
+	"""
+	
+	def __init__(self, tick: float = HOLDS_WHEEL_TICK, slot_bits: int = 6, levels: int = 4) -> None:
+		"""
+		:param tick:  # seconds per slot of level 0, deadlines are rounded up to the next tick
+		:param slot_bits:  # 2**slot_bits slots per level
+		:param levels:  # the wheel spans 2**(slot_bits * levels) ticks, farther deadlines are filed
+		in its last slot and cascade until they are in range
+		"""
+		self.tick = tick
+		self.slot_bits = slot_bits
+		self.slot_mask = (1 << slot_bits) - 1
+		self.horizon = (1 << (slot_bits * levels)) - 1
+		self.wheels: List[List[list]] = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+		self.current_tick = 0
+		# (key, deadline tick) filed in the slots / keys whose deadline was already reached
+		self.entries_count = 0
+		self.overdue: list = []
+	
+	def __len__(self) -> int:
+		return self.entries_count + len(self.overdue)
+	
+	def schedule(self, key, deadline: float):
+		"""
+		=> Files a key, returned by the first advance() reaching its deadline
+		:param key:
+		:param deadline:  # seconds, same clock as advance
+		"""
+		self.file_entry(key, math.ceil(deadline / self.tick))
+	
+	def file_entry(self, key, deadline_tick: int):
+		offset = deadline_tick - self.current_tick
+		if offset <= 0:
+			self.overdue.append(key)
+			return
+		offset = min(offset, self.horizon)
+		# level L holds the offsets of [2**(slot_bits * L), 2**(slot_bits * (L + 1)))
+		level = (offset.bit_length() - 1) // self.slot_bits
+		slot = ((self.current_tick + offset) >> (self.slot_bits * level)) & self.slot_mask
+		self.wheels[level][slot].append((key, deadline_tick))
+		self.entries_count += 1
+	
+	def advance(self, now: float) -> list:
+		"""
+		=> Turns the wheel up to now
+		:param now:  # seconds
+		:return: keys whose deadline is reached, in no particular order
+		"""
+		target_tick = math.floor(now / self.tick)
+		expired, self.overdue = self.overdue, []
+		wheels = self.wheels
+		slot_bits = self.slot_bits
+		while self.entries_count and self.current_tick < target_tick:
+			tick = self.current_tick = self.current_tick + 1
+			# at each turn of a level the next slot of the level above is filed again, from the top
+			# level down so that the entries cascading several levels land in the right slots
+			level = 1
+			while level < len(wheels) and not tick & ((1 << (slot_bits * level)) - 1):
+				level += 1
+			for upper in range(level - 1, 0, -1):
+				slot = (tick >> (slot_bits * upper)) & self.slot_mask
+				entries = wheels[upper][slot]
+				if entries:
+					wheels[upper][slot] = []
+					self.entries_count -= len(entries)
+					for key, deadline_tick in entries:
+						self.file_entry(key, deadline_tick)
+			slot = tick & self.slot_mask
+			entries = wheels[0][slot]
+			if entries:
+				wheels[0][slot] = []
+				self.entries_count -= len(entries)
+				for key, deadline_tick in entries:
+					if deadline_tick <= tick:
+						expired.append(key)
+					else:  # beyond the span of the wheel when it was filed
+						self.file_entry(key, deadline_tick)
+			if self.overdue:
+				expired.extend(self.overdue)
+				self.overdue = []
+		# an empty wheel jumps to the target tick
+		self.current_tick = max(self.current_tick, target_tick)
+		return expired
+
+
 class MaterialsContainersDispenser:
 	"""
 	This class manages the materials (drink ingredients) containers of the vending machine
@@ -108,6 +417,10 @@ class MaterialsContainersDispenser:
 		materials_containers dictionary with the following structure:
 		{'material name string':  {'capacity': value , 'volume': value}}
 		materials_containers is encapsulated by getters methods described below
+		containers_locks (thread_safe mode) {'material name string': reentrant lock}
+		threshold_watches {'material name string': [watch dictionaries]} (see add_threshold_observer)
+		holds {hold id: (demand, deadline)} / held_volumes {'material name string': volume held}
+		holds_wheel: TimingWheel of the holds deadlines
 	
 	methods:
 		def exist_material_container(self, material):
@@ -116,14 +429,344 @@ class MaterialsContainersDispenser:
 		def get_volume_material_container(self, material):
 		def refill_material_container(self, material):
 		def takeout_material_container(self,material, volume):
+		def takeout_materials(self, demand):
+		def is_thread_safe(self):
+		def hold_containers(self, materials):
+		def add_containers_listener(self, listener):
+		def remove_containers_listener(self, listener):
+		def notify_containers_listeners(self, operation, material, amount):
+		def add_threshold_observer(self, material, observer, low_water, empty):
+		def remove_threshold_observer(self, material, observer):
+		def check_thresholds(self, operation, material):
+		def reserve_materials(self, demand, duration):
+		def commit_hold(self, hold_id, demand):
+		def release_hold(self, hold_id):
+		def expire_holds(self, now):
+		def get_available_volume_material_container(self, material):
+		def rebuild_indexes(self):
 		
 	external methods: None
 	
 	"""
 	
-	def __init__(self) -> None:
+	def __init__(self, thread_safe: bool = False) -> None:
+		"""
+		:param thread_safe:  # True to guard every container with its own lock so several threads
+		can order from the same dispenser without overselling (see hold_containers)
+		"""
 		# Initialize the Materials dictionary
 		self.materials_containers: Dict[str, Dict[str, Union[int, float]]] = {}
+		# Callbacks notified after each container change: listener(operation, material, amount)
+		self.containers_listeners: List[Callable[[str, str, Union[int, float]], None]] = []
+		# Low-water / empty thresholds observed per material: {material: [watch]}
+		self.threshold_watches: Dict[str, List[dict]] = {}
+		# Ingredients holds {hold id: (demand, deadline)} and volume held per material
+		self.holds: Dict[int, Tuple[Dict[str, Union[int, float]], float]] = {}
+		self.held_volumes: Dict[str, Union[int, float]] = {}
+		self.held_counts: Dict[str, int] = {}
+		self.holds_wheel = TimingWheel()
+		self.next_hold_id = 1
+		# Per-container locks {material: lock} - None when the dispenser is not thread safe
+		self.containers_locks: Union[Dict[str, threading.RLock], None] = {} if thread_safe else None
+		self.allocation_lock = threading.Lock() if thread_safe else None
+		# guards holds, holds_wheel and next_hold_id - taken after the containers locks
+		self.holds_lock = threading.Lock() if thread_safe else None
+
+	def is_thread_safe(self) -> bool:
+		"""
+		:return: True if the containers are guarded by locks
+		"""
+		return self.containers_locks is not None
+
+	def hold_containers(self, materials: Iterable[str]):
+		"""
+		=> Returns a context manager holding the locks of the containers of several materials
+		Locks are reentrant and always acquired in material name order. Without thread_safe
+		a no-op context manager is returned
+		
+		:param materials: materials whose containers must not change while the context is held
+		:return: context manager
+		"""
+		if self.containers_locks is None:
+			return NO_CONTAINERS_LOCK
+		locks = self.containers_locks
+		return ContainersLock([locks[material] for material in sorted(set(materials)) if material in locks])
+
+	def add_containers_listener(self, listener: Callable[[str, str, Union[int, float]], None]):
+		"""
+		=> Registers a callback notified after each change of a container
+		In thread_safe mode it runs under the containers locks of the change, so the changes of a
+		container reach the listeners in the order they were made
+		The listener receives (operation, material, amount) where operation is one of:
+		'allocate' (amount = capacity), 'refill' (amount = new volume), 'takeout' (amount = drawn volume),
+		'hold' / 'release' (amount = volume held / no longer held, the volume itself is unchanged)
+
+		:param listener: callable(operation, material, amount)
+		"""
+		self.containers_listeners.append(listener)
+
+	def remove_containers_listener(self, listener: Callable[[str, str, Union[int, float]], None]) -> bool:
+		"""
+		=> Unregisters a callback previously added by add_containers_listener
+
+		:param listener: callable(operation, material, amount)
+		:return: True if the listener was registered False otherwise
+		"""
+		if listener in self.containers_listeners:
+			self.containers_listeners.remove(listener)
+			return True
+		return False
+
+	def notify_containers_listeners(self, operation: str, material: str, amount: Union[int, float]):
+		"""
+		=> Propagates a container change to all registered listeners
+
+		:param operation: 'allocate', 'refill', 'takeout', 'hold' or 'release'
+		:param material: the material whose container changed
+		:param amount: capacity, new volume, drawn volume or held volume depending on the operation
+		"""
+		for listener in self.containers_listeners:
+			listener(operation, material, amount)
+		if material in self.threshold_watches:
+			self.check_thresholds(operation, material)
+
+	def add_threshold_observer(
+			self,
+			material: str,
+			observer: Callable[[str, str, Union[int, float]], None],
+			low_water: Union[int, float, None] = None,
+			empty: Union[int, float] = 0
+	) -> bool:
+		"""
+		=> Registers a callback notified when a takeout brings the volume of a container down to
+		its low-water or empty level: observer(material, level, volume) with level THRESHOLD_LOW_WATER
+		or THRESHOLD_EMPTY
+
+		Notifications are coalesced: a level is notified once when the volume crosses it, then not
+		again until a refill brings the volume back above it - the takeouts of a burst below the level
+		are silent, and a takeout crossing both levels at once is only notified as THRESHOLD_EMPTY
+
+		:param material:  # the container must be allocated
+		:param observer:  # callable(material, level, volume)
+		:param low_water:  # volume at or below which the container runs low, None for no low-water level
+		:param empty:  # volume at or below which the container is considered empty (e.g. less than a serving)
+		:return: True if the observer was registered False if the material has no container
+		"""
+		with self.hold_containers((material,)):
+			if not self.exist_material_container(material):
+				return False
+			volume = self.get_volume_material_container(material)
+			# a level is armed while the volume is above it
+			watch = {
+				'observer': observer,
+				'low_water': low_water,
+				'empty': empty,
+				'low_water_armed': low_water is not None and volume > low_water,
+				'empty_armed': volume > empty,
+			}
+			self.threshold_watches.setdefault(material, []).append(watch)
+		return True
+
+	def remove_threshold_observer(self, material: str, observer: Callable[[str, str, Union[int, float]], None]) -> bool:
+		"""
+		=> Unregisters the thresholds of an observer on a material
+
+		:param material:
+		:param observer:  # callable previously added by add_threshold_observer
+		:return: True if the observer was registered False otherwise
+		"""
+		watches = self.threshold_watches.get(material, [])
+		kept = [watch for watch in watches if watch['observer'] != observer]
+		if len(kept) == len(watches):
+			return False
+		if kept:
+			self.threshold_watches[material] = kept
+		else:
+			del self.threshold_watches[material]
+		return True
+
+	def check_thresholds(self, operation: str, material: str):
+		"""
+		Notifies the observers of the levels a takeout crossed, other operations re-arm the levels
+		the volume is back above (called by notify_containers_listeners)
+		"""
+		notifications = []
+		with self.hold_containers((material,)):
+			volume = self.get_volume_material_container(material)
+			for watch in self.threshold_watches.get(material, ()):
+				low_water = watch['low_water']
+				if operation != 'takeout':
+					watch['empty_armed'] = volume > watch['empty']
+					watch['low_water_armed'] = low_water is not None and volume > low_water
+				elif watch['empty_armed'] and volume <= watch['empty']:
+					watch['empty_armed'] = watch['low_water_armed'] = False
+					notifications.append((watch['observer'], THRESHOLD_EMPTY))
+				elif watch['low_water_armed'] and volume <= low_water:
+					watch['low_water_armed'] = False
+					notifications.append((watch['observer'], THRESHOLD_LOW_WATER))
+		# observers run once the levels are updated (still under the locks of the change notified)
+		for observer, level in notifications:
+			observer(material, level, volume)
+
+	def reserve_materials(self, demand: Dict[str, Union[int, float]], duration: float = RESERVATION_SECONDS) -> int:
+		"""
+		=> Places a hold on several materials, typically the bom of a drink while it is paid: the
+		held volume stays in the containers but no takeout or other hold can use it until the hold
+		is committed (commit_hold), released (release_hold) or expires after duration seconds
+		All or nothing as takeout_materials - the expired holds are released first
+
+		:param demand: {material name: volume to hold}
+		:param duration:  # seconds before the hold expires (module clock, see set_clock)
+		:return: hold id - -1 if a material has no container or not enough volume available
+		"""
+		now = clock_now()
+		self.expire_holds(now)
+		held_volumes = self.held_volumes
+		held_counts = self.held_counts
+		with self.hold_containers(demand):
+			for material, volume in demand.items():
+				# -1 if the material has no container
+				container_volume = self.get_volume_material_container(material)
+				if container_volume < 0 or container_volume - held_volumes.get(material, 0) - volume < 0:
+					return -1
+			for material, volume in demand.items():
+				held_volumes[material] = held_volumes.get(material, 0) + volume
+				held_counts[material] = held_counts.get(material, 0) + 1
+			with self.holds_lock or NO_CONTAINERS_LOCK:
+				hold_id = self.next_hold_id
+				self.next_hold_id += 1
+				self.holds[hold_id] = (dict(demand), now + duration)
+				self.holds_wheel.schedule(hold_id, now + duration)
+			for material, volume in demand.items():
+				self.notify_containers_listeners('hold', material, volume)
+		return hold_id
+
+	def pop_hold(
+			self, hold_id: int, demand: Union[Dict[str, Union[int, float]], None] = None
+	) -> Union[Tuple[Dict[str, Union[int, float]], float], None]:
+		"""
+		Ends a hold: the entry left in holds_wheel is ignored when it expires
+		A hold placed for another demand than the one given is kept (None is returned)
+		"""
+		with self.holds_lock or NO_CONTAINERS_LOCK:
+			hold = self.holds.get(hold_id)
+			if hold is None or (demand is not None and hold[0] != demand):
+				return None
+			return self.holds.pop(hold_id)
+
+	def unhold_volumes(self, demand: Dict[str, Union[int, float]]):
+		"""
+		Gives back the volume held by an ended hold (containers locks held by the caller)
+		"""
+		held_volumes = self.held_volumes
+		held_counts = self.held_counts
+		for material, volume in demand.items():
+			if held_counts[material] == 1:
+				# the last hold of the material: no float residue is left behind
+				del held_counts[material]
+				del held_volumes[material]
+			else:
+				held_counts[material] -= 1
+				held_volumes[material] -= volume
+
+	def release_materials(self, demand: Dict[str, Union[int, float]]):
+		with self.hold_containers(demand):
+			self.unhold_volumes(demand)
+			for material, volume in demand.items():
+				self.notify_containers_listeners('release', material, volume)
+
+	def commit_hold(self, hold_id: int, demand: Union[Dict[str, Union[int, float]], None] = None) -> bool:
+		"""
+		=> Takes out the volume of a hold (the drink is paid), the hold ends
+
+		:param hold_id:  # returned by reserve_materials
+		:param demand:  # volumes the caller expects the hold to cover, None to skip the check
+		:return: True if the volume was taken out False if the hold is unknown, was released, has
+		expired or holds another demand (then nothing is taken out and a mismatched hold is kept)
+		"""
+		hold = self.pop_hold(hold_id, demand)
+		if hold is None:
+			return False
+		demand, deadline = hold
+		if deadline <= clock_now():  # not released by expire_holds yet
+			self.release_materials(demand)
+			return False
+		# the held volume is taken out under the same locks: no other order can get it in between
+		with self.hold_containers(demand):
+			self.unhold_volumes(demand)
+			self.deduct_materials(demand)
+			for material, volume in demand.items():
+				self.notify_containers_listeners('takeout', material, volume)
+		return True
+
+	def deduct_materials(self, demand: Dict[str, Union[int, float]]):
+		"""
+		Deducts volumes already checked (containers locks held by the caller)
+		"""
+		containers = self.materials_containers
+		for material, volume in demand.items():
+			containers[material]['volume'] -= volume
+
+	def release_hold(self, hold_id: int) -> bool:
+		"""
+		=> Gives the volume of a hold back to the other orders (payment refused, customer gone...)
+
+		:param hold_id:  # returned by reserve_materials
+		:return: True if the hold was released False if it is unknown, committed or expired
+		"""
+		hold = self.pop_hold(hold_id)
+		if hold is None:
+			return False
+		self.release_materials(hold[0])
+		return True
+
+	def expire_holds(self, now: Union[float, None] = None) -> int:
+		"""
+		=> Releases the holds whose deadline is reached: holds_wheel only visits the ticks elapsed
+		since the last call, whatever the number of holds outstanding
+
+		:param now:  # seconds, the module clock by default
+		:return: number of holds released
+		"""
+		if now is None:
+			now = clock_now()
+		expired = []
+		with self.holds_lock or NO_CONTAINERS_LOCK:
+			holds = self.holds
+			for hold_id in self.holds_wheel.advance(now):
+				hold = holds.get(hold_id)
+				if hold is None:  # committed or released meanwhile
+					continue
+				if hold[1] > now:  # rounding of the tick: not quite there yet
+					self.holds_wheel.schedule(hold_id, hold[1])
+					continue
+				del holds[hold_id]
+				expired.append(hold[0])
+		for demand in expired:
+			self.release_materials(demand)
+		return len(expired)
+
+	def get_available_volume_material_container(self, material: str) -> Union[int, float]:
+		"""
+		=> Volume of a container that can still be taken out or held: the volume minus the holds
+
+		:param material:
+		:return: available volume - -1 if the material has no container
+		"""
+		volume = self.get_volume_material_container(material)
+		if volume < 0:
+			return -1
+		return volume - self.held_volumes.get(material, 0)
+	
+	def rebuild_indexes(self):
+		"""
+		=> Recreates the derived structures (containers locks) after materials_containers was
+		restored in bulk (see vending_machine_snapshot) - listeners are not notified
+		"""
+		if self.containers_locks is not None:
+			for material in self.materials_containers:
+				if material not in self.containers_locks:
+					self.containers_locks[material] = threading.RLock()
 		
 	
 	
@@ -154,11 +797,17 @@ class MaterialsContainersDispenser:
 			self.exist_material_container
 		"""
 		
-		# Check if the material already exists
-		if self.exist_material_container(material):
-			return False
-		# Add the material with the specified maximum quantity
-		self.materials_containers[material] = {'capacity': capacity, 'volume': 0}
+		with self.allocation_lock or NO_CONTAINERS_LOCK:
+			# Check if the material already exists
+			if self.exist_material_container(material):
+				return False
+			if self.containers_locks is not None:
+				# the lock exists before the container becomes visible to other threads
+				self.containers_locks[material] = threading.RLock()
+			# Add the material with the specified maximum quantity
+			with self.hold_containers((material,)):
+				self.materials_containers[material] = {'capacity': capacity, 'volume': 0}
+				self.notify_containers_listeners('allocate', material, capacity)
 		return True
 	
 	def get_capacity_material_container(self, material: str) -> int:
@@ -212,15 +861,14 @@ class MaterialsContainersDispenser:
 			self.get_capacity_material_container
 		"""
 		
-		if self.exist_material_container(material):
-			
+		with self.hold_containers((material,)):
+			if not self.exist_material_container(material):
+				return False
 			# the container exist so we set volume = capacity
-			self.materials_containers[material]['volume'] = (
-				self.get_capacity_material_container(material)
-			)
-			return True
-		
-		return False
+			volume = self.get_capacity_material_container(material)
+			self.materials_containers[material]['volume'] = volume
+			self.notify_containers_listeners('refill', material, volume)
+		return True
 	
 	def takeout_material_container(self, material, draw_volume):
 		"""
@@ -233,14 +881,171 @@ class MaterialsContainersDispenser:
 			self.exist_material_container
 			self.get_volume_material_container
 		"""
-		if self.exist_material_container(material):
+		with self.hold_containers((material,)):
+			if not self.exist_material_container(material):
+				return False
 			current_volume = self.get_volume_material_container(material)
 			reduced_volume = current_volume - draw_volume
-			if reduced_volume < 0:
+			# the volume held by reserve_materials is not available
+			if reduced_volume - self.held_volumes.get(material, 0) < 0:
 				return False
 			self.materials_containers[material]['volume'] = reduced_volume
-			return True
-		return False
+			self.notify_containers_listeners('takeout', material, draw_volume)
+		return True
+
+	def takeout_materials(self, demand: Dict[str, Union[int, float]]) -> bool:
+		"""
+		=> All-or-nothing takeout of several materials (typically a drink bom or the aggregated
+		demand of a batch of orders). Every container is checked first, then all the deductions
+		are committed, so a failure never leaves the containers partially deducted
+		
+		:param demand: {material name: volume to draw}
+		:return: True if every withdrawal was committed False if none was (a material has no
+		container or not enough volume)
+		"""
+		containers = self.materials_containers
+		held_volumes = self.held_volumes
+		with self.hold_containers(demand):
+			for material, draw_volume in demand.items():
+				container = containers.get(material)
+				if container is None or container['volume'] - held_volumes.get(material, 0) - draw_volume < 0:
+					return False
+			for material, draw_volume in demand.items():
+				containers[material]['volume'] -= draw_volume
+			# listeners are notified once the whole demand is committed
+			for material, draw_volume in demand.items():
+				self.notify_containers_listeners('takeout', material, draw_volume)
+		return True
+
+class ContainersView(Mapping):
+	"""
+	=> Read-only {'material name string': {'capacity': value, 'volume': value}} view of an
+	ArrayMaterialsContainersDispenser, the inner dictionaries are built on access
+	"""
+	
+	def __init__(self, dispenser) -> None:
+		self.dispenser = dispenser
+	
+	def __getitem__(self, material: str) -> Dict[str, float]:
+		slot = self.dispenser.materials_index[material]
+		return {'capacity': self.dispenser.capacities[slot], 'volume': self.dispenser.volumes[slot]}
+	
+	def __iter__(self):
+		return iter(self.dispenser.materials_index)
+	
+	def __len__(self) -> int:
+		return len(self.dispenser.materials_index)
+	
+	def __contains__(self, material) -> bool:
+		return material in self.dispenser.materials_index
+
+
+class ArrayMaterialsContainersDispenser(MaterialsContainersDispenser):
+	"""
+	Compact backend of MaterialsContainersDispenser: same methods, same listeners and locks
+	Each material is interned to a slot of two typed arrays (about 16 bytes per container plus
+	its index entry) instead of a {'capacity': ..., 'volume': ...} dictionary per container
+	
+	attributes:
+		materials_index {'material name string': slot}
+		capacities, volumes: array('d') indexed by slot - volumes are floats
+		materials_containers: ContainersView, assigning a dictionary replaces all the containers
+	
+	methods: those of MaterialsContainersDispenser
+	"""
+	
+	def __init__(self, thread_safe: bool = False) -> None:
+		self.materials_index: Dict[str, int] = {}
+		self.capacities = array('d')
+		self.volumes = array('d')
+		super().__init__(thread_safe)
+	
+	@property
+	def materials_containers(self) -> ContainersView:
+		return ContainersView(self)
+	
+	@materials_containers.setter
+	def materials_containers(self, containers: Dict[str, Dict[str, Union[int, float]]]):
+		"""
+		Bulk load (see vending_machine_snapshot), call rebuild_indexes afterwards
+		"""
+		self.materials_index = {material: slot for slot, material in enumerate(containers)}
+		self.capacities = array('d', [container['capacity'] for container in containers.values()])
+		self.volumes = array('d', [container['volume'] for container in containers.values()])
+	
+	def exist_material_container(self, material: str) -> bool:
+		return material in self.materials_index
+	
+	def allocate_material_container(self, material: str, capacity: int) -> bool:
+		"""
+		=> Adds a new material container with the capacity indicated and volume 0
+		:return: True if container added - False if the material already has a container
+		"""
+		with self.allocation_lock or NO_CONTAINERS_LOCK:
+			if material in self.materials_index:
+				return False
+			if self.containers_locks is not None:
+				self.containers_locks[material] = threading.RLock()
+			self.capacities.append(capacity)
+			self.volumes.append(0)
+			with self.hold_containers((material,)):
+				# the slot is published last: the arrays are ready when the container becomes visible
+				self.materials_index[material] = len(self.volumes) - 1
+				self.notify_containers_listeners('allocate', material, capacity)
+		return True
+	
+	def get_capacity_material_container(self, material: str) -> float:
+		slot = self.materials_index.get(material)
+		return self.capacities[slot] if slot is not None else -1
+	
+	def get_volume_material_container(self, material: str) -> float:
+		slot = self.materials_index.get(material)
+		return self.volumes[slot] if slot is not None else -1
+	
+	def refill_material_container(self, material: str) -> bool:
+		with self.hold_containers((material,)):
+			slot = self.materials_index.get(material)
+			if slot is None:
+				return False
+			volume = self.volumes[slot] = self.capacities[slot]
+			self.notify_containers_listeners('refill', material, volume)
+		return True
+	
+	def takeout_material_container(self, material: str, draw_volume) -> bool:
+		with self.hold_containers((material,)):
+			slot = self.materials_index.get(material)
+			if slot is None or self.volumes[slot] - self.held_volumes.get(material, 0) - draw_volume < 0:
+				return False
+			self.volumes[slot] -= draw_volume
+			self.notify_containers_listeners('takeout', material, draw_volume)
+		return True
+	
+	def takeout_materials(self, demand: Dict[str, Union[int, float]]) -> bool:
+		"""
+		=> All-or-nothing takeout of several materials (see MaterialsContainersDispenser)
+		"""
+		index = self.materials_index
+		volumes = self.volumes
+		held_volumes = self.held_volumes
+		with self.hold_containers(demand):
+			slots = []
+			for material, draw_volume in demand.items():
+				slot = index.get(material)
+				if slot is None or volumes[slot] - held_volumes.get(material, 0) - draw_volume < 0:
+					return False
+				slots.append((slot, draw_volume))
+			for slot, draw_volume in slots:
+				volumes[slot] -= draw_volume
+			for material, draw_volume in demand.items():
+				self.notify_containers_listeners('takeout', material, draw_volume)
+		return True
+
+	def deduct_materials(self, demand: Dict[str, Union[int, float]]):
+		index = self.materials_index
+		volumes = self.volumes
+		for material, volume in demand.items():
+			volumes[index[material]] -= volume
+
 
 # ###################################################################################
 # ## ===vending_machine_simulator=> Accepted Coins Dispenser
@@ -253,18 +1058,46 @@ class AcceptedCoinsDispenser:
 	## attributes:
 		accepted coins with following structure:
 		{coin_name string: coin_value float}
+		coins_cents: {coin_name string: coin value in integer cents}
+		coins_inventory: {coin_name string: number of coins held by the machine}
+		change_memo: {(change in cents, coins usable for it): payout} change plans already computed
+		frozen: True once the coins catalog is shared (add_accepted_coins is refused)
+		coins_listeners: callbacks notified after each change of the coins: listener(operation, change)
+		accepted_coins, coins_cents and change_memo are shared by the dispensers of one catalog,
+		coins_inventory and coins_listeners are private to each dispenser
 	
 	## Methods
 		def exist_accepted_coin(self,coin: str) -> bool:
 		def add_accepted_coin(self, coin: str, value: float) -> bool:
 		def get_all_coins(self) -> list:
 		def get_coin_value(self, coin: str) -> float:
+		def get_coin_cents(self, coin: str) -> int:
+		def get_coins_cents(self, coins: Dict[str, int]) -> int:
+		def get_coin_count(self, coin: str) -> int:
+		def load_coins(self, coin: str, count: int) -> bool:
+		def compute_change(self, change_cents: int, inserted_coins: Dict[str, int]):
+		def valid_coins_counts(self, coins: Dict[str, int]) -> bool:
+		def collect_payment(self, inserted_coins: Dict[str, int], change_coins: Dict[str, int]) -> bool:
+		def add_coins_listener(self, listener):
+		def remove_coins_listener(self, listener):
+		def rebuild_indexes(self):
+		def freeze(self):
+		def derive(self) -> AcceptedCoinsDispenser:
+		def share_catalog(self) -> AcceptedCoinsDispenser:
 	
 	"""
 	
 	def __init__(self):
 		# Initialize coins dictionary
 		self.accepted_coins: Dict[str, float] = {}
+		# coins values in integer cents and number of coins of each type held by the machine
+		self.coins_cents: Dict[str, int] = {}
+		self.coins_inventory: Dict[str, int] = {}
+		# memo of the change plans keyed by the change and the coins usable to make it
+		self.change_memo: Dict[Tuple[int, Tuple[int, ...]], Union[Dict[str, int], None]] = {}
+		self.frozen: bool = False
+		# Callbacks notified after each change of the coins: listener(operation, change)
+		self.coins_listeners: List[Callable[[str, tuple], None]] = []
 	
 	def exist_accepted_coins(self, coin: str) -> bool:
 		"""
@@ -281,19 +1114,50 @@ class AcceptedCoinsDispenser:
 		:param coin: name of the coin
 		:param value: value in dollar/cents
 		:return: True if coin is a new type False if coin already accepted by the coins_dispenser
+		or if the coins catalog is frozen
 		
 		external calls:
 			self.exist_accepted_coins:
 		"""
 		
 		# Check if the coin already exists
-		if self.exist_accepted_coins(coin):
+		if self.frozen or self.exist_accepted_coins(coin):
 			return False
 		
 		# Add the coin with the specified value
 		self.accepted_coins[coin] = value
+		self.coins_cents[coin] = to_cents(value)
+		self.coins_inventory[coin] = 0
+		# the memo keys depend on the coin set
+		self.change_memo.clear()
+		self.notify_coins_listeners('add_coin', (coin, value))
 		return True
 
+	def add_coins_listener(self, listener: Callable[[str, tuple], None]):
+		"""
+		=> Registers a callback notified after each change of the coins
+		The listener receives (operation, change) where operation is one of:
+		'add_coin' (change = (coin, value)), 'load_coins' (change = (coin, count)),
+		'collect' (change = (inserted coins, change coins) of a collect_payment)
+		
+		:param listener: callable(operation, change)
+		"""
+		self.coins_listeners.append(listener)
+	
+	def remove_coins_listener(self, listener: Callable[[str, tuple], None]) -> bool:
+		"""
+		=> Unregisters a callback previously added by add_coins_listener
+		:return: True if the listener was registered False otherwise
+		"""
+		if listener in self.coins_listeners:
+			self.coins_listeners.remove(listener)
+			return True
+		return False
+	
+	def notify_coins_listeners(self, operation: str, change: tuple):
+		for listener in self.coins_listeners:
+			listener(operation, change)
+
 	def get_all_coins(self) -> list:
 		"""
 		Methods returns all the coins names (str) in a list structure
@@ -319,6 +1183,158 @@ class AcceptedCoinsDispenser:
 		else:
 			value = -1.
 		return value
+	
+	def get_coin_cents(self, coin: str) -> int:
+		"""
+		Returns the value of a coin in integer cents if the coin is registered otherwise returns -1
+		:param coin:  # name of the coin
+		"""
+		return self.coins_cents.get(coin, -1)
+	
+	def get_coins_cents(self, coins: Dict[str, int]) -> int:
+		"""
+		Returns the amount of several coins in integer cents, coins not accepted are worth nothing
+		:param coins:  # {coin name: number of coins}
+		"""
+		coins_cents = self.coins_cents
+		return sum(coins_cents.get(coin, 0) * number_coins for coin, number_coins in coins.items())
+	
+	def get_coin_count(self, coin: str) -> int:
+		"""
+		Returns how many coins of a type the machine holds, -1 if the coin is not registered
+		:param coin:  # name of the coin
+		"""
+		return self.coins_inventory.get(coin, -1)
+	
+	def load_coins(self, coin: str, count: int) -> bool:
+		"""
+		=> Maintenance: adds (count > 0) or removes (count < 0) coins of a type to the machine
+		:param coin:  # name of the coin
+		:param count:  # number of coins
+		:return: True if done False if the coin is not accepted or not enough coins are held
+		"""
+		if not self.exist_accepted_coins(coin) or self.coins_inventory[coin] + count < 0:
+			return False
+		self.coins_inventory[coin] += count
+		self.notify_coins_listeners('load_coins', (coin, count))
+		return True
+	
+	def compute_change(
+			self, change_cents: int, inserted_coins: Union[Dict[str, int], None] = None
+	) -> Union[Dict[str, int], None]:
+		"""
+		=> Finds the payout of change_cents with the fewest coins the machine physically holds
+		(its inventory plus the coins just inserted by the customer)
+		The plans are memoized per change and per usable coins: a coin type only counts up to the
+		number of coins the change could use, so inventory changes that do not matter for a change
+		reuse its plan and those that matter lead to a new key (the old plan is never reused)
+		
+		:param change_cents:  # change to give back in cents
+		:param inserted_coins:  # {coin name: number of coins} inserted by the customer
+		:return: {coin name: number of coins} ({} for no change) or None if the change cannot be made
+		
+		external calls:
+			fewest_coins_change
+		"""
+		if change_cents <= 0:
+			return {} if change_cents == 0 else None
+		inserted_coins = inserted_coins or {}
+		usable = tuple(
+			min(self.coins_inventory[coin] + inserted_coins.get(coin, 0), change_cents // cents)
+			if cents > 0 else 0
+			for coin, cents in self.coins_cents.items()
+		)
+		key = (change_cents, usable)
+		# the memo is shared by the machines of a catalog, each serialized by its own coins_lock:
+		# another machine may clear it at any time, the plan is never read back from it
+		change_memo = self.change_memo
+		try:
+			payout = change_memo[key]
+		except KeyError:
+			if len(change_memo) >= CHANGE_MEMO_SIZE:
+				change_memo.clear()
+			# largest coins first so that among equally short payouts the larger coins are given
+			coins = sorted(
+				zip(self.coins_cents, self.coins_cents.values(), usable), key=lambda item: -item[1]
+			)
+			payout = fewest_coins_change(change_cents, coins)
+			change_memo[key] = payout
+		return dict(payout) if payout is not None else None
+	
+	def valid_coins_counts(self, coins: Dict[str, int]) -> bool:
+		"""
+		Checks that every number of coins is a non-negative integer (bool is not a count)
+		:param coins:  # {coin name: number of coins}
+		"""
+		return all(
+			type(number_coins) is not bool and isinstance(number_coins, int) and number_coins >= 0
+			for number_coins in coins.values()
+		)
+	
+	def collect_payment(self, inserted_coins: Dict[str, int], change_coins: Dict[str, int]) -> bool:
+		"""
+		=> Keeps the coins inserted by the customer and hands out the change coins
+		:param inserted_coins:  # {coin name: number of coins} inserted by the customer
+		:param change_coins:  # {coin name: number of coins} given back (see compute_change)
+		:return: True if done False if a number of coins is invalid (see valid_coins_counts) or a
+		coin is not accepted or not held (nothing is changed)
+		"""
+		if not (self.valid_coins_counts(inserted_coins) and self.valid_coins_counts(change_coins)):
+			return False
+		inventory = self.coins_inventory
+		for coin, number_coins in change_coins.items():
+			if coin not in inventory or inventory[coin] + inserted_coins.get(coin, 0) < number_coins:
+				return False
+		for coin, number_coins in inserted_coins.items():
+			if coin in inventory:
+				inventory[coin] += number_coins
+		for coin, number_coins in change_coins.items():
+			inventory[coin] -= number_coins
+		if self.coins_listeners:
+			self.notify_coins_listeners('collect', (dict(inserted_coins), dict(change_coins)))
+		return True
+	
+	def rebuild_indexes(self):
+		"""
+		=> Recomputes the coins values in cents after accepted_coins (and coins_inventory) were
+		restored in bulk, coins without inventory hold 0 coins
+		"""
+		self.coins_cents = {coin: to_cents(value) for coin, value in self.accepted_coins.items()}
+		self.coins_inventory = {coin: self.coins_inventory.get(coin, 0) for coin in self.accepted_coins}
+		self.change_memo = {}
+	
+	def freeze(self):
+		"""
+		=> Makes the coins catalog immutable so that it can be shared by many machines
+		"""
+		self.frozen = True
+	
+	def derive(self) -> 'AcceptedCoinsDispenser':
+		"""
+		=> Copy-on-write: returns a mutable copy of the coins catalog (with this inventory), the
+		machines sharing this catalog are not affected until they switch to the derived one
+		"""
+		derived = AcceptedCoinsDispenser()
+		derived.accepted_coins = dict(self.accepted_coins)
+		derived.coins_inventory = dict(self.coins_inventory)
+		derived.rebuild_indexes()
+		return derived
+	
+	def share_catalog(self) -> 'AcceptedCoinsDispenser':
+		"""
+		=> Returns a dispenser for one more machine: the coin tables and the change memo are shared
+		(the memo keys include the usable coins, so plans are valid for any inventory) and the
+		coins inventory is private and empty - the catalog is frozen first
+		"""
+		self.freeze()
+		shared = AcceptedCoinsDispenser.__new__(AcceptedCoinsDispenser)
+		shared.accepted_coins = self.accepted_coins
+		shared.coins_cents = self.coins_cents
+		shared.change_memo = self.change_memo
+		shared.coins_inventory = dict.fromkeys(self.accepted_coins, 0)
+		shared.frozen = True
+		shared.coins_listeners = []
+		return shared
 		
 		
 # ###################################################################################
@@ -337,6 +1353,8 @@ class DrinksMenu:
 		{'price': cost of the drink in float,
 		'bom': {material name (str): required volume (float), material_name (str): ....}}
 		'command': keystrokes to order string}
+		drinks_commands is the command index {keystrokes string: drink string}
+		commands_trie (command_trie mode) is a prefix trie {keystroke: node, '': [drinks]}
 	
 	=> methods:
 		def exist_drink(self, drink: str) -> bool:
@@ -346,18 +1364,46 @@ class DrinksMenu:
 			price: float,
 			bom: Dict[str, int], command: str
 		) -> bool:
+		def set_drink_price(self, drink: str, price: float) -> bool:
+		def set_drink_command(self, drink: str, command: str) -> bool:
 		def get_all_drinks(self) -> list:
 		def get_drink_price(self, drink: str) -> float:
 		def get_drink_bom(self, drink: str) -> Dict[str, int]:
 		def get_drink_command(self, drink: str) -> str:
+		def exist_drink_command(self, command: str) -> bool:
+		def get_drink_by_command(self, command: str) -> str:
+		def match_command_prefix(self, prefix: str) -> list:
+		def resolve_command_prefix(self, prefix: str) -> str:
+		def get_material_drinks(self, material: str) -> list:
+		def add_menu_listener(self, listener):
+		def remove_menu_listener(self, listener):
+		def notify_menu_listeners(self, operation, drink):
+		def rebuild_indexes(self):
+		def is_frozen(self) -> bool:
+		def freeze(self):
+		def derive(self) -> DrinksMenu:
 		
 	"""
 	
-	def __init__(self) -> None:
+	def __init__(self, command_trie: bool = False) -> None:
 		"""
 		Initializes the drinks drinks_menu with an empty dictionary.
+		:param command_trie:  # True to also index the commands in a prefix trie so partially
+		typed keystrokes can be resolved (see match_command_prefix)
 		"""
 		self.drinks_menu: Dict[str, Dict[str, Union[float, str, Dict[str, int]]]] = {}
+		# Command index {keystrokes: drink} kept in step with add_drink
+		self.drinks_commands: Dict[str, str] = {}
+		# Prefix trie of the commands: each node is {keystroke: child node, '': [drinks below]}
+		self.commands_trie: Union[Dict, None] = {'': []} if command_trie else None
+		# Reverse index {material: [drinks whose bom uses it]} kept in step with add_drink
+		self.materials_drinks: Dict[str, List[str]] = {}
+		# Callbacks notified after each menu change: listener(operation, drink)
+		self.menu_listeners: List[Callable[[str, str], None]] = []
+		# Incremented on each menu change so derived structures know when to recompile
+		self.menu_version: int = 0
+		# a frozen menu is a shared immutable catalog: no drink can be added, no listener is kept
+		self.frozen: bool = False
 	
 	
 	def exist_drink(self, drink: str) -> bool:
@@ -379,15 +1425,16 @@ class DrinksMenu:
 		:param price: # cost of the drink
 		:param bom:  # ingredients composition of the drink
 		:param command: keystrokes to order the drink
-		:return: True if drink added - False if drink already exists
+		:return: True if drink added - False if drink or command already exists or the menu is frozen
 		
 		external calls:
 			self.exist_drink:
+			self.exist_drink_command:
 		"""
 		
-		# Check if the drink already exists
+		# Check if the drink or its command already exists
 		
-		if self.exist_drink(drink):
+		if self.frozen or self.exist_drink(drink) or self.exist_drink_command(command):
 			return False
 		
 		# Add the drink with the specified price, bom and command
@@ -397,8 +1444,105 @@ class DrinksMenu:
 			'bom': bom,
 			'command': command
 		}
+		self.index_drink(drink)
+		self.menu_version += 1
+		self.notify_menu_listeners('add', drink)
+		return True
+	
+	def set_drink_price(self, drink: str, price: float) -> bool:
+		"""
+		=> Changes the price of a drink of the drinks_menu
+		
+		:param drink:
+		:param price:  # new cost of the drink
+		:return: True if the price changed - False if the drink does not exist or the menu is frozen
+		"""
+		
+		if self.frozen or not self.exist_drink(drink):
+			return False
+		# the entries are shared with the menus derived from this one: replaced, never modified
+		self.drinks_menu[drink] = dict(self.drinks_menu[drink], price=price)
+		self.menu_version += 1
+		self.notify_menu_listeners('update', drink)
+		return True
+	
+	def set_drink_command(self, drink: str, command: str) -> bool:
+		"""
+		=> Changes the keystrokes ordering a drink of the drinks_menu
+		
+		:param drink:
+		:param command:  # new keystrokes to order the drink
+		:return: True if the command changed - False if the drink does not exist, the command is
+		already used or the menu is frozen
+		
+		external calls:
+			self.rebuild_indexes:
+		"""
+		
+		if self.frozen or not self.exist_drink(drink) or self.exist_drink_command(command):
+			return False
+		self.drinks_menu[drink] = dict(self.drinks_menu[drink], command=command)
+		# the command index and trie keep drinks_menu order: rebuilt rather than patched
+		self.rebuild_indexes()
+		self.notify_menu_listeners('update', drink)
 		return True
 	
+	def index_drink(self, drink: str):
+		"""
+		Adds a drink of drinks_menu to the command index, the commands trie and the materials index
+		:param drink:
+		"""
+		bom = self.drinks_menu[drink]['bom']
+		command = self.drinks_menu[drink]['command']
+		for material in bom:
+			self.materials_drinks.setdefault(material, []).append(drink)
+		self.drinks_commands[command] = drink
+		if self.commands_trie is not None:
+			node = self.commands_trie
+			node[''].append(drink)
+			for keystroke in command:
+				node = node.setdefault(keystroke, {'': []})
+				node[''].append(drink)
+	
+	def rebuild_indexes(self):
+		"""
+		=> Rebuilds every index from drinks_menu after it was restored in bulk (see
+		vending_machine_snapshot) - listeners are not notified, menu_version is incremented
+		"""
+		self.drinks_commands = {}
+		self.materials_drinks = {}
+		if self.commands_trie is not None:
+			self.commands_trie = {'': []}
+		for drink in self.drinks_menu:
+			self.index_drink(drink)
+		self.menu_version += 1
+	
+	def is_frozen(self) -> bool:
+		"""
+		:return: True if the menu is a shared immutable catalog
+		"""
+		return self.frozen
+	
+	def freeze(self):
+		"""
+		=> Makes the menu immutable so that it can be shared by many machines, the listeners
+		registered so far are dropped
+		"""
+		self.frozen = True
+		self.menu_listeners = []
+	
+	def derive(self) -> 'DrinksMenu':
+		"""
+		=> Copy-on-write: returns a mutable copy of the menu to add drinks to, then freeze it and
+		hand it to the machines (VendingMachineOperations.set_drinks_menu). The drink entries are
+		shared with this menu, its menu_version follows this one
+		"""
+		derived = DrinksMenu(command_trie=self.commands_trie is not None)
+		derived.drinks_menu = dict(self.drinks_menu)
+		derived.menu_version = self.menu_version
+		derived.rebuild_indexes()
+		return derived
+	
 	def get_all_drinks(self) -> list:
 		"""
 		Methods returns all the drinks names (str) in a list structure
@@ -460,6 +1604,106 @@ class DrinksMenu:
 		else:
 			command = '#'
 		return command
+	
+	def exist_drink_command(self, command: str) -> bool:
+		"""
+		Checks if keystrokes are already used to order a drink of the drinks_menu
+		:param command:
+		:return: True if the command is registered False otherwise
+		"""
+		
+		return command in self.drinks_commands
+	
+	def get_drink_by_command(self, command: str) -> str:
+		"""
+		This method returns the drink ordered by the command keystrokes - O(length of command)
+		:param command:
+		:return drink:  # the drink ordered by the command or "#" if command not registered
+		"""
+		
+		return self.drinks_commands.get(command, '#')
+	
+	def match_command_prefix(self, prefix: str) -> list:
+		"""
+		This method returns the drinks whose command starts with the keystrokes typed so far
+		With command_trie the lookup walks len(prefix) trie nodes, otherwise the commands are scanned
+		:param prefix:  # keystrokes typed so far
+		:return drinks:  # list of candidate drinks in drinks_menu order, [] if none matches
+		"""
+		
+		if self.commands_trie is None:
+			return [
+				drink for command, drink in self.drinks_commands.items() if command.startswith(prefix)
+			]
+		node = self.commands_trie
+		for keystroke in prefix:
+			node = node.get(keystroke)
+			if node is None:
+				return []
+		return list(node[''])
+	
+	def resolve_command_prefix(self, prefix: str) -> str:
+		"""
+		This method disambiguates keystrokes while the user is still typing
+		:param prefix:  # keystrokes typed so far
+		:return drink:  # the only drink whose command starts with prefix, "#" if none or several
+		
+		external calls:
+			self.match_command_prefix:
+		"""
+		
+		candidates = self.match_command_prefix(prefix)
+		if len(candidates) == 1:
+			return candidates[0]
+		return '#'
+	
+	def get_material_drinks(self, material: str) -> list:
+		"""
+		This method returns the drinks whose bom requires a specified material
+		:param material:
+		:return drinks:  # list of drinks using the material or [] if no drink uses it
+		"""
+		
+		return self.materials_drinks.get(material, [])
+	
+	def add_menu_listener(self, listener: Callable[[str, str], None]) -> bool:
+		"""
+		=> Registers a callback notified after each change of the drinks_menu
+		The listener receives (operation, drink) where operation is 'add' or 'update' (price or
+		command changed)
+		
+		:param listener: callable(operation, drink)
+		:return: True if the listener was registered False if the menu is frozen (it will never
+		be notified: a frozen menu never changes)
+		"""
+		# keeping the listeners of every machine sharing a frozen menu would only make the
+		# catalog grow with the fleet
+		if self.frozen:
+			return False
+		self.menu_listeners.append(listener)
+		return True
+	
+	def remove_menu_listener(self, listener: Callable[[str, str], None]) -> bool:
+		"""
+		=> Unregisters a callback previously added by add_menu_listener
+		
+		:param listener: callable(operation, drink)
+		:return: True if the listener was registered False otherwise
+		"""
+		if listener in self.menu_listeners:
+			self.menu_listeners.remove(listener)
+			return True
+		return False
+	
+	def notify_menu_listeners(self, operation: str, drink: str):
+		"""
+		=> Propagates a drinks_menu change to all registered listeners
+		
+		:param operation: 'add' or 'update'
+		:param drink: the drink that changed
+		"""
+		for listener in self.menu_listeners:
+			listener(operation, drink)
 
 
 
@@ -472,19 +1716,47 @@ class VendingMachineOperations:
 	This class manages customer orders, payment checkout, making the drink takeout ingredients
 	
 	attributes:
+		materials_dispenser, drinks_menu, accepted_coins, financials: the machine state
+		drinks_servings dictionary (servings remaining index) with the following structure:
+		{drink string: number of servings the containers can still deliver}
+		availability_version: incremented each time a drink becomes available or unavailable
+		rendered_menu: (menu_version, availability_version, text) of the last render_menu
+		menu_listeners: callbacks notified after each change of the menu of the machine, including
+		a switch to another menu: listener(operation, drink)
 	
 	methods:
 		def check_drink_availability(self, drink):
+		def reserve_drink(self, drink, duration):
+		def get_drink_servings(self, drink):
+		def get_available_drinks(self):
+		def compute_drink_servings(self, drink):
+		def rebuild_servings_index(self):
+		def on_container_change(self, operation, material, amount):
+		def on_menu_change(self, operation, drink):
+		def add_menu_listener(self, listener):
+		def remove_menu_listener(self, listener):
 		def ask_user_drink(self):
+		def get_menu_offers(self):
+		def render_menu(self):
 		def drink_checkout(self, ordered_drink):
+		def get_payment_amount(self, inserted_coins):
+		def checkout_payment(self, ordered_drink, inserted_coins):
+		def process_order(self, ordered_drink, inserted_coins, hold_id):
 		def make_drink(self, ordered_drink):
+		def make_drinks(self, orders):
+		def rebuild_indexes(self):
+		def set_drinks_menu(self, drinks_menu):
+		def set_coins_catalog(self, coins_catalog):
 		
 	external methods activated:
 		drinks_menu.exist_drink
 		drinks_menu.get_drink_price
 		drinks_menu.get_drink_bom
 		materials_dispenser.exist_material_container
-		materials_dispenser.get_volume_material_container
+		materials_dispenser.get_available_volume_material_container
+		materials_dispenser.takeout_materials
+		materials_dispenser.reserve_materials
+		materials_dispenser.commit_hold
 		accepted_coins.get_all_coins
 		accepted_coins.get_coin_value
 		
@@ -493,11 +1765,213 @@ class VendingMachineOperations:
 	"""
 	
 	
-	def __init__(self) -> None:
-		# Create instances of other classes
-		self.materials_dispenser = MaterialsContainersDispenser()
-		self.drinks_menu = DrinksMenu()
-		self.accepted_coins = AcceptedCoinsDispenser()
+	def __init__(
+			self,
+			thread_safe: bool = False,
+			compact_containers: bool = False,
+			materials_dispenser: Union[MaterialsContainersDispenser, None] = None,
+			drinks_menu: Union['DrinksMenu', None] = None,
+			accepted_coins: Union[AcceptedCoinsDispenser, None] = None,
+			financials: Union['VendingMachineFinancials', None] = None
+	) -> None:
+		"""
+		:param thread_safe:  # True to serve orders from several threads: the dispenser guards each
+		container with its own lock and make_drink / make_drinks never oversell an ingredient
+		:param compact_containers:  # True to keep the containers in an ArrayMaterialsContainersDispenser
+		:param materials_dispenser:  # injected components, new empty ones by default
+		:param drinks_menu:  # a frozen menu is shared as is (see DrinksMenu.freeze)
+		:param accepted_coins:  # a frozen coins catalog is shared through share_catalog()
+		:param financials:
+		"""
+		# Create instances of other classes (unless given)
+		if materials_dispenser is not None:
+			self.materials_dispenser = materials_dispenser
+		elif compact_containers:
+			self.materials_dispenser = ArrayMaterialsContainersDispenser(thread_safe=thread_safe)
+		else:
+			self.materials_dispenser = MaterialsContainersDispenser(thread_safe=thread_safe)
+		self.drinks_menu = drinks_menu if drinks_menu is not None else DrinksMenu()
+		if accepted_coins is None:
+			accepted_coins = AcceptedCoinsDispenser()
+		elif accepted_coins.frozen:
+			accepted_coins = accepted_coins.share_catalog()
+		self.accepted_coins = accepted_coins
+		self.financials = financials if financials is not None else VendingMachineFinancials(thread_safe)
+		# servings remaining index {drink: number of servings the containers can still deliver}
+		# kept up to date by the dispenser and menu listeners so availability checks are O(1)
+		self.drinks_servings: Dict[str, int] = {}
+		# incremented each time a drink becomes available or unavailable (see render_menu)
+		self.availability_version: int = 0
+		# (menu_version, availability_version, text) of the last menu rendered
+		self.rendered_menu: Union[Tuple[int, int, str], None] = None
+		# serializes the index refreshes triggered concurrently by several containers
+		self.servings_lock = threading.Lock() if thread_safe else None
+		# serializes the payments: all the orders share the coins inventory
+		self.coins_lock = threading.Lock() if thread_safe else None
+		# Callbacks notified after each change of the menu of the machine: listener(operation, drink)
+		self.menu_listeners: List[Callable[[str, Union[str, None]], None]] = []
+		self.materials_dispenser.add_containers_listener(self.on_container_change)
+		self.drinks_menu.add_menu_listener(self.on_menu_change)
+		self.rebuild_servings_index()
+	
+	def compute_drink_servings(self, drink: str) -> int:
+		"""
+		Computes from scratch how many servings of a drink the containers can deliver
+		:param drink:
+		:return servings:  # 0 if an ingredient lacks a container or volume, UNLIMITED_SERVINGS if
+		the bom does not consume any volume - the volume held by reservations is not counted
+		
+		external methods activated:
+			drinks_menu.get_drink_bom
+			materials_dispenser.get_volume_material_container
+		"""
+		servings = UNLIMITED_SERVINGS
+		drink_bom = self.drinks_menu.get_drink_bom(drink)
+		# read once: this runs for every drink using a container after each change of the container
+		held_volumes = self.materials_dispenser.held_volumes
+		for ingr in drink_bom:
+			vol_required = drink_bom[ingr]
+			vol_available = self.materials_dispenser.get_volume_material_container(ingr)
+			if vol_available < 0:  # the ingredient has no container in the dispenser
+				return 0
+			if held_volumes:
+				vol_available -= held_volumes.get(ingr, 0)
+			if vol_required > 0:
+				servings = min(servings, int(vol_available // vol_required))
+		return servings
+	
+	def rebuild_servings_index(self):
+		"""
+		Recomputes the servings remaining index for every drink of the menu
+		
+		external methods activated:
+			drinks_menu.get_all_drinks
+		"""
+		self.drinks_servings = {
+			drink: self.compute_drink_servings(drink) for drink in self.drinks_menu.get_all_drinks()
+		}
+		self.availability_version += 1
+	
+	def index_drink_servings(self, drink: str):
+		"""
+		Refreshes the servings of a drink, availability_version follows the drinks going in or out
+		of stock
+		"""
+		servings = self.compute_drink_servings(drink)
+		if (servings > 0) != (self.drinks_servings.get(drink, 0) > 0):
+			self.availability_version += 1
+		self.drinks_servings[drink] = servings
+	
+	def on_container_change(self, operation: str, material: str, amount: Union[int, float]):
+		"""
+		Listener of materials_dispenser: refreshes the servings of the drinks using the material
+		:param operation:  # 'allocate', 'refill', 'takeout', 'hold' or 'release'
+		:param material:  # the material whose container changed
+		:param amount:  # not used, the servings are computed from the current available volumes
+		
+		external methods activated:
+			drinks_menu.get_material_drinks
+		"""
+		with self.servings_lock or NO_CONTAINERS_LOCK:
+			for drink in self.drinks_menu.get_material_drinks(material):
+				self.index_drink_servings(drink)
+	
+	def on_menu_change(self, operation: str, drink: str):
+		"""
+		Listener of drinks_menu: indexes the servings of a new drink, then notifies the menu
+		listeners of the machine
+		:param operation:  # 'add' or 'update'
+		:param drink:
+		"""
+		with self.servings_lock or NO_CONTAINERS_LOCK:
+			self.index_drink_servings(drink)
+		for listener in self.menu_listeners:
+			listener(operation, drink)
+	
+	def add_menu_listener(self, listener: Callable[[str, Union[str, None]], None]):
+		"""
+		=> Registers a callback notified after each change of the menu of the machine, the
+		servings index is up to date when it runs. Unlike DrinksMenu.add_menu_listener it follows
+		the machine when it switches menu, frozen or not
+		The listener receives (operation, drink) where operation is 'add' or 'update' (see
+		DrinksMenu.add_menu_listener) or 'switch' (drink = None) after set_drinks_menu
+		
+		:param listener: callable(operation, drink)
+		"""
+		self.menu_listeners.append(listener)
+	
+	def remove_menu_listener(self, listener: Callable[[str, Union[str, None]], None]) -> bool:
+		"""
+		=> Unregisters a callback previously added by add_menu_listener
+		:return: True if the listener was registered False otherwise
+		"""
+		if listener in self.menu_listeners:
+			self.menu_listeners.remove(listener)
+			return True
+		return False
+	
+	def rebuild_indexes(self):
+		"""
+		=> Rebuilds the indexes of the machine after its state was restored in bulk without going
+		through allocate_material_container / add_drink / add_accepted_coins
+		
+		external methods activated:
+			materials_dispenser.rebuild_indexes
+			drinks_menu.rebuild_indexes
+			accepted_coins.rebuild_indexes
+		"""
+		self.materials_dispenser.rebuild_indexes()
+		self.drinks_menu.rebuild_indexes()
+		self.accepted_coins.rebuild_indexes()
+		with self.servings_lock or NO_CONTAINERS_LOCK:
+			self.rebuild_servings_index()
+	
+	def set_drinks_menu(self, drinks_menu: 'DrinksMenu'):
+		"""
+		=> Switches the machine to another menu (typically the next frozen version of a shared menu
+		prepared with DrinksMenu.derive), reindexes the servings and notifies the menu listeners of
+		the machine ('switch')
+		:param drinks_menu:
+		"""
+		self.drinks_menu.remove_menu_listener(self.on_menu_change)
+		self.drinks_menu = drinks_menu
+		drinks_menu.add_menu_listener(self.on_menu_change)
+		with self.servings_lock or NO_CONTAINERS_LOCK:
+			self.rebuild_servings_index()
+		for listener in self.menu_listeners:
+			listener('switch', None)
+	
+	def set_coins_catalog(self, coins_catalog: AcceptedCoinsDispenser):
+		"""
+		=> Switches the machine to another frozen coins catalog, the coins held by the machine are
+		kept for the coins still accepted, and so are the coins listeners
+		:param coins_catalog:
+		"""
+		accepted_coins = coins_catalog.share_catalog()
+		for coin in accepted_coins.coins_inventory:
+			accepted_coins.coins_inventory[coin] = max(0, self.accepted_coins.get_coin_count(coin))
+		accepted_coins.coins_listeners = self.accepted_coins.coins_listeners
+		self.accepted_coins = accepted_coins
+	
+	def get_drink_servings(self, drink: str) -> int:
+		"""
+		Returns how many servings of a drink can still be made - O(1) lookup of the servings index
+		:param drink:
+		:return servings:  # 0 if the drink is not in the menu or cannot be made
+		"""
+		if self.materials_dispenser.holds:
+			self.materials_dispenser.expire_holds()
+		return self.drinks_servings.get(drink, 0)
+	
+	def get_available_drinks(self) -> list:
+		"""
+		Returns the drinks that can be ordered right now, in drinks_menu order
+		:return: list of drinks with at least one serving remaining - the expired holds are
+		released first
+		"""
+		if self.materials_dispenser.holds:
+			self.materials_dispenser.expire_holds()
+		return [drink for drink, servings in self.drinks_servings.items() if servings > 0]
 
 	
 	def check_drink_availability(self, ordered_drink: str) -> bool:
@@ -506,30 +1980,30 @@ class VendingMachineOperations:
 		:param ordered_drink:
 		:return: True if the ordered_drink can be made False otherwise
 		
+		The check reads the servings remaining index maintained by on_container_change and
+		on_menu_change, it does not rescan the drink bom - the expired holds are released first
+		"""
+		if self.materials_dispenser.holds:
+			self.materials_dispenser.expire_holds()
+		# drinks not in the menu are absent from the servings index
+		return self.drinks_servings.get(ordered_drink, 0) > 0
+	
+	def reserve_drink(self, ordered_drink: str, duration: float = RESERVATION_SECONDS) -> int:
+		"""
+		Holds the bom of a drink while the customer pays: the drink stays available to this order
+		only, see process_order(hold_id=...)
+		:param ordered_drink:
+		:param duration:  # seconds before the hold expires
+		:return: hold id - -1 if the drink is not in the menu or cannot be made
+		
 		external methods activated:
 			drinks_menu.exist_drink
 			drinks_menu.get_drink_bom
-			materials_dispenser.exist_material_container
-			materials_dispenser.get_volume_material_container
-
+			materials_dispenser.reserve_materials
 		"""
-		count_ok = 0
-		
-
-		if self.drinks_menu.exist_drink(ordered_drink):
-			drink_bom = self.drinks_menu.get_drink_bom(ordered_drink)
-			for ingr in drink_bom:
-				vol_required = drink_bom[ingr]
-				if self.materials_dispenser.exist_material_container(ingr):
-					# The ingredient has a container in the dispenser - check volume
-					
-					vol_available = self.materials_dispenser.get_volume_material_container(ingr)
-					if vol_available >= vol_required:
-						count_ok += 1
-			
-			if count_ok == len(drink_bom):
-				return True
-		return False
+		if not self.drinks_menu.exist_drink(ordered_drink):
+			return -1
+		return self.materials_dispenser.reserve_materials(self.drinks_menu.get_drink_bom(ordered_drink), duration)
 	
 	def ask_user_drink(self):
 		"""
@@ -537,59 +2011,200 @@ class VendingMachineOperations:
 		:return:
 		
 		external methods activated:
-			drinks_menu.get_all_drinks
-			drinks_menu.exist_drink
-			drinks_menu.get_drink_price
-			drinks_menu.get_drink_command
-			materials_dispenser.exist_material_container
-			materials_dispenser.get_volume_material_container
+			drinks_menu.get_drink_by_command
+			self.render_menu
 		"""
 		
-		drinks_in_menu = self.drinks_menu.get_all_drinks()
-		for drink in drinks_in_menu:
-			if self.check_drink_availability(drink):
-				drink_price = self.drinks_menu.get_drink_price(drink)
-				drink_command = self.drinks_menu.get_drink_command(drink)
-				print(
-					f"Want {drink} for {drink_price} US$?"
-					f"then type: {drink_command}"
-				)
+		print(self.render_menu(), end='')
 		user_choice = input("So what is your choice? =?> ")
 		print(f"\n===vending_machine_simulator=> You ordered {user_choice}")
-		for drink in drinks_in_menu:
-			drink_command = self.drinks_menu.get_drink_command(drink)
-			if user_choice == drink_command:
-				return drink
-		# user choice unrecognizable
-		drink = '#'
-		return drink
+		# "#" if the user choice is unrecognizable
+		return self.drinks_menu.get_drink_by_command(user_choice)
+	
+	def get_menu_offers(self) -> List[Tuple[str, float, str]]:
+		"""
+		Returns the menu choices that can be ordered right now
+		:return: list of (drink, price, command) in drinks_menu order
+		
+		external methods activated:
+			drinks_menu.get_drink_price
+			drinks_menu.get_drink_command
+			self.get_available_drinks
+		"""
+		return [
+			(drink, self.drinks_menu.get_drink_price(drink), self.drinks_menu.get_drink_command(drink))
+			for drink in self.get_available_drinks()
+		]
+	
+	def render_menu(self) -> str:
+		"""
+		Returns the text of the menu choices displayed by ask_user_drink, one line per drink that
+		can be ordered right now - the text is cached until the menu or the availability changes
+		:return: menu text, '' if no drink can be ordered
+		
+		external methods activated:
+			materials_dispenser.expire_holds
+			self.get_menu_offers
+		"""
+		# an expired hold changes the availability: released before the cache key is read
+		if self.materials_dispenser.holds:
+			self.materials_dispenser.expire_holds()
+		key = (self.drinks_menu.menu_version, self.availability_version)
+		rendered_menu = self.rendered_menu
+		if rendered_menu is not None and rendered_menu[:2] == key:
+			return rendered_menu[2]
+		text = ''.join(
+			f"Want {drink} for {drink_price} US$?then type: {drink_command}\n"
+			for drink, drink_price, drink_command in self.get_menu_offers()
+		)
+		self.rendered_menu = (*key, text)
+		return text
+	
+	def get_payment_amount(self, inserted_coins: Dict[str, int]) -> float:
+		"""
+		Computes the amount paid with coins, coins not accepted by the machine are worth nothing
+		:param inserted_coins:  # {coin name: number of coins}
+		:return: amount paid in dollars (computed in integer cents)
+		
+		external methods activated:
+			accepted_coins.get_coins_cents
+		"""
+		return self.accepted_coins.get_coins_cents(inserted_coins) / 100
+	
+	def checkout_payment(
+			self, ordered_drink: str, inserted_coins: Dict[str, int]
+	) -> Tuple[str, Dict[str, int]]:
+		"""
+		Non interactive version of drink_checkout: the coins are given instead of asked with input()
+		Amounts are handled in integer cents and the change is planned with the coins the machine
+		physically holds - nothing is collected yet (see process_order)
+		:param ordered_drink:
+		:param inserted_coins:  # {coin name: number of coins}
+		:return: (PAYMENT_ACCEPTED, change coins) if the payment covers the drink price and the change
+		can be made, (ORDER_INVALID_COINS, ORDER_INSUFFICIENT_PAYMENT or ORDER_NO_CHANGE, inserted
+		coins) otherwise - the coins not accepted by the machine are always given back
+		
+		external methods activated:
+			drinks_menu.get_drink_price
+			accepted_coins.valid_coins_counts
+			accepted_coins.exist_accepted_coins
+			accepted_coins.get_coins_cents
+			accepted_coins.compute_change
+		"""
+		# a negative or fractional count would pay with coins never inserted
+		if not self.accepted_coins.valid_coins_counts(inserted_coins):
+			return ORDER_INVALID_COINS, dict(inserted_coins)
+		drink_price = self.drinks_menu.get_drink_price(ordered_drink)
+		payment_cents = self.accepted_coins.get_coins_cents(inserted_coins)
+		if drink_price < 0 or payment_cents < to_cents(drink_price):
+			return ORDER_INSUFFICIENT_PAYMENT, dict(inserted_coins)
+		accepted_inserted = {
+			coin: number_coins for coin, number_coins in inserted_coins.items()
+			if self.accepted_coins.exist_accepted_coins(coin)
+		}
+		change_coins = self.accepted_coins.compute_change(
+			payment_cents - to_cents(drink_price), accepted_inserted
+		)
+		if change_coins is None:
+			return ORDER_NO_CHANGE, dict(inserted_coins)
+		for coin, number_coins in inserted_coins.items():
+			if coin not in accepted_inserted:
+				change_coins[coin] = number_coins
+		return PAYMENT_ACCEPTED, change_coins
+	
+	def process_order(
+			self, ordered_drink: str, inserted_coins: Dict[str, int], hold_id: Union[int, None] = None
+	) -> Tuple[str, Dict[str, int]]:
+		"""
+		Non interactive order: availability -> checkout -> make drink -> payment and revenue booking
+		All the state changes happen in this call so sessions interleaved on one event loop or
+		replayed from a stream share the machine safely
+		:param ordered_drink:
+		:param inserted_coins:  # {coin name: number of coins}
+		:param hold_id:  # hold of reserve_drink(ordered_drink): the drink is made from the held
+		volume, committed only if the payment is accepted (the caller releases it otherwise) - a hold
+		placed for another drink is refused with ORDER_UNAVAILABLE before the payment is collected
+		:return: (outcome, coins handed back) - outcome is ORDER_SERVED, ORDER_UNKNOWN_DRINK,
+		ORDER_UNAVAILABLE, ORDER_INVALID_COINS, ORDER_INSUFFICIENT_PAYMENT or ORDER_NO_CHANGE, the inserted coins are
+		handed back unless the drink is served (then the change coins are)
+		
+		external methods activated:
+			drinks_menu.exist_drink
+			drinks_menu.get_drink_price
+			accepted_coins.collect_payment
+			financials.add_revenue
+			materials_dispenser.commit_hold
+			self.check_drink_availability
+			self.checkout_payment
+			self.make_drink
+		"""
+		if not self.drinks_menu.exist_drink(ordered_drink):
+			return ORDER_UNKNOWN_DRINK, dict(inserted_coins)
+		if hold_id is None and not self.check_drink_availability(ordered_drink):
+			return ORDER_UNAVAILABLE, dict(inserted_coins)
+		# the coins inventory must not change between the change plan and its collection
+		with self.coins_lock or NO_CONTAINERS_LOCK:
+			outcome, change_coins = self.checkout_payment(ordered_drink, inserted_coins)
+			if outcome != PAYMENT_ACCEPTED:
+				return outcome, change_coins
+			if hold_id is not None:
+				# the hold expired or was placed for another drink
+				if not self.materials_dispenser.commit_hold(hold_id, self.drinks_menu.get_drink_bom(ordered_drink)):
+					return ORDER_UNAVAILABLE, dict(inserted_coins)
+			elif not self.make_drink(ordered_drink):  # another session took the last serving meanwhile
+				return ORDER_UNAVAILABLE, dict(inserted_coins)
+			self.accepted_coins.collect_payment(inserted_coins, change_coins)
+		self.financials.add_revenue(
+			self.drinks_menu.get_drink_price(ordered_drink),
+			ordered_drink,
+			self.accepted_coins.get_coins_cents(inserted_coins),
+			self.accepted_coins.get_coins_cents(change_coins)
+		)
+		return ORDER_SERVED, change_coins
 	
 	def drink_checkout(self, ordered_drink):
 		"""
-
+		Interactive checkout: asks with input() how many coins of each accepted coin are inserted
+		until the drink price is covered, then hands out the change from the coins inventory
 		:param ordered_drink:
-		:return:
+		:return: True if the drink is paid False otherwise
 		
 		external methods activated:
 			drinks_menu.get_drink_price
 			accepted_coins.get_all_coins
-			accepted_coins.get_coin_value
+			accepted_coins.get_coin_cents
+			accepted_coins.compute_change
+			accepted_coins.collect_payment
 			
 		"""
 		
-		drink_price = self.drinks_menu.get_drink_price()
-		current_payment = 0
+		drink_price = self.drinks_menu.get_drink_price(ordered_drink)
+		price_cents = to_cents(drink_price)
+		payment_cents = 0
+		inserted_coins: Dict[str, int] = {}
 		coins_accepted = self.accepted_coins.get_all_coins()
 		for coin in coins_accepted:
 			number_coins = int(input(f" <{coin}> : How many?"))
-			coin_value = self.accepted_coins.get_coin_value(coin)
-			current_payment += coin_value * number_coins
-			if drink_price <= current_payment:
-				change = current_payment - drink_price
-				print(f" You are all set for your <{ordered_drink}> and your change is <{change}>")
+			inserted_coins[coin] = number_coins
+			payment_cents += self.accepted_coins.get_coin_cents(coin) * number_coins
+			if price_cents <= payment_cents:
+				change_coins = self.accepted_coins.compute_change(payment_cents - price_cents, inserted_coins)
+				if change_coins is None:
+					print(
+						f" Sorry no change available for your <{ordered_drink}>"
+						f" Here is your payment back: {payment_cents / 100}"
+					)
+					return False
+				self.accepted_coins.collect_payment(inserted_coins, change_coins)
+				change = (payment_cents - price_cents) / 100
+				print(
+					f" You are all set for your <{ordered_drink}> and your change is <{change}>"
+					f" {change_coins}"
+				)
 				return True
 		
 		# at this level the user introduced an insufficient amount to pay for his ordered_drink
+		current_payment = payment_cents / 100
 		change = current_payment
 		print(
 			f" {current_payment} is insufficient for your"
@@ -601,30 +2216,79 @@ class VendingMachineOperations:
 	def make_drink(self, ordered_drink):
 		"""
 		Drink consumption requires ingredients, this method reduces volume accordingly to drink_bom
+		The whole bom is taken out at once: either every ingredient is deducted or none is
 		:param ordered_drink:
-		:return:
+		:return: True if the drink was made False otherwise (no container or volume is changed)
 		
 		external methods activated:
 			drinks_menu.exist_drink
-			drinks_menu.get_drink_price
 			drinks_menu.get_drink_bom
-			materials_dispenser.exist_material_container
-			materials_dispenser.takeout_material_container
+			materials_dispenser.takeout_materials
 		"""
 		if self.drinks_menu.exist_drink(ordered_drink):
 			drink_bom = self.drinks_menu.get_drink_bom(ordered_drink)
-			for ingr in drink_bom:
-				vol_required = drink_bom[ingr]
-				if self.materials_dispenser.exist_material_container(ingr):
-					# The ingredient has a container in the dispenser - check volume
-					new_volume = self.materials_dispenser.takeout_material_container(
-						ingr, vol_required
-					)
-					if new_volume < 0:  # program error make_drink should not have been activated
-						return False
-			return True
+			return self.materials_dispenser.takeout_materials(drink_bom)
 		return False
 	
+	def make_drinks(self, orders: List[str]) -> List[bool]:
+		"""
+		Bulk version of make_drink: the orders are served in sequence against a local copy of the
+		volumes, then the volumes of the orders made are deducted under the same locks and the
+		listeners are notified once per material (once per order for non-integer volumes, whose sum
+		would not round as the successive deductions do)
+		:param orders:  # list of ordered drinks (a drink may be ordered several times)
+		:return: list of flags, one per order - True if made, False otherwise, as make_drink
+		called order after order would return
+		
+		external methods activated:
+			drinks_menu.exist_drink
+			drinks_menu.get_drink_bom
+			materials_dispenser.get_available_volume_material_container
+			materials_dispenser.deduct_materials
+			materials_dispenser.notify_containers_listeners
+		"""
+		boms: Dict[str, Union[Dict[str, int], None]] = {}
+		for ordered_drink in orders:
+			if ordered_drink not in boms:
+				boms[ordered_drink] = (
+					self.drinks_menu.get_drink_bom(ordered_drink)
+					if self.drinks_menu.exist_drink(ordered_drink) else None
+				)
+		batch_materials = {ingr for drink_bom in boms.values() if drink_bom for ingr in drink_bom}
+		remaining: Dict[str, Union[int, float]] = {}
+		draws: Dict[str, List[Union[int, float]]] = {}
+		results = []
+		dispenser = self.materials_dispenser
+		# in thread_safe mode no other order can change the batch containers until it is committed
+		with dispenser.hold_containers(batch_materials):
+			for ordered_drink in orders:
+				drink_bom = boms[ordered_drink]
+				if drink_bom is None:
+					results.append(False)
+					continue
+				made = True
+				for ingr, vol_required in drink_bom.items():
+					if ingr not in remaining:
+						# -1 if the ingredient has no container: the order can never be made
+						remaining[ingr] = dispenser.get_available_volume_material_container(ingr)
+					if remaining[ingr] < 0 or remaining[ingr] - vol_required < 0:
+						made = False
+						break
+				if made:
+					for ingr, vol_required in drink_bom.items():
+						remaining[ingr] -= vol_required
+						draws.setdefault(ingr, []).append(vol_required)
+					# the very volumes checked above: a re-check of their sum could round differently
+					dispenser.deduct_materials(drink_bom)
+				results.append(made)
+			for ingr, volumes in draws.items():
+				if all(type(volume) is int for volume in volumes):
+					dispenser.notify_containers_listeners('takeout', ingr, sum(volumes))
+				else:
+					for volume in volumes:
+						dispenser.notify_containers_listeners('takeout', ingr, volume)
+		return results
+	
 	# ###################################################################################
 	# ## ===vending_machine_simulator=> Vending Machines Financials
 	# ###################################################################################
@@ -632,34 +2296,233 @@ class VendingMachineOperations:
 class VendingMachineFinancials:
 	"""
 	Manages revenues and financial statistics
+	Every sale is appended to a columnar ledger: one entry of each typed array per sale (about
+	44 bytes) instead of one dictionary per sale, running aggregates answer the totals in O(1)
+	and the time ordered columns answer the range queries by bisection
 	attributes:
-		vending_machine_revenue  # float value of cumulated payments of drinks ordered
+		vending_machine_revenue  # float value of cumulated payments of drinks ordered (current cycle)
+		ledger_times  # array('d') sale timestamps (seconds since the epoch), non decreasing
+		ledger_drinks  # array('I') sold drink ids, see drinks_ids / drinks_names
+		ledger_cents  # array('q') drink price in cents
+		ledger_paid_cents, ledger_change_cents  # array('q') payment breakdown in cents
+		ledger_cumulated_cents  # array('q') revenue in cents up to and including each sale
+		drinks_cents, drinks_sales  # array('q') running revenue / number of sales per drink id
+		cycle_start  # index of the first sale of the current business cycle
+		financials_listeners  # callbacks notified after each sale or reset: listener(operation, sale)
 	methods:
 		def reset_revenue(self):
-		def add_revenue(self, amount: float):
+		def add_revenue(self, amount: float, drink: str, paid_cents: int, change_cents: int, timestamp: float):
 		def get_current_revenue(self) -> float:
+		def get_total_revenue(self) -> float:
+		def get_sales_count(self) -> int:
+		def get_drink_revenue(self, drink: str) -> float:
+		def get_sales_range(self, start: float, end: float) -> Tuple[int, int]:
+		def get_revenue_between(self, start: float, end: float) -> float:
+		def get_revenue_by_period(self, period: float, start: float, end: float) -> Dict[float, float]:
+		def top_drinks(self, number: int, start: float, end: float) -> List[Tuple[str, float]]:
+		def add_financials_listener(self, listener):
+		def remove_financials_listener(self, listener):
 	"""
 	
-	def __init__(self):
+	def __init__(self, thread_safe: bool = False, clock: Callable[[], float] = clock_now):
+		"""
+		:param thread_safe:  # True when sales are booked from several threads
+		:param clock:  # returns the timestamp of a sale (seconds), the module clock by default (see
+		set_clock) - replaced by simulations and tests
+		"""
 		self.vending_machine_revenue: float = 0.0
+		self.clock = clock
+		# drink ids interned on their first sale, id 0 books the sales of unnamed drinks
+		self.drinks_ids: Dict[str, int] = {'': 0}
+		self.drinks_names: List[str] = ['']
+		self.ledger_times = array('d')
+		self.ledger_drinks = array('I')
+		self.ledger_cents = array('q')
+		self.ledger_paid_cents = array('q')
+		self.ledger_change_cents = array('q')
+		self.ledger_cumulated_cents = array('q')
+		self.drinks_cents = array('q', [0])
+		self.drinks_sales = array('q', [0])
+		self.cycle_start: int = 0
+		self.cycle_cents: int = 0
+		# a sale appends to several columns which must stay aligned
+		self.ledger_lock = threading.Lock() if thread_safe else None
+		# Callbacks notified after each sale or cycle reset: listener(operation, sale)
+		self.financials_listeners: List[Callable[[str, Union[tuple, None]], None]] = []
+	
+	def add_financials_listener(self, listener: Callable[[str, Union[tuple, None]], None]):
+		"""
+		=> Registers a callback notified after each change of the ledger, under the ledger lock in
+		thread_safe mode (the sales and resets reach the listeners in the ledger order)
+		The listener receives (operation, sale) where operation is 'sale' with
+		sale = (timestamp, drink, cents, paid_cents, change_cents) or 'reset' with sale = None
+		
+		:param listener: callable(operation, sale)
+		"""
+		self.financials_listeners.append(listener)
+	
+	def remove_financials_listener(self, listener: Callable[[str, Union[tuple, None]], None]) -> bool:
+		"""
+		=> Unregisters a callback previously added by add_financials_listener
+		:return: True if the listener was registered False otherwise
+		"""
+		if listener in self.financials_listeners:
+			self.financials_listeners.remove(listener)
+			return True
+		return False
 	
 	
 	def reset_revenue(self):
 		"""
-		Starts Vending Machine new business cycle
+		Starts Vending Machine new business cycle - the ledger keeps the sales of the past cycles
 		"""
-		self.vending_machine_revenue = 0
+		with self.ledger_lock or NO_CONTAINERS_LOCK:
+			self.cycle_start = len(self.ledger_times)
+			self.cycle_cents = 0
+			self.vending_machine_revenue = 0
+			for listener in self.financials_listeners:
+				listener('reset', None)
 	
-	def add_revenue(self, amount: float):
+	def add_revenue(
+			self,
+			amount: float,
+			drink: str = '',
+			paid_cents: int = -1,
+			change_cents: int = 0,
+			timestamp: Union[float, None] = None
+	):
 		"""
-		User consumed a drink - the payment is added to the vending_machine_revenue
+		User consumed a drink - the payment is added to the vending_machine_revenue and the ledger
 		:param amount:  # it corresponds to the drink price the user order
+		:param drink:  # drink sold
+		:param paid_cents:  # coins inserted by the user in cents, -1 if unknown (exact payment assumed)
+		:param change_cents:  # change handed back in cents
+		:param timestamp:  # time of the sale, None for now (clock) - given when a journal is replayed
 		"""
-		self.vending_machine_revenue += amount
+		cents = to_cents(amount)
+		with self.ledger_lock or NO_CONTAINERS_LOCK:
+			drink_id = self.drinks_ids.get(drink)
+			if drink_id is None:
+				drink_id = self.drinks_ids[drink] = len(self.drinks_names)
+				self.drinks_names.append(drink)
+				self.drinks_cents.append(0)
+				self.drinks_sales.append(0)
+			if timestamp is None:
+				timestamp = self.clock()
+			# keeps the time column sorted for the range queries even if the clock steps back
+			if self.ledger_times and timestamp < self.ledger_times[-1]:
+				timestamp = self.ledger_times[-1]
+			cumulated = self.ledger_cumulated_cents[-1] if self.ledger_cumulated_cents else 0
+			self.ledger_times.append(timestamp)
+			self.ledger_drinks.append(drink_id)
+			self.ledger_cents.append(cents)
+			self.ledger_paid_cents.append(paid_cents if paid_cents >= 0 else cents)
+			self.ledger_change_cents.append(change_cents)
+			self.ledger_cumulated_cents.append(cumulated + cents)
+			self.drinks_cents[drink_id] += cents
+			self.drinks_sales[drink_id] += 1
+			self.cycle_cents += cents
+			self.vending_machine_revenue = self.cycle_cents / 100
+			sale = (timestamp, drink, cents, self.ledger_paid_cents[-1], change_cents)
+			for listener in self.financials_listeners:
+				listener('sale', sale)
 		
 	def get_current_revenue(self) -> float:
 		return self.vending_machine_revenue
 	
+	def get_total_revenue(self) -> float:
+		"""
+		Returns the revenue of all the sales booked since the machine started (all cycles)
+		"""
+		return (self.ledger_cumulated_cents[-1] if self.ledger_cumulated_cents else 0) / 100
+	
+	def get_sales_count(self) -> int:
+		"""
+		Returns the number of sales booked in the ledger
+		"""
+		return len(self.ledger_times)
+	
+	def get_drink_revenue(self, drink: str) -> float:
+		"""
+		Returns the revenue of a drink over all the sales, 0 if it was never sold
+		"""
+		drink_id = self.drinks_ids.get(drink)
+		return self.drinks_cents[drink_id] / 100 if drink_id is not None else 0.0
+	
+	def get_sales_range(
+			self, start: Union[float, None] = None, end: Union[float, None] = None
+	) -> Tuple[int, int]:
+		"""
+		Returns the (first, last + 1) ledger indices of the sales made in [start, end[
+		:param start:  # timestamp, None for the first sale
+		:param end:  # timestamp, None for after the last sale
+		"""
+		first = bisect_left(self.ledger_times, start) if start is not None else 0
+		last = bisect_left(self.ledger_times, end) if end is not None else len(self.ledger_times)
+		return first, max(first, last)
+	
+	def get_revenue_between(self, start: Union[float, None] = None, end: Union[float, None] = None) -> float:
+		"""
+		=> Returns the revenue of the sales made in [start, end[ in O(log(sales))
+		:param start:  # timestamp, None for the first sale
+		:param end:  # timestamp, None for after the last sale
+		"""
+		first, last = self.get_sales_range(start, end)
+		if first == last:
+			return 0.0
+		cumulated = self.ledger_cumulated_cents
+		return (cumulated[last - 1] - (cumulated[first - 1] if first else 0)) / 100
+	
+	def get_revenue_by_period(
+			self, period: float = 3600, start: Union[float, None] = None, end: Union[float, None] = None
+	) -> Dict[float, float]:
+		"""
+		=> Returns the revenue of the sales made in [start, end[ grouped by period (per hour by default)
+		:param period:  # length of a period in seconds, periods are aligned on multiples of period
+		:param start:  # timestamp, None for the first sale
+		:param end:  # timestamp, None for after the last sale
+		:return: {period start timestamp: revenue} for the periods with sales, in time order
+		"""
+		first, last = self.get_sales_range(start, end)
+		revenues: Dict[float, float] = {}
+		index = first
+		while index < last:
+			period_start = self.ledger_times[index] // period * period
+			# each period is one range query: the cost grows with the periods, not the sales
+			period_end = min(self.get_sales_range(period_start + period)[0], last)
+			revenues[period_start] = (
+				self.ledger_cumulated_cents[period_end - 1]
+				- (self.ledger_cumulated_cents[index - 1] if index else 0)
+			) / 100
+			index = period_end
+		return revenues
+	
+	def top_drinks(
+			self, number: int = 5, start: Union[float, None] = None, end: Union[float, None] = None
+	) -> List[Tuple[str, float]]:
+		"""
+		=> Returns the drinks with the highest revenue, over all the sales (running aggregates) or
+		over the sales made in [start, end[
+		:param number:  # N of the top N
+		:param start:  # timestamp, None for the first sale
+		:param end:  # timestamp, None for after the last sale
+		:return: [(drink, revenue)] highest revenue first
+		"""
+		if start is None and end is None:
+			drinks_cents = self.drinks_cents
+		else:
+			first, last = self.get_sales_range(start, end)
+			drinks_cents = array('q', bytes(8 * len(self.drinks_names)))
+			ledger_drinks = self.ledger_drinks
+			ledger_cents = self.ledger_cents
+			for index in range(first, last):
+				drinks_cents[ledger_drinks[index]] += ledger_cents[index]
+		top = heapq.nlargest(
+			number, (drink_id for drink_id in range(len(drinks_cents)) if drinks_cents[drink_id] > 0),
+			key=drinks_cents.__getitem__
+		)
+		return [(self.drinks_names[drink_id], drinks_cents[drink_id] / 100) for drink_id in top]
+	
 		
 	
 	
@@ -685,6 +2548,7 @@ class DrinksBusinessMaintenance:
 		def add_admin_command(self, control_command):
 		def report_containers_levels(self):
 		def refill_all_containers(self):
+		def watch_containers_levels(self, observer, low_water_ratio, empty):
 			
 	"""
 	
@@ -728,9 +2592,9 @@ class DrinksBusinessMaintenance:
 			f"At this point of time: {time_stamp}"
 			f"The Containers are in the following status:"
 		)
-		for material in self.materials_dispenser:
-			material_capacity = self.materials_dispenser[material]['capacity']
-			material_volume = self.materials_dispenser[material]['volume']
+		for material, container in self.materials_dispenser.materials_containers.items():
+			material_capacity = container['capacity']
+			material_volume = container['volume']
 			# material = materials_available.key()
 			# filled = materials_available.value()
 			print(
@@ -749,5 +2613,22 @@ class DrinksBusinessMaintenance:
 			materials_volume[material] = volume
 		return materials_volume
 
+	def watch_containers_levels(self, observer, low_water_ratio: float = 0.2, empty: Union[int, float] = 0):
+		"""
+		=> Registers a threshold observer on every container instead of polling
+		report_containers_levels: observer(material, level, volume) is notified once when a container
+		runs low (low_water_ratio of its capacity) and once when it is empty, until its next refill
+		:param observer:  # callable(material, level, volume), see add_threshold_observer
+		:param low_water_ratio:  # share of the capacity
+		:param empty:  # volume at or below which a container is considered empty
+		:return: number of containers watched
+		"""
+		dispenser = self.materials_dispenser
+		materials = list(dispenser.materials_containers)
+		for material in materials:
+			low_water = dispenser.get_capacity_material_container(material) * low_water_ratio
+			dispenser.add_threshold_observer(material, observer, low_water, empty)
+		return len(materials)
+
 
 print(f"\n===vending_machine_simulator=> Class/Methods/Attributes <20240210-v09> @ {date_stamp()}")
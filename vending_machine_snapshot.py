@@ -0,0 +1,308 @@
+"""
+Vending Machine Snapshot
+=> Binary snapshot / restore of the whole state of a VendingMachineOperations: containers,
+drinks menu, coins (values and inventory) and financials (ledger and aggregates)
+
+The snapshot is a header followed by typed arrays: a restore reads each array with one
+array.frombytes (memcpy) from a memory-mapped file and fills the dictionaries in bulk, then
+rebuilds the indexes once (the rebuild_indexes methods) instead of replaying
+allocate_material_container / add_drink / add_accepted_coins item by item
+
+It consists of the following elements:
+
+### snapshot format (all integers little endian unless the header says otherwise):
+	header: magic b'VMSSNAP\\0', version (B), byte order of the arrays (B: 0 little, 1 big),
+	flags (H: thread_safe, command_trie, compact_containers, servings_held), number of sections (I)
+	servings_held: the saved servings index counts the holds of the machine, which are not saved
+	sections lengths in bytes (Q each)
+	sections: one typed array each, in SECTIONS order; the names of materials, drinks, commands
+	and coins are interned in a string table (utf-8, '\\0' separated) and referenced by index
+
+### def dumps_snapshot(vmo):
+	=> Returns the snapshot of a VendingMachineOperations as bytes
+
+### def loads_snapshot(buffer, thread_safe, compact_containers):
+	=> Rebuilds a VendingMachineOperations from a snapshot held in any bytes-like object,
+	a damaged or truncated snapshot raises ValueError
+
+### def save_snapshot(vmo, path):
+	=> Writes the snapshot of a VendingMachineOperations to a file (atomically replaced)
+
+### def load_snapshot(path, thread_safe, compact_containers):
+	=> Memory-maps a snapshot file and rebuilds its VendingMachineOperations
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Dict, List, Union
+
+from vending_machine_simulator import ArrayMaterialsContainersDispenser, VendingMachineOperations
+
+SNAPSHOT_MAGIC = b'VMSSNAP\0'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<8sBBHI')
+FLAG_THREAD_SAFE = 1
+FLAG_COMMAND_TRIE = 2
+FLAG_COMPACT_CONTAINERS = 4
+FLAG_SERVINGS_HELD = 8  # drinks_servings was saved with holds outstanding: recomputed on restore
+
+# (section name, array typecode) in file order
+SECTIONS = (
+	('strings', 'B'),  # utf-8 string table, '\0' separated
+	('containers_materials', 'I'),  # string index of each container material
+	('containers_capacities', 'd'),
+	('containers_volumes', 'd'),
+	('containers_integers', 'B'),  # bit 0: capacity is an int, bit 1: volume is an int
+	('drinks_names', 'I'),
+	('drinks_prices', 'd'),
+	('drinks_commands', 'I'),
+	('drinks_bom_ends', 'I'),  # end of the bom of each drink in the bom_* sections
+	('bom_materials', 'I'),
+	('bom_volumes', 'd'),
+	('bom_integers', 'B'),  # 1 where the required volume is an int
+	('drinks_servings', 'q'),  # servings index, restored instead of recomputed
+	('coins_names', 'I'),
+	('coins_values', 'd'),
+	('coins_counts', 'q'),
+	('ledger_names', 'I'),  # string index of each financials drink id
+	('ledger_drinks_cents', 'q'),
+	('ledger_drinks_sales', 'q'),
+	('ledger_cycle', 'q'),  # cycle_start, cycle_cents
+	('ledger_times', 'd'),
+	('ledger_drinks', 'I'),
+	('ledger_cents', 'q'),
+	('ledger_paid_cents', 'q'),
+	('ledger_change_cents', 'q'),
+	('ledger_cumulated_cents', 'q'),
+)
+
+
+def dumps_snapshot(vmo: VendingMachineOperations) -> bytes:
+	"""
+	=> Serializes the state of a machine
+	:param vmo:
+	:return: snapshot bytes
+	:raise ValueError: if a name contains '\\0' (the separator of the string table)
+	"""
+	strings: Dict[str, int] = {}
+
+	def intern(name: str) -> int:
+		index = strings.get(name)
+		if index is None:
+			if '\0' in name:
+				raise ValueError(f'name {name!r} cannot be stored in a snapshot')
+			index = strings[name] = len(strings)
+		return index
+
+	sections: Dict[str, array] = {name: array(typecode) for name, typecode in SECTIONS}
+
+	for material, container in vmo.materials_dispenser.materials_containers.items():
+		sections['containers_materials'].append(intern(material))
+		sections['containers_capacities'].append(container['capacity'])
+		sections['containers_volumes'].append(container['volume'])
+		sections['containers_integers'].append(
+			isinstance(container['capacity'], int) | isinstance(container['volume'], int) << 1
+		)
+
+	for drink, offer in vmo.drinks_menu.drinks_menu.items():
+		sections['drinks_names'].append(intern(drink))
+		sections['drinks_prices'].append(offer['price'])
+		sections['drinks_commands'].append(intern(offer['command']))
+		for material, volume in offer['bom'].items():
+			sections['bom_materials'].append(intern(material))
+			sections['bom_volumes'].append(volume)
+			sections['bom_integers'].append(isinstance(volume, int))
+		sections['drinks_bom_ends'].append(len(sections['bom_materials']))
+		sections['drinks_servings'].append(vmo.get_drink_servings(drink))
+
+	coins = vmo.accepted_coins
+	for coin, value in coins.accepted_coins.items():
+		sections['coins_names'].append(intern(coin))
+		sections['coins_values'].append(value)
+		sections['coins_counts'].append(coins.coins_inventory.get(coin, 0))
+
+	financials = vmo.financials
+	sections['ledger_names'].extend(intern(drink) for drink in financials.drinks_names)
+	sections['ledger_drinks_cents'] = financials.drinks_cents
+	sections['ledger_drinks_sales'] = financials.drinks_sales
+	sections['ledger_cycle'].extend((financials.cycle_start, financials.cycle_cents))
+	for name in ('times', 'drinks', 'cents', 'paid_cents', 'change_cents', 'cumulated_cents'):
+		sections['ledger_' + name] = getattr(financials, 'ledger_' + name)
+
+	sections['strings'].frombytes('\0'.join(strings).encode())
+
+	flags = FLAG_THREAD_SAFE if vmo.materials_dispenser.is_thread_safe() else 0
+	if vmo.drinks_menu.commands_trie is not None:
+		flags |= FLAG_COMMAND_TRIE
+	if isinstance(vmo.materials_dispenser, ArrayMaterialsContainersDispenser):
+		flags |= FLAG_COMPACT_CONTAINERS
+	if vmo.materials_dispenser.holds:
+		flags |= FLAG_SERVINGS_HELD
+	blobs = [sections[name].tobytes() for name, _ in SECTIONS]
+	return b''.join([
+		HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'big', flags, len(blobs)),
+		struct.pack(f'<{len(blobs)}Q', *map(len, blobs)),
+		*blobs
+	])
+
+
+def loads_snapshot(
+		buffer,
+		thread_safe: Union[bool, None] = None,
+		compact_containers: Union[bool, None] = None
+) -> VendingMachineOperations:
+	"""
+	=> Rebuilds a machine from a snapshot
+	:param buffer:  # bytes, bytearray, mmap or memoryview holding the snapshot
+	:param thread_safe:  # mode of the new machine, None for the mode of the saved machine
+	:param compact_containers:  # containers backend of the new machine, None for the saved one
+	:return: VendingMachineOperations with the saved state (listeners are not saved)
+	:raise ValueError: if buffer is not a snapshot of this version or is damaged
+	"""
+	try:
+		return decode_snapshot(buffer, thread_safe, compact_containers)
+	except (struct.error, IndexError, KeyError) as error:
+		# a damaged section references strings or sections entries that do not exist
+		raise ValueError(f'damaged vending machine snapshot ({error!r})') from error
+
+
+def decode_snapshot(
+		buffer, thread_safe: Union[bool, None], compact_containers: Union[bool, None]
+) -> VendingMachineOperations:
+	"""
+	Rebuilds the machine of loads_snapshot, the header and sections lengths are checked
+	"""
+	with memoryview(buffer) as view:
+		if len(view) < HEADER.size:
+			raise ValueError('not a vending machine snapshot')
+		magic, version, big_endian, flags, count = HEADER.unpack_from(view)
+		if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or count != len(SECTIONS):
+			raise ValueError('not a vending machine snapshot of version %d' % SNAPSHOT_VERSION)
+		if len(view) < HEADER.size + 8 * count:
+			raise ValueError('truncated vending machine snapshot')
+		lengths = struct.unpack_from(f'<{count}Q', view, HEADER.size)
+		position = HEADER.size + 8 * count
+		if position + sum(lengths) > len(view):
+			raise ValueError('truncated vending machine snapshot')
+		swap = big_endian != (sys.byteorder == 'big')
+		sections: Dict[str, array] = {}
+		for (name, typecode), length in zip(SECTIONS, lengths):
+			section = array(typecode)
+			section.frombytes(view[position:position + length])
+			if swap:
+				section.byteswap()
+			sections[name] = section
+			position += length
+
+	strings: List[str] = sections['strings'].tobytes().decode().split('\0')
+
+	if thread_safe is None:
+		thread_safe = bool(flags & FLAG_THREAD_SAFE)
+	if compact_containers is None:
+		compact_containers = bool(flags & FLAG_COMPACT_CONTAINERS)
+	vmo = VendingMachineOperations(thread_safe=thread_safe, compact_containers=compact_containers)
+	if flags & FLAG_COMMAND_TRIE:
+		vmo.drinks_menu.commands_trie = {'': []}
+
+	vmo.materials_dispenser.materials_containers = {
+		strings[material]: {
+			'capacity': int(capacity) if integers & 1 else capacity,
+			'volume': int(volume) if integers & 2 else volume
+		}
+		for material, capacity, volume, integers in zip(
+			sections['containers_materials'], sections['containers_capacities'],
+			sections['containers_volumes'], sections['containers_integers']
+		)
+	}
+
+	bom_materials = [strings[material] for material in sections['bom_materials']]
+	bom_volumes = [
+		int(volume) if integer else volume
+		for volume, integer in zip(sections['bom_volumes'], sections['bom_integers'])
+	]
+	drinks_menu = {}
+	bom_start = 0
+	for drink, price, command, bom_end in zip(
+		sections['drinks_names'], sections['drinks_prices'],
+		sections['drinks_commands'], sections['drinks_bom_ends']
+	):
+		drinks_menu[strings[drink]] = {
+			'price': price,
+			'bom': dict(zip(bom_materials[bom_start:bom_end], bom_volumes[bom_start:bom_end])),
+			'command': strings[command]
+		}
+		bom_start = bom_end
+	vmo.drinks_menu.drinks_menu = drinks_menu
+
+	coins = vmo.accepted_coins
+	coins_names = [strings[coin] for coin in sections['coins_names']]
+	coins.accepted_coins = dict(zip(coins_names, sections['coins_values']))
+	coins.coins_inventory = dict(zip(coins_names, sections['coins_counts']))
+
+	financials = vmo.financials
+	financials.drinks_names = [strings[drink] for drink in sections['ledger_names']] or ['']
+	financials.drinks_ids = {drink: index for index, drink in enumerate(financials.drinks_names)}
+	financials.drinks_cents = sections['ledger_drinks_cents'] or array('q', [0])
+	financials.drinks_sales = sections['ledger_drinks_sales'] or array('q', [0])
+	if sections['ledger_cycle']:
+		financials.cycle_start, financials.cycle_cents = sections['ledger_cycle']
+	financials.vending_machine_revenue = financials.cycle_cents / 100
+	for name in ('times', 'drinks', 'cents', 'paid_cents', 'change_cents', 'cumulated_cents'):
+		setattr(financials, 'ledger_' + name, sections['ledger_' + name])
+
+	# the servings index is saved with the containers it derives from: only the other indexes
+	# are rebuilt (VendingMachineOperations.rebuild_indexes would recompute it drink by drink)
+	vmo.materials_dispenser.rebuild_indexes()
+	vmo.drinks_menu.rebuild_indexes()
+	vmo.accepted_coins.rebuild_indexes()
+	if flags & FLAG_SERVINGS_HELD:
+		# the holds are not restored: the servings they kept from the other orders are back
+		vmo.rebuild_servings_index()
+	else:
+		vmo.drinks_servings = dict(zip(drinks_menu, sections['drinks_servings']))
+	return vmo
+
+
+def save_snapshot(vmo: VendingMachineOperations, path: str) -> int:
+	"""
+	=> Writes the snapshot of a machine, the file is replaced atomically
+	:param vmo:
+	:param path:
+	:return: size of the snapshot in bytes
+	"""
+	snapshot = dumps_snapshot(vmo)
+	# a temporary file of its own: processes saving the same path never write into each other's file
+	stream = tempfile.NamedTemporaryFile(
+		dir=os.path.dirname(path) or '.', prefix=f'{os.path.basename(path)}.', suffix='.tmp', delete=False
+	)
+	try:
+		with stream:
+			stream.write(snapshot)
+		os.replace(stream.name, path)
+	except BaseException:
+		os.remove(stream.name)
+		raise
+	return len(snapshot)
+
+
+def load_snapshot(
+		path: str,
+		thread_safe: Union[bool, None] = None,
+		compact_containers: Union[bool, None] = None
+) -> VendingMachineOperations:
+	"""
+	=> Memory-maps a snapshot file and rebuilds its machine
+	:param path:
+	:param thread_safe:  # see loads_snapshot
+	:param compact_containers:  # see loads_snapshot
+	:return: VendingMachineOperations with the saved state
+	"""
+	with open(path, 'rb') as stream:
+		if os.fstat(stream.fileno()).st_size == 0:
+			raise ValueError('not a vending machine snapshot')
+		with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+			return loads_snapshot(mapped, thread_safe, compact_containers)
@@ -0,0 +1,320 @@
+"""
+Vending Machine Tracing
+=> Opt-in per-order trace spans written in the Chrome / Perfetto trace format (JSON array of
+complete events, open the file in chrome://tracing or ui.perfetto.dev): the order is the root
+span, the menu display, the selection, the availability check, the checkout, make_drink with one
+child span per material taken out and the revenue booking are nested in it
+
+Like vending_machine_metrics, enable_tracing() installs wrappers on the classes and
+disable_tracing() puts the original methods back: nothing is paid while tracing is off. When on,
+the sampling decision is taken once per root span (a traced call made outside any other traced
+call of the same thread): an order not sampled only pays a thread-local depth counter
+
+Each thread appends the spans of its sampled orders to its own buffer (no lock on the order
+path) and writes them to the trace file in bulk, under the file lock, once flush_size spans are
+waiting at the end of an order - close() flushes the buffers of every thread
+
+It consists of the following elements:
+
+### class OrderTracer:
+	## attributes:
+		path: trace file, sample_rate: share of the root spans traced, flush_size: spans per write
+		spans_written: spans written to the file so far
+	## methods:
+		def span(self, name, **arguments):   # context manager, e.g. around a whole interactive order
+		def flush(self):   # writes the spans buffered by the calling thread
+		def close(self):   # writes every buffer and ends the JSON array
+
+### def enable_tracing(path, sample_rate, flush_size): / def disable_tracing(): / def is_tracing_enabled():
+	=> installs / removes the wrappers of TRACED_METHODS - when tracing and metrics are both on,
+	disable them in the reverse order they were enabled
+
+### TRACED_METHODS:
+	{class: {method name: (span name or callable(arguments) -> span name, callable(arguments, result) -> span args)}}
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from vending_machine_simulator import (
+	ArrayMaterialsContainersDispenser, DrinksMenu, MaterialsContainersDispenser, VendingMachineFinancials,
+	VendingMachineOperations
+)
+
+TRACE_CATEGORY = 'vms'
+TRACE_FLUSH_SIZE = 1_000
+
+
+def no_arguments(arguments: tuple, result) -> Dict[str, Any]:
+	return {}
+
+
+TAKEOUT_SPANS = {
+	'takeout_materials': ('takeout_materials', lambda arguments, result: {'committed': result}),
+	'takeout_material_container': (
+		lambda arguments: f'takeout {arguments[1]}',
+		lambda arguments, result: {'volume': arguments[2], 'committed': result}
+	),
+}
+
+TRACED_METHODS: Dict[type, Dict[str, Tuple[Union[str, Callable[[tuple], str]], Callable[[tuple, Any], dict]]]] = {
+	VendingMachineOperations: {
+		'process_order': ('order', lambda arguments, result: {'drink': arguments[1], 'outcome': result[0]}),
+		'ask_user_drink': ('menu_selection', lambda arguments, result: {'drink': result}),
+		'render_menu': ('menu_display', no_arguments),
+		'check_drink_availability': (
+			'check_drink_availability', lambda arguments, result: {'drink': arguments[1], 'available': result}
+		),
+		'reserve_drink': ('reservation', lambda arguments, result: {'drink': arguments[1], 'hold': result}),
+		'checkout_payment': ('checkout', lambda arguments, result: {'drink': arguments[1], 'outcome': result[0]}),
+		'drink_checkout': ('checkout', lambda arguments, result: {'drink': arguments[1], 'paid': result}),
+		'make_drink': ('make_drink', lambda arguments, result: {'drink': arguments[1], 'made': result}),
+		'make_drinks': ('make_drinks', lambda arguments, result: {'orders': len(arguments[1])}),
+	},
+	MaterialsContainersDispenser: {
+		**TAKEOUT_SPANS,
+		'commit_hold': ('commit_hold', lambda arguments, result: {'hold': arguments[1], 'committed': result}),
+		# takeout_materials commits the whole bom then notifies each material: one child span per
+		# material covering the listeners (servings index, journal...) it triggers
+		'notify_containers_listeners': (
+			lambda arguments: f'{arguments[1]} {arguments[2]}', lambda arguments, result: {'amount': arguments[3]}
+		),
+	},
+	ArrayMaterialsContainersDispenser: TAKEOUT_SPANS,
+	DrinksMenu: {
+		'get_drink_by_command': ('selection', lambda arguments, result: {'command': arguments[1], 'drink': result}),
+	},
+	VendingMachineFinancials: {
+		'add_revenue': ('revenue_booking', lambda arguments, result: {'amount': arguments[1]}),
+	},
+}
+
+
+class OrderTracer:
+	"""
+	=> Sampled trace spans buffered per thread and written in bulk to a Chrome trace file
+	"""
+
+	def __init__(self, path: str, sample_rate: float = 0.01, flush_size: int = TRACE_FLUSH_SIZE) -> None:
+		"""
+		:param path:  # trace file, replaced
+		:param sample_rate:  # share of the orders (root spans) traced, 1 for all of them
+		:param flush_size:  # spans buffered by a thread before they are written
+		"""
+		self.path = path
+		self.sample_rate = sample_rate
+		self.flush_size = flush_size
+		self.origin_ns = time.perf_counter_ns()
+		self.pid = os.getpid()
+		self.local = threading.local()
+		# (tid, thread name, spans buffer) of every thread that traced a span, see close
+		self.buffers: List[Tuple[int, str, list]] = []
+		self.buffers_lock = threading.Lock()
+		self.stream = open(path, 'w', encoding='utf-8')
+		self.stream.write('[\n')
+		self.stream_lock = threading.Lock()
+		self.spans_written = 0
+		self.closed = False
+
+	def thread_buffer(self) -> list:
+		"""
+		Registers the buffer of the calling thread on its first span
+		"""
+		local = self.local
+		local.depth = 0
+		local.sampled = False
+		local.spans = []
+		thread = threading.current_thread()
+		local.tid = thread.ident
+		with self.buffers_lock:
+			self.buffers.append((thread.ident, thread.name, local.spans))
+		return local.spans
+
+	def trace(
+			self,
+			method: Callable,
+			span_name: Union[str, Callable[[tuple], str]],
+			span_arguments: Callable[[tuple, Any], dict]
+	) -> Callable:
+		"""
+		Wraps a method: a span is buffered for each call made inside a sampled order
+		"""
+		local = self.local
+		perf_counter_ns = time.perf_counter_ns
+		sample = random.random
+
+		@functools.wraps(method)
+		def traced(*arguments, **keywords):
+			depth = getattr(local, 'depth', None)
+			if depth is None:
+				self.thread_buffer()
+				depth = 0
+			if depth == 0:
+				local.sampled = sample() < self.sample_rate
+			if not local.sampled:
+				local.depth = depth + 1
+				try:
+					return method(*arguments, **keywords)
+				finally:
+					local.depth = depth
+			local.depth = depth + 1
+			start = perf_counter_ns()
+			try:
+				result = method(*arguments, **keywords)
+			except BaseException as error:
+				local.spans.append((span_name, arguments, start, perf_counter_ns(), {'error': type(error).__name__}))
+				raise
+			finally:
+				local.depth = depth
+			local.spans.append((span_name, arguments, start, perf_counter_ns(), (span_arguments, result)))
+			if depth == 0 and len(local.spans) >= self.flush_size:
+				self.flush()
+			return result
+
+		return traced
+
+	@contextmanager
+	def span(self, name: str, **arguments):
+		"""
+		=> Context manager tracing a span of the application, e.g. a whole interactive order around
+		ask_user_drink and drink_checkout so that they are sampled together
+		:param name:  # span name
+		:param arguments:  # span args (JSON values)
+		"""
+		local = self.local
+		if getattr(local, 'depth', None) is None:
+			self.thread_buffer()
+		depth = local.depth
+		if depth == 0:
+			local.sampled = random.random() < self.sample_rate
+		local.depth = depth + 1
+		start = time.perf_counter_ns()
+		try:
+			yield
+		finally:
+			local.depth = depth
+			if local.sampled:
+				local.spans.append((name, (), start, time.perf_counter_ns(), arguments))
+		if depth == 0 and len(local.spans) >= self.flush_size:
+			self.flush()
+
+	def format_span(self, tid: int, span: tuple) -> str:
+		"""
+		Chrome trace complete event ('X') of a buffered span, times in microseconds
+		"""
+		span_name, arguments, start, end, span_arguments = span
+		if not isinstance(span_arguments, dict):
+			build_arguments, result = span_arguments
+			span_arguments = build_arguments(arguments, result)
+		return json.dumps({
+			'name': span_name if isinstance(span_name, str) else span_name(arguments),
+			'cat': TRACE_CATEGORY,
+			'ph': 'X',
+			'ts': (start - self.origin_ns) / 1000,
+			'dur': (end - start) / 1000,
+			'pid': self.pid,
+			'tid': tid,
+			'args': span_arguments,
+		}, default=str)
+
+	def write_spans(self, tid: int, spans: list):
+		"""
+		Formats and writes the spans of a buffer taken by its owner thread (or by close)
+		"""
+		count = len(spans)
+		if count == 0:
+			return
+		# only the first count spans are taken: the owner thread may append meanwhile
+		batch = spans[:count]
+		del spans[:count]
+		text = ',\n'.join(self.format_span(tid, span) for span in batch)
+		with self.stream_lock:
+			if self.closed:
+				return
+			if self.spans_written:
+				self.stream.write(',\n')
+			self.stream.write(text)
+			self.spans_written += count
+
+	def flush(self):
+		"""
+		=> Writes the spans buffered by the calling thread
+		"""
+		spans = getattr(self.local, 'spans', None)
+		if spans:
+			self.write_spans(self.local.tid, spans)
+
+	def close(self):
+		"""
+		=> Writes the spans buffered by every thread, the thread names, and closes the JSON array
+		"""
+		with self.buffers_lock:
+			buffers = list(self.buffers)
+		for tid, _, spans in buffers:
+			self.write_spans(tid, spans)
+		with self.stream_lock:
+			if self.closed:
+				return
+			for tid, thread_name, _ in buffers:
+				if self.spans_written:
+					self.stream.write(',\n')
+				self.stream.write(json.dumps({
+					'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': thread_name}
+				}))
+				self.spans_written += 1
+			self.stream.write('\n]\n')
+			self.stream.close()
+			self.closed = True
+
+
+# tracer of the wrappers installed and the original functions they replaced
+enabled_tracer: Union[OrderTracer, None] = None
+original_methods: List[Tuple[type, str, Callable]] = []
+
+
+def enable_tracing(path: str, sample_rate: float = 0.01, flush_size: int = TRACE_FLUSH_SIZE) -> OrderTracer:
+	"""
+	=> Installs the wrappers of TRACED_METHODS, does nothing if tracing is already on
+	:param path:  # Chrome trace file, replaced
+	:param sample_rate:  # share of the orders traced, 1 for all of them
+	:param flush_size:  # spans buffered by a thread before they are written
+	:return: the tracer the wrappers record in
+	"""
+	global enabled_tracer
+	if enabled_tracer is not None:
+		return enabled_tracer
+	enabled_tracer = OrderTracer(path, sample_rate, flush_size)
+	for cls, methods in TRACED_METHODS.items():
+		for name, (span_name, span_arguments) in methods.items():
+			method = cls.__dict__.get(name)
+			if method is None:  # inherited: traced on the class defining it
+				continue
+			original_methods.append((cls, name, method))
+			setattr(cls, name, enabled_tracer.trace(method, span_name, span_arguments))
+	return enabled_tracer
+
+
+def disable_tracing() -> Union[OrderTracer, None]:
+	"""
+	=> Puts the original methods back and closes the trace file
+	:return: the closed tracer (None if tracing was off)
+	"""
+	global enabled_tracer
+	tracer = enabled_tracer
+	while original_methods:
+		cls, name, method = original_methods.pop()
+		setattr(cls, name, method)
+	enabled_tracer = None
+	if tracer is not None:
+		tracer.close()
+	return tracer
+
+
+def is_tracing_enabled() -> bool:
+	return enabled_tracer is not None